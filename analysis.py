@@ -2,24 +2,62 @@
 股票指标 & 背离算法 - 优化版
 专注于近期150个交易日的背离检测
 """
-import akshare as ak
+import re
+
 import pandas as pd
 import numpy as np
-import ta
+from numpy.lib.stride_tricks import sliding_window_view
+from tracing import cache_event, traced
 from datetime import datetime, timedelta
 
 
+# 前缀 / 后缀 / 中文交易所名 → sh / sz / bj
+MARKET_ALIASES = {
+    "sh": "sh", "ss": "sh", "sz": "sz", "bj": "bj", "bse": "bj",
+    "沪": "sh", "上海": "sh", "上交所": "sh", "深": "sz", "深圳": "sz", "深交所": "sz",
+    "京": "bj", "北京": "bj", "北交所": "bj",
+}
+_SYMBOL_RE = re.compile(r"^([a-z]+|[\u4e00-\u9fff]+)?[\s.:_-]*(\d{6})(?:\.([a-z]+))?$")
+
+
+def market_of(code: str) -> str:
+    """6 位纯代码 → 交易所；认不出（基金、债券等）返回空串"""
+    if code.startswith(("92", "4", "8")):           # 北交所：43/83/87 老代码，920 新代码
+        return "bj"
+    if code.startswith(("6", "9")):                 # 60x 主板、688/689 科创板、900 沪市B股
+        return "sh"
+    if code.startswith(("0", "2", "3")):            # 00x 主板、300/301 创业板、200 深市B股
+        return "sz"
+    return ""
+
+
 def normalize_symbol(code: str) -> str:
-    code = code.strip()
-    if code.startswith("6"):
-        return "sh" + code
-    elif code.startswith(("0", "3")):
-        return "sz" + code
-    else:
+    """
+    600519 / SH600519 / 600519.SH / 北交所830799 → sh600519 / bj830799
+    没写交易所的按代码段判断；认不出的原样返回
+    """
+    code = str(code).strip()
+    if len(code) == 6 and code.isdigit():
+        market = market_of(code)
+        return market + code if market else code
+    m = _SYMBOL_RE.match(code.lower())
+    if not m:
         return code
+    pre, digits, suf = m.groups()
+    market = MARKET_ALIASES.get(pre or suf) if pre or suf else market_of(digits)
+    return market + digits if market else code
 
 
-def compute_enhanced_indicators(df: pd.DataFrame) -> pd.DataFrame:
+@traced()
+def compute_enhanced_indicators(df: pd.DataFrame, backend: str = "ta") -> pd.DataFrame:
+    """
+    backend="ta"：逐个指标调用 ta 库（默认）
+    backend="fast"：单遍融合内核，批量扫描用，结果在浮点误差内一致
+    """
+    if backend == "fast":
+        from indicator_fast import compute_indicators_fast
+        return compute_indicators_fast(df)
+    import ta                                            # akshare / ta 导入很慢，用到时才加载
     df = df.sort_index()
     # MACD
     df["macd_dif"]   = ta.trend.macd_diff(df["close"])
@@ -43,50 +81,97 @@ def compute_enhanced_indicators(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def find_recent_lows(df, lookback_days=150, min_days_between_lows=10):
+NS_PER_DAY = 86_400_000_000_000
+
+
+def local_low_positions(prices: np.ndarray, window: int = 5) -> np.ndarray:
+    """
+    局部低点位置：prices[i] 不高于左右各 window 根K线的最小值
+    滑动窗口最小值一次算好，左窗口取 mins[i-window]，右窗口取 mins[i+1]
+    """
+    prices = np.asarray(prices, dtype=float)
+    n = len(prices)
+    if window < 1 or n < 2 * window + 1:
+        return np.empty(0, dtype=np.int64)
+    mins = sliding_window_view(prices, window).min(axis=1)     # mins[k] = min(prices[k:k+window])
+    idx = np.arange(window, n - window)
+    cur = prices[idx]
+    hit = (cur <= mins[idx - window]) & (cur <= mins[idx + 1])
+    return idx[hit]
+
+
+def space_positions(positions: np.ndarray, day_ns: np.ndarray, min_days: int) -> np.ndarray:
+    """
+    按时间间隔贪心过滤：保留第一个，之后只保留距上一个保留点 >= min_days 天的
+    day_ns 为 int64 纳秒时间戳；日期有序时用二分跳跃，否则逐个比较
+    """
+    if len(positions) < 2:
+        return positions
+    t = day_ns[positions]
+    if np.all(np.diff(t) >= 0) and min_days > 0:
+        step = int(np.ceil(min_days)) * NS_PER_DAY
+        kept, k = [0], 0
+        while True:
+            k = int(np.searchsorted(t, t[k] + step, side="left"))
+            if k >= len(t):
+                break
+            kept.append(k)
+        return positions[kept]
+    kept = [0]
+    for k in range(1, len(t)):
+        if (int(t[k]) - int(t[kept[-1]])) // NS_PER_DAY >= min_days:
+            kept.append(k)
+    return positions[kept]
+
+
+@traced()
+def find_recent_lows(df, lookback_days=150, min_days_between_lows=10, window=5):
     """
     在最近指定天数内寻找局部低点
-    优化：专注于近期数据，避免找到太早的背离
+    优化：专注于近期数据，避免找到太早的背离；lookback_days=None 时用全部历史
     """
     # 确保数据按日期排序
-    df = df.sort_index().tail(lookback_days)
+    df = df.sort_index()
+    if lookback_days:
+        df = df.tail(lookback_days)
     
     # 重置索引以便按位置访问
     df_reset = df.reset_index()
-    dates = pd.to_datetime(df_reset["date"]) if "date" in df_reset.columns else pd.to_datetime(df_reset.index)
-    prices = df_reset["close"].values
+    dates = df_reset["date"] if "date" in df_reset.columns else df_reset.index.to_series()
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates)                    # 已是日期类型时跳过，避免逐个元素检查
+    prices = df_reset["close"].to_numpy(dtype=float)
     
-    # 寻找局部低点
-    lows = []
-    window = 5  # 局部低点检测窗口
+    # 寻找局部低点（window 为局部低点检测窗口），再检查时间间隔
+    lows = local_low_positions(prices, window)
+    day_ns = dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    lows = space_positions(lows, day_ns, min_days_between_lows)
     
-    for i in range(window, len(prices) - window):
-        # 检查是否是局部低点
-        left_min = min(prices[i-window:i])
-        right_min = min(prices[i+1:i+window+1])
-        
-        if prices[i] <= left_min and prices[i] <= right_min:
-            # 检查时间间隔
-            if lows:
-                days_diff = (dates.iloc[i] - dates.iloc[lows[-1]]).days
-                if days_diff >= min_days_between_lows:
-                    lows.append(i)
-            else:
-                lows.append(i)
-    
-    return lows, df_reset, dates
+    return lows.tolist(), df_reset, dates
 
 
-def comprehensive_divergence_analysis(df: pd.DataFrame):
+@traced()
+def comprehensive_divergence_analysis(df: pd.DataFrame, lookback: int = None, min_days_between_lows: int = None,
+                                      window: int = None, params: dict = None):
     """
     专注于近期150个交易日的背离分析
+    周线 / 月线复用同一套规则，只需换成按K线根数计的 lookback 和对应的低点间隔、窗口
+    阈值、权重、级别取 params（缺省为 backtest.DEFAULT_PARAMS，即 divergence.BOTTOM_RULE），
+    参数扫描选出的一组可以直接传进来，页面和回测用的是同一套判定
     """
+    from backtest import DEFAULT_PARAMS
+    p = {**DEFAULT_PARAMS, **(params or {})}
+    lookback = p["lookback"] if lookback is None else lookback
+    min_days_between_lows = p["min_days"] if min_days_between_lows is None else min_days_between_lows
+    window = p["window"] if window is None else window
     # 收集计算过程信息
     calculation_steps = []
-    calculation_steps.append(f"🔍 在最近150个交易日内寻找背离信号")
+    calculation_steps.append(f"🔍 在最近{lookback}个交易日内寻找背离信号" if lookback == 150
+                             else f"🔍 在最近{lookback}根K线内寻找背离信号")
     
     # 寻找近期低点
-    low_indices, df_reset, dates = find_recent_lows(df, lookback_days=150, min_days_between_lows=10)
+    low_indices, df_reset, dates = find_recent_lows(df, lookback_days=lookback,
+                                                    min_days_between_lows=min_days_between_lows, window=window)
     
     if len(low_indices) < 2:
         calculation_steps.append(f"❌ 未找到足够的近期局部低点 (找到{len(low_indices)}个)")
@@ -123,59 +208,54 @@ def comprehensive_divergence_analysis(df: pd.DataFrame):
     
     # 1. MACD柱状线背离
     if macd_vals[idx2] > macd_vals[idx1]:
-        signals.append("MACD柱状线背离"); conf.append(0.3); macd_cnt += 1
+        signals.append("MACD柱状线背离"); conf.append(p["w_macd"]); macd_cnt += 1
         calculation_steps.append(f"   ✅ MACD柱状线: {macd_vals[idx2]:.4f} > {macd_vals[idx1]:.4f}")
     else:
         calculation_steps.append(f"   ❌ MACD柱状线: {macd_vals[idx2]:.4f} <= {macd_vals[idx1]:.4f}")
         
     # 2. DIF线背离  
     if dif_vals[idx2] > dif_vals[idx1]:
-        signals.append("DIF线背离");     conf.append(0.3); macd_cnt += 1
+        signals.append("DIF线背离");     conf.append(p["w_dif"]); macd_cnt += 1
         calculation_steps.append(f"   ✅ DIF线: {dif_vals[idx2]:.4f} > {dif_vals[idx1]:.4f}")
     else:
         calculation_steps.append(f"   ❌ DIF线: {dif_vals[idx2]:.4f} <= {dif_vals[idx1]:.4f}")
         
     # 3. RSI背离
     if rsi_vals[idx2] > rsi_vals[idx1]:
-        signals.append("RSI背离");       conf.append(0.2)
+        signals.append("RSI背离");       conf.append(p["w_rsi"])
         calculation_steps.append(f"   ✅ RSI: {rsi_vals[idx2]:.1f} > {rsi_vals[idx1]:.1f}")
     else:
         calculation_steps.append(f"   ❌ RSI: {rsi_vals[idx2]:.1f} <= {rsi_vals[idx1]:.1f}")
         
     # 4. 成交量确认
     vol_ratio = volume_vals[idx2] / volume_vals[idx1] if volume_vals[idx1] > 0 else 1
-    if vol_ratio < 1.5:
-        signals.append("成交量配合");    conf.append(0.1)
-        calculation_steps.append(f"   ✅ 成交量: 比率{vol_ratio:.2f} < 1.5")
+    if vol_ratio < p["vol_ratio"]:
+        signals.append("成交量配合");    conf.append(p["w_volume"])
+        calculation_steps.append(f"   ✅ 成交量: 比率{vol_ratio:.2f} < {p['vol_ratio']:g}")
     else:
-        calculation_steps.append(f"   ❌ 成交量: 比率{vol_ratio:.2f} >= 1.5")
+        calculation_steps.append(f"   ❌ 成交量: 比率{vol_ratio:.2f} >= {p['vol_ratio']:g}")
         
     # 5. 有效跌幅确认
     price_drop = (price_lows[idx1] - price_lows[idx2]) / price_lows[idx1]
-    if price_drop > 0.03:  # 调整为3%的跌幅要求，更适合近期分析
-        signals.append("价格有效新低");  conf.append(0.1)
-        calculation_steps.append(f"   ✅ 价格跌幅: {price_drop:.2%} > 3%")
+    if price_drop > p["price_drop"]:  # 默认3%的跌幅要求，更适合近期分析
+        signals.append("价格有效新低");  conf.append(p["w_drop"])
+        calculation_steps.append(f"   ✅ 价格跌幅: {price_drop:.2%} > {p['price_drop']:.0%}")
     else:
-        calculation_steps.append(f"   ❌ 价格跌幅: {price_drop:.2%} <= 3%")
+        calculation_steps.append(f"   ❌ 价格跌幅: {price_drop:.2%} <= {p['price_drop']:.0%}")
 
     calculation_steps.append(f"\n📈 信号统计: 共{len(signals)}个信号, MACD相关信号{macd_cnt}个")
     calculation_steps.append(f"   具体信号: {', '.join(signals)}")
 
     # 检查是否满足最低信号要求
-    if len(signals) < 2:
-        calculation_steps.append(f"❌ 信号不足: 需要至少2个信号, 当前只有{len(signals)}个")
+    if len(signals) < p["min_signals"]:
+        calculation_steps.append(f"❌ 信号不足: 需要至少{p['min_signals']}个信号, 当前只有{len(signals)}个")
         return None, "\n".join(calculation_steps)
 
-    # 分级判定
-    if macd_cnt == 2:
-        level, confidence = "强烈背离", min(sum(conf), 0.95)
-        calculation_steps.append(f"🎯 级别判定: {level} (MACD双信号确认)")
-    elif macd_cnt == 1:
-        level, confidence = "小背离",   min(sum(conf) * 0.8, 0.8)  # 提高小背离的置信度
-        calculation_steps.append(f"🎯 级别判定: {level} (MACD单信号)")
-    else:
-        level, confidence = "普通背离", min(sum(conf) * 0.6, 0.7)  # 降低无MACD信号的置信度
-        calculation_steps.append(f"🎯 级别判定: {level} (无MACD信号)")
+    # 分级判定：自上而下取第一个 MACD 信号数达标的级别，置信度按该级别缩放、封顶
+    level, scale, cap = next((name, scale, cap) for name, min_core, scale, cap in p["levels"] if macd_cnt >= min_core)
+    confidence = min(sum(conf) * scale, cap)
+    reason = {2: "MACD双信号确认", 1: "MACD单信号"}.get(macd_cnt, "无MACD信号")
+    calculation_steps.append(f"🎯 级别判定: {level} ({reason})")
 
     calculation_steps.append(f"📊 最终置信度: {confidence:.1%}")
 
@@ -209,14 +289,22 @@ def analyze_trend(df: pd.DataFrame) -> str:
         return "数据不足"
     recent = df.tail(20)
     cur = recent.iloc[-1]
-    score = (cur["close"] > cur["ma5"]) + (cur["close"] > cur["ma10"]) + (cur["close"] > cur["ma20"])
+    # numpy 布尔相加是逻辑或，先转 int 再计数
+    score = int(cur["close"] > cur["ma5"]) + int(cur["close"] > cur["ma10"]) + int(cur["close"] > cur["ma20"])
     return "短期上升趋势" if score >= 2 else "震荡趋势" if score == 1 else "下跌趋势"
 
 
+@traced()
 def get_stock_name(code: str) -> str:
     """输入 000001/sz000001 返回股票简称，失败返回原代码"""
+    from symbols import get_directory
+    name = get_directory().name(code)
+    cache_event("symbols.name", hit=bool(name))                # 未命中才会走远程兜底
+    if name:
+        return name
     try:
-        return ak.stock_individual_info_em(symbol=code).loc[1, "value"]
+        from fetcher import fetch_one
+        return fetch_one("stock_individual_info_em", symbol=code).loc[1, "value"]
     except Exception:
         return code
 
@@ -1,16 +1,138 @@
 """
 Streamlit 前端 - 增加背离可视化图表
 """
+import os
+
 import streamlit as st
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import pandas as pd
-from analysis import *
-from storage import *
+# 只导入首屏用得到的名字；akshare / ta / plotly 都推迟到真正取数、计算、画图时再加载
+from analysis import (analyze_trend, compute_enhanced_indicators, comprehensive_divergence_analysis,
+                      generate_trading_advice, get_stock_name, normalize_symbol)
+from storage import EXPORT_FORMATS, add_stock, del_stock, export_stocks, import_stocks, load_self, parse_codes
+import tracing
+from bar_cache import get_cache
+from scheduler import META_FILE, freshness, is_stale, load_signals
+from monitor import ALERTS_FILE, read_alerts
+from shared_frames import get_reader
+from signal_store import LEVELS, get_store as get_signal_store
 
 st.set_page_config(page_title="股票底背离检测", layout="centered")
 st.title("📈 股票技术分析 · 底背离检测")
 
+# 侧栏开关（进程级）打开后，各阶段都记耗时和缓存命中，页面底部的诊断面板展示本次运行的记录
+trace_on = st.sidebar.toggle("🩺 性能追踪", value=tracing.enabled(), key="trace_on")
+if trace_on and not tracing.enabled():
+    tracing.enable(tracing.JSONL_PATH)
+elif not trace_on and tracing.enabled():
+    tracing.disable()
+trace_records = tracing.start_collecting()
+
+
+# ---------------- 分阶段缓存 ----------------
+# 每个阶段按 (代码, 复权方式, 最后一根K线日期, 参数) 缓存，TTL + 条目上限淘汰；
+# 点增删按钮等无关操作引起的 rerun 不再重复联网和计算。下划线开头的参数不参与缓存键
+CACHE_TTL = 10 * 60
+CACHE_MAX_ENTRIES = 64
+LOOKBACK = 150
+CHART_RANGES = {"近150日": LOOKBACK, "1年": 250, "3年": 750, "10年": 2500}   # 图表区间 -> K线根数
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def fetch_stage(symbol, adjust="qfq", n=LOOKBACK, refresh=True):
+    """取数：走本地K线缓存，返回最近 n 根；盘后任务已补齐过的股票 refresh=False，只读本地不联网"""
+    tracing.mark_miss()
+    return get_cache().get(symbol, n=n, adjust=adjust, refresh=refresh)
+
+
+@st.cache_data(show_spinner=False)
+def signals_stage(meta_mtime):
+    """盘后任务写的信号表，按元数据文件的修改时间缓存，任务跑完自动换新"""
+    return load_signals()
+
+
+def _meta_mtime():
+    try:
+        return os.path.getmtime(META_FILE)
+    except OSError:
+        return None
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def indicator_stage(symbol, adjust, last_date, n, _bars):
+    tracing.mark_miss()
+    return compute_enhanced_indicators(_bars)
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def divergence_stage(symbol, adjust, last_date, n, _df):
+    """返回 (背离结果, 失败说明, 操作建议, 趋势)；纯计算，同一根K线只算一次"""
+    tracing.mark_miss()
+    div, error_msg = comprehensive_divergence_analysis(_df)
+    return div, error_msg, generate_trading_advice(div, _df), analyze_trend(_df)
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def history_stage(symbol, adjust, last_date, n):
+    """图表用的长历史：只读本地K线缓存（最近一段刚由 fetch_stage 补齐过），指标走 numpy 后端"""
+    tracing.mark_miss()
+    bars = get_cache().get(symbol, n=n, adjust=adjust, refresh=False)
+    return compute_enhanced_indicators(bars, backend="fast")
+
+
+def figure_stage(symbol, last_date, stock_name, df, div):
+    """
+    图按 (代码, 最后一根K线, 区间) 在 charts 里进程内记忆，返回同一个 Figure，
+    不经 st.cache_data，免得每次命中都把整张图 pickle 一遍
+    """
+    from charts import cached_figure
+    return cached_figure(symbol, last_date, df, div, stock_name)
+
+
+# ---------------- 盘后信号 ----------------
+signals, signals_meta = signals_stage(_meta_mtime())
+signals_fresh = not is_stale(signals_meta)
+with st.expander("🌙 盘后预计算信号", expanded=False):
+    (st.caption if signals_fresh else st.warning)(freshness(signals_meta))
+    if not signals.empty:
+        hits = signals[signals["level"].notna()]
+        if hits.empty:
+            st.write("本次没有检测到背离")
+        else:
+            st.dataframe(hits[["symbol", "name", "level", "confidence", "trend", "advice", "last_date"]],
+                         hide_index=True, use_container_width=True)
+
+# ---------------- 盘中告警 ----------------
+# python monitor.py 常驻轮询，告警追加到 data/alerts.jsonl；这里只读文件，局部定时刷新，不重跑整页
+ALERT_REFRESH = 10
+
+
+@st.fragment(run_every=ALERT_REFRESH)
+def alerts_panel():
+    alerts = read_alerts(ALERTS_FILE, n=50)
+    if alerts.empty:
+        st.caption("暂无告警；盘中运行 python monitor.py 开始监控")
+        return
+    today = alerts[alerts["time"].str[:10] == pd.Timestamp.now().strftime("%Y-%m-%d")]
+    st.caption(f"今日 {len(today)} 条，每 {ALERT_REFRESH} 秒刷新")
+    st.dataframe(alerts[["time", "symbol", "rule", "price", "message"]], hide_index=True, use_container_width=True)
+
+
+with st.expander("🔔 盘中告警", expanded=False):
+    alerts_panel()
+
+# ---------------- 信号历史 ----------------
+# 盘后扫描和单股分析的每次检出都在 data/signals.db 里，按级别 + 检出日走索引查询
+with st.expander("📜 信号历史", expanded=False):
+    col_l, col_d = st.columns([3, 1])
+    hist_levels = col_l.multiselect("级别", list(LEVELS), default=["强烈背离"], key="hist_levels")
+    hist_days = col_d.number_input("最近天数", min_value=1, max_value=3650, value=30, key="hist_days")
+    hist = get_signal_store().recent(hist_levels or list(LEVELS), int(hist_days), limit=500)
+    if hist.empty:
+        st.caption("该区间内没有记录")
+    else:
+        st.dataframe(hist[["symbol", "detected", "level", "confidence", "date1", "date2", "price1", "price2",
+                           "signals", "hits"]], hide_index=True, use_container_width=True)
+
 # ---------------- 自选股管理 ----------------
 st.markdown("---")
 st.header("📁 自选股管理")
@@ -29,6 +151,21 @@ with st.expander("增删改自选股", expanded=True):
                     st.warning(f"{new_code} 已存在")
             else:
                 st.error("代码必须是 6 位数字")
+    batch_text = st.text_area("批量导入：粘贴代码或简称（空格、逗号、换行分隔），或上传 CSV / TXT / JSON",
+                              key="batch_codes")
+    batch_file = st.file_uploader("上传文件", type=["csv", "txt", "json"], key="batch_file",
+                                  label_visibility="collapsed")
+    col_i, *col_e = st.columns(1 + len(EXPORT_FORMATS))
+    if col_i.button("批量导入"):
+        text = batch_file.getvalue().decode("utf-8-sig", errors="ignore") if batch_file else ""
+        result = import_stocks(parse_codes(text) + parse_codes(batch_text))
+        st.success(f"新增 {len(result['added'])} 只，已存在 {len(result['existing'])} 只")
+        if result["invalid"]:
+            st.warning("无法识别：" + " ".join(result["invalid"][:50]))
+    for col, fmt in zip(col_e, EXPORT_FORMATS):
+        col.download_button(f"导出 {fmt.upper()}",
+                            export_stocks(fmt=fmt).encode("utf-8-sig" if fmt == "csv" else "utf-8"),
+                            file_name=f"self_selection.{fmt}", key=f"export_{fmt}")
 
 # 展示列表 & 删除按钮
 self_list = load_self()
@@ -62,18 +199,29 @@ if "analyze_code" in st.session_state:
     code = st.session_state["analyze_code"]
     symbol = normalize_symbol(code)
     # ===== 这里放标题，保证 symbol 已就绪 =====
-    st.header(f"🔍 单股分析 —— {get_stock_name(symbol)}")
+    stock_name = get_stock_name(symbol)
+    st.header(f"🔍 单股分析 —— {stock_name}")
     with st.spinner("正在获取数据并计算指标..."):
         try:
-            df = ak.stock_zh_a_daily(symbol=symbol, adjust="qfq").tail(150)
-            if df.empty:
+            prefetched = signals_fresh and symbol in set(signals["symbol"])
+            with tracing.cached_span("stage.fetch", symbol=symbol):
+                bars = fetch_stage(symbol, "qfq", LOOKBACK, refresh=not prefetched)
+            if bars.empty:
                 st.error("未获取到数据，请检查代码是否正确")
                 st.stop()
-            df = compute_enhanced_indicators(df)
-            # 修改这里：接收两个返回值
-            div, error_msg = comprehensive_divergence_analysis(df)
-            advice = generate_trading_advice(div, df)
-            trend = analyze_trend(df)
+            last_date = str(bars["date"].iloc[-1])
+            # 盘后任务把同一根K线的指标表留在了共享内存里，零拷贝拿来用，不再重算
+            df = get_reader().frame(symbol, last_date) if prefetched else None
+            if prefetched:
+                tracing.cache_event("shm.frame", hit=df is not None)
+            if df is None:
+                with tracing.cached_span("stage.indicators", symbol=symbol):
+                    df = indicator_stage(symbol, "qfq", last_date, LOOKBACK, bars)
+            with tracing.cached_span("stage.divergence", symbol=symbol):
+                div, error_msg, advice, trend = divergence_stage(symbol, "qfq", last_date, LOOKBACK, df)
+            if div:
+                # 每次运行都写：同一对低点在信号库里按 (代码, 低点日期) 去重，缓存命中时也不会漏记
+                get_signal_store().record(symbol, div, last_date, source="app")
             latest = df.iloc[-1]
         except Exception as e:
             st.exception(e)
@@ -106,144 +254,54 @@ if "analyze_code" in st.session_state:
         for signal in div['signals']:
             st.write(f"- {signal}")
         
-        # ========== 新增：背离可视化图表 ==========
-        st.subheader("📊 背离可视化")
-        
-        # 创建子图：价格和MACD
-        fig = make_subplots(
-            rows=2, cols=1,
-            shared_xaxes=True,
-            vertical_spacing=0.1,
-            subplot_titles=('价格走势与背离标记', 'MACD指标'),
-            row_width=[0.7, 0.3]
-        )
-        
-        # 重置索引以便按位置访问
-        df_reset = df.reset_index()
-        dates = pd.to_datetime(df_reset["date"]) if "date" in df_reset.columns else pd.to_datetime(df_reset.index)
-        
-        # 第一子图：价格和均线
-        fig.add_trace(
-            go.Scatter(x=dates, y=df_reset["close"], name="收盘价", line=dict(color='black', width=1)),
-            row=1, col=1
-        )
-        fig.add_trace(
-            go.Scatter(x=dates, y=df_reset["ma5"], name="MA5", line=dict(color='blue', width=1)),
-            row=1, col=1
-        )
-        fig.add_trace(
-            go.Scatter(x=dates, y=df_reset["ma20"], name="MA20", line=dict(color='orange', width=1)),
-            row=1, col=1
-        )
-        
-        # 标记背离的低点
-        date1_idx = dates[dates == div['date1']].index[0]
-        date2_idx = dates[dates == div['date2']].index[0]
-        
-        # 添加低点标记
-        fig.add_trace(
-            go.Scatter(
-                x=[div['date1'], div['date2']],
-                y=[div['price1'], div['price2']],
-                mode='markers+text',
-                marker=dict(size=12, color='red', symbol='circle'),
-                text=[f"低点A", f"低点B"],
-                textposition="top center",
-                name="背离低点",
-                hovertemplate="<b>%{text}</b><br>日期: %{x}<br>价格: %{y:.2f}<extra></extra>"
-            ),
-            row=1, col=1
-        )
-        
-        # 添加连接线
-        fig.add_trace(
-            go.Scatter(
-                x=[div['date1'], div['date2']],
-                y=[div['price1'], div['price2']],
-                mode='lines',
-                line=dict(color='red', width=2, dash='dash'),
-                showlegend=False,
-                hovertemplate=None
-            ),
-            row=1, col=1
-        )
-        
-        # 第二子图：MACD
-        fig.add_trace(
-            go.Scatter(x=dates, y=df_reset["macd"], name="MACD", line=dict(color='purple', width=1)),
-            row=2, col=1
-        )
-        fig.add_trace(
-            go.Scatter(x=dates, y=df_reset["macd_dif"], name="DIF", line=dict(color='blue', width=1)),
-            row=2, col=1
-        )
-        fig.add_trace(
-            go.Scatter(x=dates, y=df_reset["macd_signal"], name="DEA", line=dict(color='red', width=1)),
-            row=2, col=1
-        )
-        
-        # 标记MACD低点
-        fig.add_trace(
-            go.Scatter(
-                x=[div['date1'], div['date2']],
-                y=[div['macd1'], div['macd2']],
-                mode='markers+text',
-                marker=dict(size=10, color='green', symbol='diamond'),
-                text=[f"MACD: {div['macd1']:.4f}", f"MACD: {div['macd2']:.4f}"],
-                textposition="top center",
-                name="MACD低点",
-                hovertemplate="<b>%{text}</b><br>日期: %{x}<br>MACD: %{y:.4f}<extra></extra>"
-            ),
-            row=2, col=1
-        )
-        
-        # 添加MACD连接线
-        fig.add_trace(
-            go.Scatter(
-                x=[div['date1'], div['date2']],
-                y=[div['macd1'], div['macd2']],
-                mode='lines',
-                line=dict(color='green', width=2, dash='dash'),
-                showlegend=False,
-                hovertemplate=None
-            ),
-            row=2, col=1
-        )
-        
-        # 更新图表布局
-        fig.update_layout(
-            height=600,
-            title_text=f"底背离可视化 - {get_stock_name(symbol)}",
-            hovermode='x unified',
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-        )
-        
-        # 更新y轴标题
-        fig.update_yaxes(title_text="价格", row=1, col=1)
-        fig.update_yaxes(title_text="MACD", row=2, col=1)
-        
-        # 显示图表
+        # 显示详细计算过程
+        with st.expander("🔍 查看详细计算过程"):
+            st.text(div.get('calculation_steps', '无计算过程记录'))
+    else:
+        st.warning("未检测到明显底背离形态")
+
+    past = get_signal_store().history(symbol, limit=50)
+    if not past.empty:
+        with st.expander(f"📜 该股历史信号（{len(past)} 条）"):
+            st.dataframe(past[["detected", "level", "confidence", "date1", "date2", "price1", "price2", "hits"]],
+                         hide_index=True, use_container_width=True)
+
+    # 价格 / 均线 / MACD 合在一张 WebGL 图里，长区间按 LTTB 降采样，背离低点始终保留
+    st.subheader("📊 背离可视化" if div else "价格与均线")
+    chart_range = st.radio("图表区间", list(CHART_RANGES), horizontal=True, key="chart_range")
+    chart_n = CHART_RANGES[chart_range]
+    try:
+        if chart_n == LOOKBACK:
+            chart_df = df
+        else:
+            with tracing.cached_span("stage.history", symbol=symbol):
+                chart_df = history_stage(symbol, "qfq", last_date, chart_n)
+        with tracing.cached_span("stage.figure", symbol=symbol):
+            fig = figure_stage(symbol, last_date, stock_name, chart_df, div)
         st.plotly_chart(fig, use_container_width=True)
-        
-        # 图表说明
+    except Exception as e:
+        st.exception(e)
+    if div:
         st.markdown("""
         **图表说明:**
         - **上图**: 价格走势，红色虚线连接两个背离低点
         - **下图**: MACD指标，绿色虚线连接MACD低点
         - **背离特征**: 价格创新低(低点B < 低点A)，但MACD指标抬高(低点B > 低点A)
         """)
-        
-        # 显示详细计算过程
-        with st.expander("🔍 查看详细计算过程"):
-            st.text(div.get('calculation_steps', '无计算过程记录'))
-    else:
-        st.warning("未检测到明显底背离形态")
 
-    # 原有的简单图表
-    st.subheader("价格与均线")
-    chart_df = df[['close']].copy()
-    chart_df['MA5'] = df['ma5']
-    chart_df['MA20'] = df['ma20']
-    st.line_chart(chart_df)
+    st.caption("风险提示：仅供技术研究，不构成投资建议，投资有风险，入市需谨慎。")
+
 
-    st.caption("风险提示：仅供技术研究，不构成投资建议，投资有风险，入市需谨慎。")
\ No newline at end of file
+# ---------------- 诊断 ----------------
+if tracing.enabled():
+    with st.expander("🩺 诊断：本次运行各阶段耗时", expanded=False):
+        spans = [r for r in trace_records if r["type"] == "span"]
+        if spans:
+            run = pd.DataFrame(spans)
+            run["name"] = ["　" * d + n for d, n in zip(run["depth"], run["name"])]   # 按嵌套缩进
+            st.dataframe(run[["name", "ms"] + [c for c in ("symbol", "error") if c in run.columns]],
+                         hide_index=True, use_container_width=True)
+            st.caption(f"本次运行共 {len(spans)} 个 span，耗时 {run.loc[run['depth'] == 0, 'ms'].sum():.1f} ms")
+        st.write("**进程累计**（hits / misses 为缓存命中 / 未命中）")
+        st.dataframe(pd.DataFrame(tracing.report()), hide_index=True, use_container_width=True)
+        st.caption("启动前设置环境变量 MYSTOCK_TRACE=路径.jsonl，每条记录会同时追加到该文件")
@@ -0,0 +1,236 @@
+"""
+底背离信号历史回测
+逐日回放整段历史：每个交易日只用当天及以前的数据判定背离（无未来函数），
+记录信号出现后的远期收益，按 强烈背离 / 小背离 / 普通背离 统计胜率
+判定逻辑与 comprehensive_divergence_analysis 一致，但整段历史一次向量化完成，不逐日切片重算
+阈值、权重、级别都来自 divergence.BOTTOM_RULE
+用法：python backtest.py sz000001 sh600519 --horizons 5 10 20
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from analysis import NS_PER_DAY, compute_enhanced_indicators, local_low_positions
+from divergence import BOTTOM_RULE, rule_params
+
+LEVELS = ("强烈背离", "小背离", "普通背离")
+HORIZONS = (5, 10, 20, 60)
+
+# 由底背离规则推出，comprehensive_divergence_analysis 默认也用这一份：
+#   lookback 只看最近多少根K线，window 局部低点左右窗口，min_days 两个低点最少间隔天数，
+#   vol_ratio 低点B/低点A 成交量比低于此值算“成交量配合”，price_drop 跌幅超过此值算“价格有效新低”，
+#   min_signals 最少信号数，w_* 各信号的置信度权重，levels 级别划分
+DEFAULT_PARAMS = rule_params(BOTTOM_RULE)
+
+
+# ---------- 逐日低点对 ----------
+def latest_low_pairs(day_ns: np.ndarray, close: np.ndarray, lookback: int = 150,
+                     window: int = 5, min_days: int = 10, candidates: np.ndarray = None):
+    """
+    对每个交易日 t，返回 find_recent_lows(df[:t+1]) 最后两个低点的位置 (idx1, idx2)，没有则为 -1
+    局部低点与窗口起点无关，全局只算一次；窗口起点决定贪心间隔过滤从哪个低点开始，
+    起点相同的交易日共用一条低点链，用二分取“截至 t 已确认”的最后两个
+    """
+    n = len(close)
+    idx1 = np.full(n, -1, dtype=np.int64)
+    idx2 = np.full(n, -1, dtype=np.int64)
+    cand = local_low_positions(close, window) if candidates is None else candidates
+    if len(cand) < 2:
+        return idx1, idx2
+
+    t = np.arange(n)
+    first_ok = np.maximum(t - lookback + 1, 0) + window     # 窗口内最早可判定的低点位置
+    last_ok = t - window                                    # 右侧需要 window 根K线确认
+    start = np.searchsorted(cand, first_ok, side="left")    # 随 t 单调不减
+    cand_ns = day_ns[cand]
+    step = int(np.ceil(min_days)) * NS_PER_DAY if min_days > 0 else 0
+
+    bounds = np.flatnonzero(np.diff(start)) + 1
+    for seg in np.split(t, bounds):
+        s = start[seg[0]]
+        if s >= len(cand):
+            continue
+        limit = last_ok[seg[-1]]
+        chain = [s]
+        while True:
+            if step:
+                nxt = int(np.searchsorted(cand_ns, cand_ns[chain[-1]] + step, side="left"))
+            else:
+                nxt = chain[-1] + 1
+            if nxt >= len(cand) or cand[nxt] > limit:
+                break
+            chain.append(nxt)
+        pos = cand[chain]
+        k = np.searchsorted(pos, last_ok[seg], side="right")
+        ok = k >= 2
+        idx2[seg[ok]] = pos[k[ok] - 1]
+        idx1[seg[ok]] = pos[k[ok] - 2]
+    return idx1, idx2
+
+
+# ---------- 向量化打分 ----------
+def score_pairs(idx1, idx2, close, macd, dif, rsi, volume, params: dict = None) -> pd.DataFrame:
+    """
+    对每一对低点按 comprehensive_divergence_analysis 的规则打分
+    返回列：valid、n_signals、macd_cnt、level（0 无 / 1 普通 / 2 小 / 3 强烈）、confidence
+    """
+    p = {**DEFAULT_PARAMS, **(params or {})}
+    has = idx2 >= 0
+    i1, i2 = np.where(has, idx1, 0), np.where(has, idx2, 0)
+    p1, p2 = close[i1], close[i2]
+    new_low = has & (p2 < p1)
+
+    macd_ok = macd[i2] > macd[i1]
+    dif_ok = dif[i2] > dif[i1]
+    rsi_ok = rsi[i2] > rsi[i1]
+    v1, v2 = volume[i1], volume[i2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vol_ratio = np.where(v1 > 0, v2 / v1, 1.0)
+        drop = (p1 - p2) / p1
+    vol_ok = vol_ratio < p["vol_ratio"]
+    drop_ok = drop > p["price_drop"]
+
+    n_signals = (macd_ok.astype(np.int8) + dif_ok + rsi_ok + vol_ok + drop_ok)
+    conf = (p["w_macd"] * macd_ok + p["w_dif"] * dif_ok + p["w_rsi"] * rsi_ok
+            + p["w_volume"] * vol_ok + p["w_drop"] * drop_ok)
+    macd_cnt = macd_ok.astype(np.int8) + dif_ok
+    valid = new_low & (n_signals >= p["min_signals"])
+
+    # 级别自上而下取第一个 MACD 信号数达标的；编号 3 强烈 / 2 小 / 1 普通
+    level = np.zeros(len(conf), dtype=np.int64)
+    confidence = np.full(len(conf), np.nan)
+    for k, (_, min_core, scale, cap) in enumerate(p["levels"]):
+        hit = (level == 0) & (macd_cnt >= min_core)
+        level[hit] = len(p["levels"]) - k
+        confidence[hit] = np.minimum(conf[hit] * scale, cap)
+    return pd.DataFrame({
+        "valid": valid,
+        "n_signals": n_signals,
+        "macd_cnt": macd_cnt,
+        "level": np.where(valid, level, 0),
+        "confidence": np.where(valid, confidence, np.nan),
+    })
+
+
+def first_seen(idx1: np.ndarray, idx2: np.ndarray) -> np.ndarray:
+    """
+    每个不同低点对第一次出现的交易日，按时间排序；没有低点对（-1）的日子不算
+    打分只取决于这对低点本身，所以同一对低点的 valid / level 在它出现的每一天都相同，
+    “新信号”就是有效低点对第一次出现的那天
+    """
+    t = np.flatnonzero(idx2 >= 0)
+    _, first = np.unique(idx1[t] * (len(idx1) + 1) + idx2[t], return_index=True)
+    return t[np.sort(first)]
+
+
+def level_name(code: int):
+    return {3: "强烈背离", 2: "小背离", 1: "普通背离"}.get(int(code))
+
+
+# ---------- 单只回测 ----------
+def _prepare(df: pd.DataFrame, backend: str = "fast") -> pd.DataFrame:
+    if "macd" not in df.columns:
+        df = compute_enhanced_indicators(df, backend=backend)
+    df = df.sort_index().reset_index(drop="date" in df.columns)
+    if "date" not in df.columns:
+        df = df.rename(columns={df.columns[0]: "date"})
+    return df
+
+
+def backtest_symbol(df: pd.DataFrame, symbol: str = "", horizons=HORIZONS, params: dict = None,
+                    backend: str = "fast") -> pd.DataFrame:
+    """
+    df：整段日线（可已含指标列）；指标在整段历史上计算，EMA 只用过去数据，不引入未来信息
+    返回每次“新出现”的背离信号：检测日、两个低点、级别、置信度、各持有期远期收益
+    同一对低点只在第一次满足条件的那天记一次
+    """
+    p = {**DEFAULT_PARAMS, **(params or {})}
+    df = _prepare(df, backend)
+    dates = pd.to_datetime(df["date"])
+    day_ns = dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    close = df["close"].to_numpy(dtype=float)
+    idx1, idx2 = latest_low_pairs(day_ns, close, p["lookback"], p["window"], p["min_days"])
+    scored = score_pairs(idx1, idx2, close, df["macd"].to_numpy(float), df["macd_dif"].to_numpy(float),
+                         df["rsi"].to_numpy(float), df["volume"].to_numpy(float), p)
+
+    # 新信号：有效低点对第一次出现的那天；窗口滑动让同一对低点消失后又出现的，也只记第一次
+    t = first_seen(idx1, idx2)
+    t = t[scored["valid"].to_numpy()[t]]
+
+    out = pd.DataFrame({
+        "symbol": symbol,
+        "date": dates.to_numpy()[t],
+        "date1": dates.to_numpy()[idx1[t]],
+        "date2": dates.to_numpy()[idx2[t]],
+        "price1": close[idx1[t]],
+        "price2": close[idx2[t]],
+        "level": [level_name(c) for c in scored["level"].to_numpy()[t]],
+        "confidence": scored["confidence"].to_numpy()[t],
+        "n_signals": scored["n_signals"].to_numpy()[t],
+        "close": close[t],
+    })
+    for h in horizons:
+        fwd = np.full(len(t), np.nan)
+        ok = t + h < len(close)
+        fwd[ok] = close[t[ok] + h] / close[t[ok]] - 1
+        out[f"ret_{h}d"] = fwd
+    return out
+
+
+# ---------- 多只 & 汇总 ----------
+def backtest_many(frames, horizons=HORIZONS, params: dict = None, backend: str = "fast") -> pd.DataFrame:
+    """frames：{symbol: 整段日线}；返回所有股票的信号明细"""
+    parts = [backtest_symbol(df, sym, horizons, params, backend) for sym, df in frames.items()]
+    parts = [x for x in parts if not x.empty]
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True)
+
+
+def summarize(events: pd.DataFrame, horizons=HORIZONS) -> pd.DataFrame:
+    """按级别统计：信号数、平均 / 中位远期收益、胜率（远期收益 > 0 的比例）"""
+    rows = []
+    for level in LEVELS + ("全部",):
+        sub = events if level == "全部" else events[events["level"] == level]
+        row = {"level": level, "count": len(sub)}
+        for h in horizons:
+            r = sub[f"ret_{h}d"].dropna() if len(sub) else pd.Series(dtype=float)
+            row[f"mean_{h}d"] = r.mean() if len(r) else np.nan
+            row[f"median_{h}d"] = r.median() if len(r) else np.nan
+            row[f"hit_{h}d"] = (r > 0).mean() if len(r) else np.nan
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="底背离信号历史回测")
+    parser.add_argument("symbols", nargs="*", help="股票代码；留空用自选股")
+    parser.add_argument("--horizons", type=int, nargs="+", default=list(HORIZONS))
+    parser.add_argument("--offline", action="store_true", help="只用本地缓存，不联网")
+    parser.add_argument("--out", help="信号明细保存为 CSV")
+    args = parser.parse_args(argv)
+
+    from analysis import normalize_symbol
+    from bar_cache import get_cache
+    if args.symbols:
+        symbols = [normalize_symbol(s) for s in args.symbols]
+    else:
+        from storage import load_self
+        symbols = [item["code"] for item in load_self()]
+    cache = get_cache()
+    if not args.offline:
+        cache.refresh_many(symbols)
+    frames = {s: cache.read(s) for s in symbols}
+    events = backtest_many({s: df for s, df in frames.items() if not df.empty}, args.horizons)
+    if events.empty:
+        print("没有信号")
+        return events
+    print(summarize(events, args.horizons).to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    if args.out:
+        events.to_csv(args.out, index=False, encoding="utf-8-sig")
+    return events
+
+
+if __name__ == "__main__":
+    main()
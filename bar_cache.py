@@ -0,0 +1,250 @@
+"""
+日线行情本地缓存
+每只股票一个列式文件（Parquet，缺 pyarrow 时退回 pickle），
+只补拉本地缺失的尾部交易日，近期分析直接从磁盘读取最后 N 根 K 线
+"""
+import importlib.util
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import tracing
+
+CACHE_DIR = os.path.join("data", "bars")
+META_SUFFIX = ".meta.json"          # 每个品种一个元数据文件，多进程并发写互不覆盖
+REFRESH_TTL = 10 * 60            # 同一股票两次联网检查的最小间隔（秒）
+MARKET_CLOSE = (15, 30)          # 收盘后数据源才会出当日K线
+PRICE_TOL = 0.006                # 复权价保留两位小数，重叠K线比对的容差
+FRAME_MEMO_SIZE = 64             # 内存里只留最近读过的几十只，全市场扫描不会把所有历史攥在手里
+# pandas 3 写时复制，浅拷贝就能把调用方的原地修改挡在缓存外；更早的版本浅拷贝仍共享数据，只能深拷贝
+_DEEP_COPY = int(pd.__version__.split(".")[0]) < 3
+
+# 只查装没装，不导入：pyarrow 由 pandas 在真正读写 Parquet 时才加载，冷启动不背这份开销
+_FORMAT = "parquet" if importlib.util.find_spec("pyarrow") is not None else "pkl"
+
+
+# ---------- 数据源 ----------
+def akshare_daily_source(symbol: str, start_date: str, end_date: str, adjust: str = "qfq") -> pd.DataFrame:
+    """
+    默认数据源：新浪日线；日期为 YYYYMMDD 字符串
+    任何签名相同的可调用对象都可以替换它（测试里用本地假数据源即可）
+    """
+    import akshare as ak
+    return ak.stock_zh_a_daily(symbol=symbol, start_date=start_date, end_date=end_date, adjust=adjust)
+
+
+def _last_close_time(now: datetime) -> datetime:
+    """最近一个已收盘交易日的收盘时刻（只跳周末，节假日多查一次无妨）"""
+    close = now.replace(hour=MARKET_CLOSE[0], minute=MARKET_CLOSE[1], second=0, microsecond=0)
+    if now < close:
+        close -= timedelta(days=1)
+    while close.weekday() >= 5:
+        close -= timedelta(days=1)
+    return close
+
+
+def _normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """统一 date 列为 datetime64、按日期升序去重、RangeIndex"""
+    if df is None or df.empty:
+        return pd.DataFrame()
+    df = df.copy()
+    if "date" not in df.columns:
+        df = df.reset_index()
+        if "date" not in df.columns:
+            df = df.rename(columns={df.columns[0]: "date"})
+    df["date"] = pd.to_datetime(df["date"])
+    df = df.drop_duplicates(subset="date", keep="last").sort_values("date")
+    return df.reset_index(drop=True)
+
+
+# ---------- 缓存 ----------
+class BarCache:
+    """
+    按 (symbol, adjust) 落盘的日线缓存
+    元数据文件记录每个品种已存的最后日期和上次联网检查时间
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, source=akshare_daily_source, ttl: float = REFRESH_TTL,
+                 memo_size: int = FRAME_MEMO_SIZE):
+        self.cache_dir = cache_dir
+        self.source = source
+        self.ttl = ttl
+        self.memo_size = memo_size
+        self._locks = {}                                # key -> Lock，不同股票互不阻塞
+        self._locks_guard = threading.Lock()
+        self._frames = OrderedDict()                    # path -> (mtime, DataFrame)，LRU
+        self._frames_guard = threading.Lock()
+
+    # ----- 元数据 -----
+    @staticmethod
+    def _key(symbol: str, adjust: str) -> str:
+        return f"{symbol}_{adjust or 'raw'}"
+
+    def path(self, symbol: str, adjust: str = "qfq") -> str:
+        return os.path.join(self.cache_dir, f"{self._key(symbol, adjust)}.{_FORMAT}")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}{META_SUFFIX}")
+
+    def _load_meta(self, key: str):
+        try:
+            with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save_meta(self, key: str, meta: dict):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._meta_path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def last_date(self, symbol: str, adjust: str = "qfq"):
+        """本地已存的最后一个交易日，没有缓存返回 None"""
+        meta = self._load_meta(self._key(symbol, adjust))
+        return pd.Timestamp(meta["last_date"]) if meta else None
+
+    # ----- 读写 -----
+    def read(self, symbol: str, adjust: str = "qfq") -> pd.DataFrame:
+        """只读本地，不联网；没有缓存返回空表。返回的是内存缓存的拷贝，调用方可以随意修改"""
+        path = self.path(symbol, adjust)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return pd.DataFrame()
+        with self._frames_guard:
+            hit = self._frames.get(path)
+            if hit and hit[0] == mtime:
+                self._frames.move_to_end(path)
+        tracing.cache_event("bar_cache.read", hit=bool(hit and hit[0] == mtime))
+        if hit and hit[0] == mtime:
+            return hit[1].copy(deep=_DEEP_COPY)
+        df = pd.read_parquet(path) if _FORMAT == "parquet" else pd.read_pickle(path)
+        with self._frames_guard:
+            self._frames[path] = (mtime, df)
+            self._frames.move_to_end(path)
+            while len(self._frames) > self.memo_size:
+                self._frames.popitem(last=False)
+        return df.copy(deep=_DEEP_COPY)
+
+    def _write(self, symbol: str, adjust: str, df: pd.DataFrame):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(symbol, adjust)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        if _FORMAT == "parquet":
+            df.to_parquet(tmp, index=False)
+        else:
+            df.to_pickle(tmp)
+        os.replace(tmp, path)
+        with self._frames_guard:
+            self._frames.pop(path, None)
+
+    def _fetch(self, symbol: str, adjust: str, start=None, fetcher=None) -> pd.DataFrame:
+        """联网一律经取数层（默认进程共享的 AsyncFetcher）：限速、超时、重试，同一请求并发时只发一次"""
+        from fetcher import run_one
+        start_date = start.strftime("%Y%m%d") if start is not None else "19900101"
+        end_date = datetime.now().strftime("%Y%m%d")
+        key = ("bars", self.cache_dir, symbol, adjust, start_date)
+        with tracing.span("bar_cache.fetch", symbol=symbol, from_date=start_date):
+            return _normalize_frame(run_one(key, self.source, symbol, start_date, end_date, adjust, fetcher=fetcher))
+
+    def _is_fresh(self, meta: dict) -> bool:
+        checked = meta.get("checked_at", 0)
+        now = time.time()
+        if now - checked < self.ttl:
+            return True
+        return checked >= _last_close_time(datetime.now()).timestamp()
+
+    def refresh(self, symbol: str, adjust: str = "qfq", force: bool = False, fetcher=None) -> pd.DataFrame:
+        """
+        增量更新：从本地最后一天开始补拉（含最后一天用于比对）
+        重叠K线价格对不上说明发生了除权，前复权历史整体变了，改为全量重拉
+        """
+        key = self._key(symbol, adjust)
+        with self._lock_for(key):
+            meta = self._load_meta(key)
+            old = self.read(symbol, adjust) if meta else pd.DataFrame()
+            fresh = not force and meta and not old.empty and self._is_fresh(meta)
+            tracing.cache_event("bar_cache.refresh", hit=bool(fresh))
+            if fresh:
+                return old
+
+            if old.empty or force:
+                df = self._fetch(symbol, adjust, fetcher=fetcher)
+            else:
+                new = self._fetch(symbol, adjust, start=old["date"].iloc[-1], fetcher=fetcher)
+                df = old
+                if not new.empty:
+                    overlap = new[new["date"] == old["date"].iloc[-1]]
+                    if not overlap.empty and abs(overlap["close"].iloc[0] - old["close"].iloc[-1]) > PRICE_TOL:
+                        df = self._fetch(symbol, adjust, fetcher=fetcher)
+                    elif (new["date"] > old["date"].iloc[-1]).any():
+                        df = _normalize_frame(pd.concat([old, new[new["date"] > old["date"].iloc[-1]]]))
+
+            if df.empty:
+                return df
+            if df is not old:
+                self._write(symbol, adjust, df)
+            self._save_meta(key, {
+                "last_date": df["date"].iloc[-1].strftime("%Y-%m-%d"),
+                "rows": int(len(df)),
+                "checked_at": time.time(),
+            })
+            return df
+
+    def needs_refresh(self, symbol: str, adjust: str = "qfq") -> bool:
+        """本地没有或已过期，下一次 refresh 会联网"""
+        meta = self._load_meta(self._key(symbol, adjust))
+        return not meta or not os.path.exists(self.path(symbol, adjust)) or not self._is_fresh(meta)
+
+    def refresh_many(self, symbols, adjust: str = "qfq", fetcher=None) -> dict:
+        """
+        并发刷新一批股票，耗时约等于最慢的那一只
+        需要联网的各开一个线程 refresh，联网那一步经 fetcher 限速、重试、合并；返回 {symbol: DataFrame 或异常}
+        """
+        from fetcher import get_fetcher
+        fetcher = fetcher or get_fetcher()
+        stale = [s for s in symbols if self.needs_refresh(s, adjust)]
+        out = {s: self.read(s, adjust) for s in symbols if s not in stale}
+        if stale:
+            # 线程数同取数器的并发上限；真正的网络请求在取数层里排队
+            with ThreadPoolExecutor(max_workers=min(len(stale), fetcher.max_concurrency)) as pool:
+                futures = [pool.submit(self.refresh, s, adjust, fetcher=fetcher) for s in stale]
+            for s, fut in zip(stale, futures):
+                try:
+                    out[s] = fut.result()
+                except Exception as e:
+                    out[s] = e
+        return out
+
+    def get(self, symbol: str, n: int = 150, adjust: str = "qfq", refresh: bool = True) -> pd.DataFrame:
+        """取最近 n 根K线；refresh=False 时只读本地"""
+        df = self.refresh(symbol, adjust) if refresh else self.read(symbol, adjust)
+        return df.tail(n) if n else df
+
+
+_default_cache = None
+
+
+def get_cache() -> BarCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = BarCache()
+    return _default_cache
+
+
+def get_daily_bars(symbol: str, n: int = 150, adjust: str = "qfq") -> pd.DataFrame:
+    """app 用的便捷入口：等价于 ak.stock_zh_a_daily(...).tail(n)，但走本地缓存"""
+    return get_cache().get(symbol, n=n, adjust=adjust)
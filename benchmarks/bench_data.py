@@ -0,0 +1,27 @@
+"""
+基准共用的合成行情：确定性，不联网
+"""
+import numpy as np
+import pandas as pd
+
+
+def synthetic_ohlcv(n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    几何随机游走叠加周期回撤，保证有足够多的局部低点和背离形态
+    起始日放在 1700 年，10 万根交易日也落在 datetime64[ns] 范围内
+    列与 ak.stock_zh_a_daily 一致：date/open/high/low/close/volume
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n)
+    drift = 0.15 * np.sin(2 * np.pi * t / 60)
+    close = np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.018, n)) + drift), 2)
+    close = np.maximum(close, 0.01)
+    spread = rng.uniform(0.002, 0.03, n)
+    return pd.DataFrame({
+        "date": pd.bdate_range("1700-01-01", periods=n),
+        "open": np.round(close * (1 + rng.normal(0, 0.005, n)), 2),
+        "high": np.round(close * (1 + spread), 2),
+        "low": np.round(close * (1 - spread), 2),
+        "close": close,
+        "volume": np.round(rng.lognormal(13, 0.5, n)),
+    })
@@ -0,0 +1,64 @@
+"""
+分析流水线基准测试的公共夹具
+合成行情是确定性的，不联网；耗时由 pytest-benchmark 统计，峰值内存用 tracemalloc 单独测一次，
+并与 memory_baseline.json 比对，超出基线 25% 即失败（--mem-update 重写基线）
+"""
+import json
+import os
+import sys
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_data import synthetic_ohlcv
+
+SIZES = (150, 1_000, 10_000, 100_000)
+MEM_BASELINE = os.path.join(os.path.dirname(__file__), "memory_baseline.json")
+MEM_TOLERANCE = 1.25
+MEM_SLACK_MB = 0.05              # 小用例的绝对容差，避免几 KB 的抖动误报
+
+
+def pytest_addoption(parser):
+    parser.addoption("--mem-update", action="store_true", help="用本次结果重写峰值内存基线")
+
+
+@pytest.fixture(params=SIZES, ids=lambda n: f"{n}bars", scope="session")
+def bars(request) -> pd.DataFrame:
+    return synthetic_ohlcv(request.param)
+
+
+@pytest.fixture(scope="session")
+def mem_baseline(request):
+    try:
+        with open(MEM_BASELINE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {}
+    yield data
+    if request.config.getoption("--mem-update"):
+        with open(MEM_BASELINE, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(data.items())), f, ensure_ascii=False, indent=2)
+
+
+@pytest.fixture
+def measure(benchmark, request, mem_baseline):
+    """measure(fn, *args)：先测峰值内存并比对基线，再交给 pytest-benchmark 计时"""
+    def _run(fn, *args, **kwargs):
+        fn(*args, **kwargs)                              # 预热：numba 编译、惰性导入不计入
+        tracemalloc.start()
+        fn(*args, **kwargs)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        benchmark.extra_info["peak_mb"] = round(peak_mb, 3)
+
+        key = request.node.name
+        if request.config.getoption("--mem-update"):
+            mem_baseline[key] = round(peak_mb, 3)
+        elif key in mem_baseline:
+            limit = mem_baseline[key] * MEM_TOLERANCE + MEM_SLACK_MB
+            assert peak_mb <= limit, f"峰值内存 {peak_mb:.2f}MB 超过基线 {mem_baseline[key]:.2f}MB"
+        return benchmark(fn, *args, **kwargs)
+    return _run
@@ -0,0 +1,91 @@
+"""
+冷启动基准
+1) python -X importtime 导入报告：按累计耗时列出最慢的模块
+2) 首屏渲染计时：每轮起一个全新解释器，用 streamlit AppTest 跑一遍页面，
+   统计从进程启动到首屏渲染完成的耗时，并记录 akshare / ta / plotly / pyarrow 是否被提前加载
+用法：python benchmarks/startup.py --script app_back.py --runs 5
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("akshare", "ta", "plotly", "pyarrow")     # plotly 会被 streamlit 自己的 plotly_chart 模块带进来，不算在我们头上
+DEFERRED = ("akshare", "ta")             # 首屏不应加载的模块
+IMPORT_DEFERRED = DEFERRED + ("pyarrow",)           # 入口模块导入时不应加载（pandas 3 自己导入的不算）；首屏画表格时 streamlit 会用
+ENTRY_MODULES = ("streamlit", "analysis", "storage", "bar_cache", "scheduler")
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+_RENDER = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({script!r}, default_timeout=120).run()
+elapsed = time.perf_counter() - t0
+print(json.dumps({{
+    "seconds": elapsed,
+    "exception": [str(e.value) for e in at.exception],
+    "loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def importtime_report(modules=ENTRY_MODULES, top: int = 15, cwd: str = None) -> dict:
+    """在新解释器里 import 给定模块，返回 {total_ms, top: [(模块, 累计 ms, 自身 ms)], loaded: [...]}"""
+    code = f"import sys; sys.path.insert(0, {ROOT!r}); import " + ", ".join(modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, cwd=cwd or ROOT, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(2)) / 1000, int(m.group(1)) / 1000, len(m.group(3))))
+    total = sum(cum for name, cum, own, depth in rows if depth == 1)
+    names = {name.split(".")[0] for name, *_ in rows}
+    slow = sorted(rows, key=lambda r: r[1], reverse=True)[:top]
+    return {
+        "total_ms": total,
+        "top": [(name, cum, own) for name, cum, own, _ in slow],
+        "loaded": [m for m in HEAVY if m in names],
+    }
+
+
+def first_render(script: str = "app_back.py", cwd: str = None) -> dict:
+    """全新解释器里渲染一次页面，返回 {seconds, exception, loaded}"""
+    code = _RENDER.format(root=ROOT, script=os.path.join(ROOT, script), heavy=HEAVY)
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                          cwd=cwd or os.getcwd(), check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="冷启动基准：导入耗时 + 首屏渲染耗时")
+    parser.add_argument("--script", default="app_back.py", help="相对仓库根目录的页面脚本")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    report = importtime_report(top=args.top)
+    print(f"导入 {', '.join(ENTRY_MODULES)}：{report['total_ms']:.0f} ms，"
+          f"已加载的重模块：{', '.join(report['loaded']) or '无'}")
+    for name, cum, own in report["top"]:
+        print(f"  {cum:8.1f} ms  {own:7.1f} ms  {name}")
+
+    times = []
+    for _ in range(args.runs):
+        res = first_render(args.script)
+        if res["exception"]:
+            raise SystemExit(f"页面异常：{res['exception']}")
+        times.append(res["seconds"])
+    times.sort()
+    print(f"首屏渲染 {args.script}：中位 {times[len(times) // 2]:.2f}s，最快 {times[0]:.2f}s（{args.runs} 轮），"
+          f"提前加载：{', '.join(res['loaded']) or '无'}")
+    return report, times
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+分析流水线各阶段与端到端耗时
+运行：python -m pytest benchmarks --benchmark-autosave --benchmark-storage=benchmarks/.results
+对比：python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:25% --benchmark-storage=benchmarks/.results
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from analysis import (analyze_trend, compute_enhanced_indicators, comprehensive_divergence_analysis,
+                      find_recent_lows, generate_trading_advice, normalize_symbol)
+
+CODES = [f"{p}{i:05d}" for p in "036" for i in range(2000)]
+
+
+def _with_indicators(df, backend="fast"):
+    return compute_enhanced_indicators(df, backend=backend)
+
+
+def test_normalize_symbol(measure):
+    measure(lambda: [normalize_symbol(c) for c in CODES])
+
+
+@pytest.mark.parametrize("backend", ["ta", "fast"])
+def test_compute_enhanced_indicators(measure, bars, backend):
+    measure(compute_enhanced_indicators, bars, backend=backend)
+
+
+def test_find_recent_lows(measure, bars):
+    measure(find_recent_lows, bars, lookback_days=None)
+
+
+def test_comprehensive_divergence_analysis(measure, bars):
+    measure(comprehensive_divergence_analysis, _with_indicators(bars))
+
+
+def test_analyze_trend(measure, bars):
+    measure(analyze_trend, _with_indicators(bars))
+
+
+@pytest.mark.parametrize("backend", ["ta", "fast"])
+def test_end_to_end(measure, bars, backend):
+    def pipeline(df):
+        df = compute_enhanced_indicators(df, backend=backend)
+        div, _ = comprehensive_divergence_analysis(df)
+        return generate_trading_advice(div, df), analyze_trend(df)
+    measure(pipeline, bars)
@@ -0,0 +1,47 @@
+"""
+组合估值：几百只持仓 × 十年日线整段重算，以及新K线到来时的增量补算
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import portfolio
+from bench_data import synthetic_ohlcv
+
+POSITIONS = 300
+DAYS = 2500
+TRADES = 3000
+
+
+@pytest.fixture(scope="module")
+def book():
+    base = synthetic_ohlcv(DAYS)
+    hists = {f"sz{k:06d}": base.assign(close=base["close"] * (1 + k / POSITIONS)) for k in range(POSITIONS)}
+    rng = np.random.default_rng(0)
+    dates = base["date"].to_numpy()
+    trades = pd.DataFrame({
+        "id": np.arange(TRADES),
+        "date": pd.to_datetime(np.sort(rng.choice(dates, TRADES))),
+        "symbol": rng.choice(list(hists), TRADES),
+        "side": portfolio.BUY,
+        "qty": rng.integers(1, 10, TRADES) * 100.0,
+        "price": 10.0,
+        "fee": 5.0,
+    })
+    return trades, hists
+
+
+def test_full_revalue(benchmark, book):
+    trades, hists = book
+    engine = portfolio.PortfolioEngine(trades, history=hists.get)
+    daily = benchmark(engine.run)
+    assert len(daily) == DAYS - int(np.searchsorted(hists["sz000000"]["date"], trades["date"].iloc[0]))
+
+
+def test_incremental_advance(benchmark, book):
+    trades, hists = book
+    engine = portfolio.PortfolioEngine(trades, history=hists.get)
+    engine.run()
+    benchmark(engine.advance)
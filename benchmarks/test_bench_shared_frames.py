@@ -0,0 +1,39 @@
+"""
+进程间传指标表：pickle 整表 vs 共享内存句柄
+父进程一侧的开销：pickle 随股票数线性增长，共享内存只传句柄，读端按需 attach 切片
+"""
+import pickle
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import shared_frames
+from analysis import compute_enhanced_indicators
+from bench_data import synthetic_ohlcv
+
+UNIVERSE = (16, 256)
+
+
+@pytest.fixture(params=UNIVERSE, ids=lambda n: f"{n}symbols", scope="module")
+def frames(request):
+    base = compute_enhanced_indicators(synthetic_ohlcv(300), backend="fast").tail(150)
+    return {f"sz{k:06d}": base.copy() for k in range(request.param)}
+
+
+def test_pickle_roundtrip(benchmark, frames):
+    benchmark(lambda: pickle.loads(pickle.dumps(frames, protocol=pickle.HIGHEST_PROTOCOL)))
+
+
+def test_shared_handles_roundtrip(benchmark, frames, tmp_path):
+    reg = shared_frames.Registry(str(tmp_path / "registry.json"))
+    reg.update(shared_frames.publish(frames))
+    handles = reg.load()
+    try:
+        # 子进程回传的句柄走 pickle，读端 attach 后取一只股票的视图
+        def transfer():
+            pickle.loads(pickle.dumps(handles))
+            return shared_frames.SharedFrames(reg.path).frame("sz000000")
+        benchmark(transfer)
+    finally:
+        reg.clear()
@@ -0,0 +1,40 @@
+"""
+信号历史库：百万行里查“近 30 天的强烈背离”和某只股票的历史信号
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import signal_store
+
+ROWS = 1_000_000
+SYMBOLS = 5000
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    store = signal_store.SignalStore(str(tmp_path_factory.mktemp("signals") / "signals.db"))
+    rng = np.random.default_rng(0)
+    days = pd.bdate_range("2016-01-01", periods=2500).strftime("%Y-%m-%d").to_numpy()
+    d = rng.integers(40, len(days), ROWS)
+    lag = rng.integers(5, 40, ROWS)
+    sym = rng.integers(0, SYMBOLS, ROWS)
+    level = rng.choice(signal_store.LEVELS, ROWS, p=[0.1, 0.3, 0.6])
+    values = (10.0, 9.5, -0.2, -0.1, -0.3, -0.2, 25.0, 30.0, 1e6, 8e5)
+    store.record_many((f"sz{s:06d}", days[k], lv, 0.8, days[k - g], days[k], *values, "", "bench", days[k], 0.0)
+                      for s, k, g, lv in zip(sym, d, lag, level))
+    return store, pd.Timestamp(days[-1])
+
+
+def test_recent_strong(benchmark, store):
+    store, today = store
+    df = benchmark(store.recent, "强烈背离", 30, 100000, today)
+    assert len(df) and (df["level"] == "强烈背离").all()
+
+
+def test_symbol_history(benchmark, store):
+    store, _ = store
+    df = benchmark(store.history, "sz000042")
+    assert len(df) and (df["symbol"] == "sz000042").all()
@@ -0,0 +1,23 @@
+"""
+冷启动：入口模块导入时不加载 akshare / ta / pyarrow，首屏不加载 akshare / ta，并记录全新解释器里的首屏渲染耗时
+运行：python -m pytest benchmarks/test_bench_startup.py --benchmark-autosave --benchmark-storage=benchmarks/.results
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+pytest.importorskip("streamlit")
+
+from startup import DEFERRED, IMPORT_DEFERRED, first_render, importtime_report
+
+
+def test_entry_imports_defer_heavy_modules():
+    report = importtime_report()
+    baseline = set(importtime_report(("pandas",))["loaded"])     # pandas 3 装了 pyarrow 就会在 import 时加载
+    assert not (set(IMPORT_DEFERRED) - baseline) & set(report["loaded"]), report["top"]
+
+
+def test_first_render(benchmark, tmp_path):
+    # 空数据目录：自选股页首屏只有自选股列表和预计算信号提示，不触发联网
+    result = benchmark.pedantic(first_render, args=("app_back.py", str(tmp_path)), rounds=3, iterations=1)
+    assert not result["exception"]
+    assert not set(DEFERRED) & set(result["loaded"])
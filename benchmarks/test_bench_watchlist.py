@@ -0,0 +1,34 @@
+"""
+自选股批量导入：1000 个代码整批规范化、一次查目录、一个事务写入
+"""
+import itertools
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import storage
+import symbols
+from watchlist import WatchlistStore
+
+CODES = [f"{p}{i:05d}" for p in "036" for i in range(400)][:1000]
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    directory = symbols.SymbolDirectory(str(tmp_path / "symbols.json"),
+                                        source=lambda: [(c, f"股票{c}") for c in CODES])
+    monkeypatch.setattr(symbols, "get_directory", lambda: directory)
+    counter = itertools.count()
+
+    def fresh_store():
+        store = WatchlistStore(str(tmp_path / f"watchlist{next(counter)}.db"), legacy_files={})
+        monkeypatch.setattr(storage, "get_store", lambda: store)
+        return ("\n".join(CODES),), {}
+
+    return fresh_store
+
+
+def test_import_1000_codes(benchmark, env):
+    result = benchmark.pedantic(storage.import_stocks, setup=env, rounds=5)
+    assert len(result["added"]) == len(CODES)
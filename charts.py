@@ -0,0 +1,166 @@
+"""
+背离图表
+长历史用 Scattergl（WebGL）绘制，每条曲线按 LTTB（最大三角形三桶）降采样到 max_points 个点以内，
+背离拐点、价格局部低点和首尾点一定保留；同一 (股票, 最后一根K线, 区间) 的图只构建一次
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from analysis import NS_PER_DAY, local_low_positions
+from tracing import mark_miss, traced
+
+MAX_POINTS = 1500                # 每条曲线最多画多少个点；10 年日线约 2500 根
+FIGURE_MEMO_SIZE = 32
+
+_figures = OrderedDict()
+_figures_lock = threading.Lock()
+
+
+# ---------- 降采样 ----------
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets：返回保留点的位置（升序，含首尾）
+    首尾之间均分 n_out-2 个桶，每桶选与“上一个选中点、下一桶均值点”围成三角形面积最大的点
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    every = (n - 2) / (n_out - 2)
+    edges = (np.arange(n_out - 1) * every).astype(np.int64) + 1          # 第 i 桶为 [edges[i], edges[i+1])
+    edges[-1] = n - 1
+    # 各桶均值一次算好，循环里只剩依赖上一个选中点的 argmax
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+    avg_x = np.r_[avg_x[1:], x[-1]]                                      # 第 i 桶用第 i+1 桶的均值
+    avg_y = np.r_[avg_y[1:], y[-1]]
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def downsample(x: np.ndarray, y: np.ndarray, n_out: int = MAX_POINTS, keep=()) -> np.ndarray:
+    """跳过 NaN 后做 LTTB，再并入必须保留的位置 keep；总点数不超过 max(n_out, len(keep) + 2)，返回升序位置"""
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) <= n_out:
+        return valid
+    keep = np.asarray(keep, dtype=np.int64)
+    keep = keep[(keep >= 0) & (keep < len(y))]
+    keep = keep[~np.isnan(y[keep])]
+    budget = max(n_out - len(keep), 3)                 # 给保留点让出名额
+    return np.union1d(valid[lttb(x[valid], y[valid], budget)], keep)
+
+
+# ---------- 图 ----------
+def _pivot_positions(dates: pd.Series, close: np.ndarray, div) -> np.ndarray:
+    pos = [0, len(close) - 1]
+    if div:
+        for key in ("date1", "date2"):
+            hit = np.flatnonzero(dates.to_numpy() == np.datetime64(pd.Timestamp(div[key]), "ns"))
+            pos.extend(hit.tolist())
+    return np.union1d(pos, local_low_positions(close))
+
+
+@traced("charts.divergence_figure")
+def divergence_figure(df: pd.DataFrame, div=None, stock_name: str = "", max_points: int = MAX_POINTS):
+    """
+    价格 + MACD 两联图；有背离时标出两个低点和连线，没有背离时就是价格均线图
+    df 需含 close/ma5/ma20/macd/macd_dif/macd_signal
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    fig = make_subplots(
+        rows=2, cols=1,
+        shared_xaxes=True,
+        vertical_spacing=0.1,
+        subplot_titles=("价格走势与背离标记" if div else "价格走势", "MACD指标"),
+        row_width=[0.3, 0.7],
+    )
+    df = df.reset_index()
+    dates = pd.to_datetime(df["date"]) if "date" in df.columns else pd.to_datetime(df[df.columns[0]])
+    x = dates.to_numpy(dtype="datetime64[ns]").view(np.int64) / NS_PER_DAY
+    close = df["close"].to_numpy(dtype=float)
+    keep = _pivot_positions(dates, close, div)
+
+    def line(col, name, color, row):
+        y = df[col].to_numpy(dtype=float)
+        idx = downsample(x, y, max_points, keep)
+        fig.add_trace(go.Scattergl(x=dates.to_numpy()[idx], y=y[idx], name=name, mode="lines",
+                                   line=dict(color=color, width=1)), row=row, col=1)
+
+    line("close", "收盘价", "black", 1)
+    line("ma5", "MA5", "blue", 1)
+    line("ma20", "MA20", "orange", 1)
+    line("macd", "MACD", "purple", 2)
+    line("macd_dif", "DIF", "blue", 2)
+    line("macd_signal", "DEA", "red", 2)
+
+    if div:
+        pts = [div["date1"], div["date2"]]
+        # 拐点标记只有两个点，用普通 Scatter 才能带文字
+        fig.add_trace(go.Scatter(
+            x=pts, y=[div["price1"], div["price2"]], mode="markers+text",
+            marker=dict(size=12, color="red", symbol="circle"), text=["低点A", "低点B"],
+            textposition="top center", name="背离低点",
+            hovertemplate="<b>%{text}</b><br>日期: %{x}<br>价格: %{y:.2f}<extra></extra>",
+        ), row=1, col=1)
+        fig.add_trace(go.Scatter(
+            x=pts, y=[div["price1"], div["price2"]], mode="lines",
+            line=dict(color="red", width=2, dash="dash"), showlegend=False, hoverinfo="skip",
+        ), row=1, col=1)
+        fig.add_trace(go.Scatter(
+            x=pts, y=[div["macd1"], div["macd2"]], mode="markers+text",
+            marker=dict(size=10, color="green", symbol="diamond"),
+            text=[f"MACD: {div['macd1']:.4f}", f"MACD: {div['macd2']:.4f}"],
+            textposition="top center", name="MACD低点",
+            hovertemplate="<b>%{text}</b><br>日期: %{x}<br>MACD: %{y:.4f}<extra></extra>",
+        ), row=2, col=1)
+        fig.add_trace(go.Scatter(
+            x=pts, y=[div["macd1"], div["macd2"]], mode="lines",
+            line=dict(color="green", width=2, dash="dash"), showlegend=False, hoverinfo="skip",
+        ), row=2, col=1)
+
+    fig.update_layout(
+        height=600,
+        title_text=f"{'底背离可视化' if div else '价格与均线'} - {stock_name}",
+        hovermode="x unified",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+    )
+    fig.update_yaxes(title_text="价格", row=1, col=1)
+    fig.update_yaxes(title_text="MACD", row=2, col=1)
+    return fig
+
+
+def cached_figure(symbol: str, last_date, df: pd.DataFrame, div=None, stock_name: str = "",
+                  max_points: int = MAX_POINTS):
+    """
+    按 (股票, 最后一根K线, K线根数, 背离低点, 点数上限) 记忆，进程内所有会话共用，LRU 淘汰
+    返回同一个 Figure 对象，调用方不要原地修改
+    """
+    key = (symbol, str(last_date), len(df), stock_name, max_points,
+           (str(div["date1"]), str(div["date2"])) if div else None)
+    with _figures_lock:
+        fig = _figures.get(key)
+        if fig is not None:
+            _figures.move_to_end(key)
+            return fig
+    mark_miss()
+    fig = divergence_figure(df, div, stock_name, max_points)
+    with _figures_lock:
+        _figures[key] = fig
+        while len(_figures) > FIGURE_MEMO_SIZE:
+            _figures.popitem(last=False)
+    return fig
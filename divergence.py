@@ -0,0 +1,271 @@
+"""
+通用背离引擎
+底背离 / 顶背离、任意指标列、窗口内所有合格的拐点对一次向量化比较；
+权重、阈值、级别划分都写在规则字典里，可以从 JSON 文件载入
+BOTTOM_RULE 是底背离阈值的唯一出处：backtest.DEFAULT_PARAMS（回测 / 监控 / 面板 / 参数扫描）和
+comprehensive_divergence_analysis 的默认参数都由 rule_params(BOTTOM_RULE) 推出，pairs="last" 时结论逐项一致
+用法：python divergence.py --universe all --kind both --pairs all --out divergences.csv
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from analysis import NS_PER_DAY, local_low_positions, space_positions
+
+# ---------- 规则 ----------
+# signals 里每一项是一个判定：
+#   test="diverge"      指标在两个拐点间与价格反向（底背离：价格新低、指标抬高；顶背离反之）
+#   test="ratio_below"  后一拐点 / 前一拐点 的比值低于 threshold（如成交量配合）
+#   test="move_beyond"  价格从前一拐点再向同方向走出 threshold 以上（如有效新低）
+#   core=True 的判定计入“核心信号数”，按 levels 自上而下取第一个 min_core 满足的级别，
+#   置信度 = min(权重和 * scale, cap)
+BOTTOM_RULE = {
+    "kind": "bottom",
+    "price": "close",
+    "lookback": 150,
+    "window": 5,
+    "min_days": 10,
+    "max_days": None,
+    "min_signals": 2,
+    "signals": [
+        {"name": "MACD柱状线背离", "column": "macd", "test": "diverge", "weight": 0.3, "core": True},
+        {"name": "DIF线背离", "column": "macd_dif", "test": "diverge", "weight": 0.3, "core": True},
+        {"name": "RSI背离", "column": "rsi", "test": "diverge", "weight": 0.2},
+        {"name": "成交量配合", "column": "volume", "test": "ratio_below", "threshold": 1.5, "weight": 0.1},
+        {"name": "价格有效新低", "column": "close", "test": "move_beyond", "threshold": 0.03, "weight": 0.1},
+    ],
+    "levels": [
+        {"name": "强烈背离", "min_core": 2, "scale": 1.0, "cap": 0.95},
+        {"name": "小背离", "min_core": 1, "scale": 0.8, "cap": 0.8},
+        {"name": "普通背离", "min_core": 0, "scale": 0.6, "cap": 0.7},
+    ],
+}
+
+TOP_RULE = {
+    **BOTTOM_RULE,
+    "kind": "top",
+    "signals": [
+        {"name": "MACD柱状线顶背离", "column": "macd", "test": "diverge", "weight": 0.3, "core": True},
+        {"name": "DIF线顶背离", "column": "macd_dif", "test": "diverge", "weight": 0.3, "core": True},
+        {"name": "RSI顶背离", "column": "rsi", "test": "diverge", "weight": 0.2},
+        {"name": "成交量萎缩", "column": "volume", "test": "ratio_below", "threshold": 1.0, "weight": 0.1},
+        {"name": "价格有效新高", "column": "close", "test": "move_beyond", "threshold": 0.03, "weight": 0.1},
+    ],
+    "levels": [
+        {"name": "强烈顶背离", "min_core": 2, "scale": 1.0, "cap": 0.95},
+        {"name": "小顶背离", "min_core": 1, "scale": 0.8, "cap": 0.8},
+        {"name": "普通顶背离", "min_core": 0, "scale": 0.6, "cap": 0.7},
+    ],
+}
+
+RULES = {"bottom": BOTTOM_RULE, "top": TOP_RULE}
+
+# 扁平参数里各判定对应的 (权重键, 阈值键)
+PARAM_KEYS = {
+    ("macd", "diverge"): ("w_macd", None),
+    ("macd_dif", "diverge"): ("w_dif", None),
+    ("rsi", "diverge"): ("w_rsi", None),
+    ("volume", "ratio_below"): ("w_volume", "vol_ratio"),
+    ("close", "move_beyond"): ("w_drop", "price_drop"),
+}
+RESULT_COLUMNS = [
+    "symbol", "kind", "level", "confidence", "n_signals", "core", "signals",
+    "date1", "date2", "price1", "price2", "span_days",
+]
+
+
+def load_rules(path: str) -> list:
+    """JSON 文件：单个规则或规则列表；未写的键沿用同 kind 的默认规则"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data = data if isinstance(data, list) else [data]
+    return [{**RULES[r.get("kind", "bottom")], **r} for r in data]
+
+
+def rule_params(rule: dict = None) -> dict:
+    """
+    规则 → backtest.score_pairs 用的扁平参数，即 DEFAULT_PARAMS 的来源
+    levels 为 ((级别名, min_core, scale, cap), ...)，自上而下取第一个满足的
+    """
+    rule = {**BOTTOM_RULE, **(rule or {})}
+    p = {k: rule[k] for k in ("lookback", "window", "min_days", "min_signals")}
+    for sig in rule["signals"]:
+        weight_key, threshold_key = PARAM_KEYS[(sig["column"], sig["test"])]
+        p[weight_key] = sig["weight"]
+        if threshold_key:
+            p[threshold_key] = sig["threshold"]
+    p["levels"] = tuple((lv["name"], lv["min_core"], lv["scale"], lv["cap"]) for lv in rule["levels"])
+    return p
+
+
+# ---------- 单只 ----------
+def _window(df: pd.DataFrame, lookback):
+    df = df.sort_index()
+    if lookback:
+        df = df.tail(lookback)
+    df = df.reset_index()
+    dates = df["date"] if "date" in df.columns else df[df.columns[0]]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates)
+    return df, dates
+
+
+def pivot_positions(prices: np.ndarray, day_ns: np.ndarray, kind: str = "bottom", window: int = 5,
+                    min_days: int = 10) -> np.ndarray:
+    """底背离取局部低点、顶背离取局部高点，再按 min_days 贪心间隔过滤"""
+    sign = 1.0 if kind == "bottom" else -1.0
+    pos = local_low_positions(sign * np.asarray(prices, dtype=float), window)
+    return space_positions(pos, day_ns, min_days)
+
+
+def detect(df: pd.DataFrame, rule: dict = None, pairs: str = "all") -> pd.DataFrame:
+    """
+    df 需已含规则里用到的指标列
+    pairs="last"：只比较最后两个拐点（与原版一致）；pairs="all"：窗口内所有拐点对
+    返回每个成立的背离一行，列见 RESULT_COLUMNS（不含 symbol）外加每个判定一列布尔值
+    """
+    rule = {**BOTTOM_RULE, **(rule or {})}
+    sign = 1.0 if rule["kind"] == "bottom" else -1.0
+    win, dates = _window(df, rule["lookback"])
+    day_ns = dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    price = win[rule["price"]].to_numpy(dtype=float)
+    piv = pivot_positions(price, day_ns, rule["kind"], rule["window"], rule["min_days"])
+    if len(piv) < 2:
+        return pd.DataFrame(columns=RESULT_COLUMNS[1:])
+
+    if pairs == "last":
+        i, j = np.array([len(piv) - 2]), np.array([len(piv) - 1])
+    elif pairs == "all":
+        i, j = np.triu_indices(len(piv), 1)
+    else:
+        raise ValueError(f"未知 pairs: {pairs}")
+    a, b = piv[i], piv[j]
+
+    span = (day_ns[b] - day_ns[a]) // NS_PER_DAY
+    ok = sign * price[b] < sign * price[a]                      # 价格创新低 / 新高
+    if rule["max_days"]:
+        ok &= span <= rule["max_days"]
+
+    hits = {}
+    score = np.zeros(len(a))
+    n_signals = np.zeros(len(a), dtype=np.int64)
+    core = np.zeros(len(a), dtype=np.int64)
+    for sig in rule["signals"]:
+        x = win[sig["column"]].to_numpy(dtype=float)
+        x1, x2 = x[a], x[b]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if sig["test"] == "diverge":
+                hit = sign * x2 > sign * x1
+            elif sig["test"] == "ratio_below":
+                hit = np.where(x1 > 0, x2 / x1, 1.0) < sig["threshold"]
+            elif sig["test"] == "move_beyond":
+                hit = sign * (x1 - x2) / x1 > sig["threshold"]
+            else:
+                raise ValueError(f"未知判定: {sig['test']}")
+        hits[sig["name"]] = hit
+        score = score + sig["weight"] * hit
+        n_signals += hit
+        if sig.get("core"):
+            core += hit
+    ok &= n_signals >= rule["min_signals"]
+
+    level = np.full(len(a), None, dtype=object)
+    confidence = np.full(len(a), np.nan)
+    for lv in reversed(rule["levels"]):                          # 倒序覆盖，最终留下第一个满足的级别
+        m = core >= lv["min_core"]
+        level[m] = lv["name"]
+        confidence[m] = np.minimum(score[m] * lv["scale"], lv["cap"])
+
+    t = np.flatnonzero(ok)
+    names = list(hits)
+    out = pd.DataFrame({
+        "kind": rule["kind"],
+        "level": level[t],
+        "confidence": confidence[t],
+        "n_signals": n_signals[t],
+        "core": core[t],
+        "signals": [",".join(n for n in names if hits[n][k]) for k in t],
+        "date1": dates.to_numpy()[a[t]],
+        "date2": dates.to_numpy()[b[t]],
+        "price1": price[a[t]],
+        "price2": price[b[t]],
+        "span_days": span[t],
+    })
+    for n in names:
+        out[n] = hits[n][t]
+    return out
+
+
+def detect_all(df: pd.DataFrame, rules=(BOTTOM_RULE, TOP_RULE), pairs: str = "all") -> pd.DataFrame:
+    parts = [detect(df, r, pairs) for r in rules]
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame(columns=RESULT_COLUMNS[1:])
+    return pd.concat(parts, ignore_index=True)
+
+
+# ---------- 全市场 ----------
+def scan(symbols, rules=(BOTTOM_RULE, TOP_RULE), pairs: str = "all", refresh: bool = True,
+         backend: str = "fast", progress=None) -> pd.DataFrame:
+    """逐只取数 + 算指标 + 检测，汇总所有背离；按后一拐点日期、置信度降序"""
+    from analysis import compute_enhanced_indicators
+    from bar_cache import get_cache
+    symbols = list(dict.fromkeys(symbols))
+    cache = get_cache()
+    if refresh:
+        cache.refresh_many(symbols)
+    lookback = max(r.get("lookback") or 0 for r in rules) or None
+    parts = []
+    for k, sym in enumerate(symbols, 1):
+        df = cache.read(sym)
+        if lookback:
+            df = df.tail(lookback)
+        if not df.empty:
+            found = detect_all(compute_enhanced_indicators(df, backend=backend), rules, pairs)
+            if not found.empty:
+                parts.append(found.assign(symbol=sym))
+        if progress:
+            progress(k, len(symbols))
+    if not parts:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    out = pd.concat(parts, ignore_index=True)
+    out = out[RESULT_COLUMNS + [c for c in out.columns if c not in RESULT_COLUMNS]]
+    return out.sort_values(["date2", "confidence"], ascending=False, kind="stable").reset_index(drop=True)
+
+
+# ---------- 命令行 ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="通用背离扫描（底背离 / 顶背离，全部拐点对）")
+    parser.add_argument("symbols", nargs="*", help="指定代码；留空则用 --universe")
+    parser.add_argument("--universe", choices=["watchlist", "all"], default="watchlist")
+    parser.add_argument("--kind", choices=["bottom", "top", "both"], default="both")
+    parser.add_argument("--pairs", choices=["last", "all"], default="all")
+    parser.add_argument("--rules", help="JSON 规则文件，覆盖 --kind")
+    parser.add_argument("--offline", action="store_true", help="只用本地缓存，不联网")
+    parser.add_argument("--out", help="结果保存为 CSV")
+    args = parser.parse_args(argv)
+
+    from analysis import normalize_symbol
+    from screener import load_universe
+    symbols = [normalize_symbol(s) for s in args.symbols] or load_universe(args.universe)
+    if args.rules:
+        rules = load_rules(args.rules)
+    else:
+        rules = [BOTTOM_RULE, TOP_RULE] if args.kind == "both" else [RULES[args.kind]]
+
+    def _progress(done, total):
+        print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    result = scan(symbols, rules, args.pairs, refresh=not args.offline, progress=_progress)
+    print(file=sys.stderr)
+    print(result[RESULT_COLUMNS].head(50).to_string(index=False) if not result.empty else "未检测到背离")
+    if args.out:
+        result.to_csv(args.out, index=False, encoding="utf-8-sig")
+    return result
+
+
+if __name__ == "__main__":
+    main()
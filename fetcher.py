@@ -0,0 +1,226 @@
+"""
+异步并发取数层
+包装在用的 akshare 接口，提供并发上限、令牌桶限速、超时、指数退避重试，
+并把同一时刻对同一请求的重复调用合并成一次网络访问
+阻塞调用跑在模块级的长驻线程池里：超时后 asyncio.run 不会等卡住的线程，调用方按时返回；
+同步入口共用一个 AsyncFetcher，限速和合并跨调用、跨会话生效
+"""
+import asyncio
+import functools
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEFAULT_CONCURRENCY = 8          # 同时在途的请求数
+DEFAULT_RATE = 5.0               # 每秒放行的请求数（新浪接口抓太快会封 IP）
+DEFAULT_BURST = 10
+DEFAULT_TIMEOUT = 30.0           # 单次请求超时（秒）
+DEFAULT_RETRIES = 3
+EXECUTOR_WORKERS = 32            # 长驻线程数；超时卡住的调用会占着线程直到自己结束
+
+_executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="fetcher")
+
+
+class TokenBucket:
+    """令牌桶：平均 rate 次/秒，最多攒 burst 个令牌；不绑定事件循环，多个线程 / 循环共用"""
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """预定一个令牌，返回还要等多少秒；令牌可以预支成负数，后来的依次排在后面"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AsyncFetcher:
+    """
+    所有阻塞调用放到模块级线程池执行；run() 是通用入口，下面几个方法是常用 akshare 接口的包装
+    可跨多次 asyncio.run、跨线程复用：令牌桶和在途请求表是全局的，并发信号量按事件循环各建一个
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_CONCURRENCY, rate: float = DEFAULT_RATE,
+                 burst: int = DEFAULT_BURST, timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 backoff: float = 0.5, max_backoff: float = 8.0, api=None):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._api = api
+        self._bucket = TokenBucket(rate, burst)
+        self._sems = weakref.WeakKeyDictionary()        # 事件循环 -> Semaphore
+        self._inflight = {}                             # key -> concurrent.futures.Future
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0, "retries": 0, "failures": 0}
+
+    @property
+    def api(self):
+        """默认是 akshare 模块；测试时可传入任意带同名函数的对象"""
+        if self._api is None:
+            import akshare
+            self._api = akshare
+        return self._api
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Semaphore 绑定事件循环，每个循环（每次 asyncio.run）各用一个
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            sem = self._sems.get(loop)
+            if sem is None:
+                sem = self._sems[loop] = asyncio.Semaphore(self.max_concurrency)
+            return sem
+
+    async def _attempt(self, fn, args, kwargs):
+        loop = asyncio.get_running_loop()
+        sem = self._semaphore()
+        call = functools.partial(fn, *args, **kwargs)
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            async with sem:
+                await self._bucket.acquire()
+                try:
+                    self.stats["calls"] += 1
+                    # 超时只是不再等待，已进入线程的调用会在后台跑完，不拖住事件循环的退出
+                    return await asyncio.wait_for(loop.run_in_executor(_executor, call), self.timeout)
+                except Exception:
+                    if attempt == self.retries:
+                        self.stats["failures"] += 1
+                        raise
+            self.stats["retries"] += 1
+            await asyncio.sleep(min(delay, self.max_backoff) * random.uniform(0.5, 1.0))
+            delay *= 2
+
+    def _settle(self, key, future: Future, task: asyncio.Task):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    async def run(self, key, fn, *args, **kwargs):
+        """
+        限速 + 重试地执行 fn(*args, **kwargs)
+        key 相同且上一次还没返回时（哪怕是别的线程发起的），直接等待同一个结果
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if owner:
+            task = asyncio.ensure_future(self._attempt(fn, args, kwargs))
+            task.add_done_callback(functools.partial(self._settle, key, future))
+        # shield：某个等待方被取消不影响其他共享这个请求的调用方
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def call(self, name: str, **kwargs):
+        """按函数名调用 api，kwargs 同时作为合并请求的键"""
+        key = (name, tuple(sorted(kwargs.items())))
+        return await self.run(key, getattr(self.api, name), **kwargs)
+
+    # ----- 在用的 akshare 接口 -----
+    async def stock_zh_a_daily(self, symbol: str, start_date: str = "19900101",
+                               end_date: str = "21000118", adjust: str = ""):
+        return await self.call("stock_zh_a_daily", symbol=symbol, start_date=start_date,
+                               end_date=end_date, adjust=adjust)
+
+    async def stock_zh_index_daily(self, symbol: str):
+        return await self.call("stock_zh_index_daily", symbol=symbol)
+
+    async def stock_info_a_code_name(self):
+        return await self.call("stock_info_a_code_name")
+
+    async def stock_individual_info_em(self, symbol: str):
+        return await self.call("stock_individual_info_em", symbol=symbol)
+
+    async def gather(self, coros) -> list:
+        """并发执行，单个失败以异常对象返回，不影响其他"""
+        return await asyncio.gather(*coros, return_exceptions=True)
+
+
+# ---------- 同步入口（Streamlit 脚本线程里没有事件循环，可以直接用） ----------
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def _after_fork():
+    # 子进程里没有父进程的线程，父进程的在途请求也永远不会完成：线程池和共享取数器都重建
+    global _executor, _fetcher, _fetcher_lock
+    _executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="fetcher")
+    _fetcher = None
+    _fetcher_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def get_fetcher() -> AsyncFetcher:
+    """进程内共享的取数器：所有同步入口共用同一个令牌桶和在途请求表"""
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = AsyncFetcher()
+    return _fetcher
+
+
+def fetch_many(requests, fetcher: AsyncFetcher = None) -> list:
+    """
+    requests: [(接口名, {参数}), ...]，按顺序返回结果；失败的位置是异常对象
+    例：fetch_many([("stock_zh_index_daily", {"symbol": "sh000001"}), ...])
+    """
+    fetcher = fetcher or get_fetcher()
+
+    async def _all():
+        return await fetcher.gather(fetcher.call(name, **kwargs) for name, kwargs in requests)
+
+    return asyncio.run(_all())
+
+
+def fetch_one(name: str, fetcher: AsyncFetcher = None, **kwargs):
+    """单个 akshare 接口调用，限速、超时、重试、合并同 fetch_many；失败直接抛出"""
+    fetcher = fetcher or get_fetcher()
+    return asyncio.run(fetcher.call(name, **kwargs))
+
+
+def run_one(key, fn, *args, fetcher: AsyncFetcher = None, **kwargs):
+    """单个阻塞调用走取数层，同 run_many；失败直接抛出"""
+    fetcher = fetcher or get_fetcher()
+    return asyncio.run(fetcher.run(key, fn, *args, **kwargs))
+
+
+def run_many(jobs, fetcher: AsyncFetcher = None) -> list:
+    """
+    jobs: [(key, fn, args), ...]，任意阻塞函数批量并发执行，共享限速和重试策略
+    """
+    fetcher = fetcher or get_fetcher()
+
+    async def _all():
+        return await fetcher.gather(fetcher.run(key, fn, *args) for key, fn, args in jobs)
+
+    return asyncio.run(_all())
@@ -0,0 +1,134 @@
+"""
+指数行情服务
+仪表板用：一个进程内共享的指数缓存，所有浏览器会话共用同一个实例
+底层复用 BarCache：落盘、按品种加锁、收盘后才增量补拉；N 个会话同时打开仪表板，
+每个指数每个收盘仍只联网一次
+监控哪些指数写在 data/indices.json（代码列表或 {代码: 名称}），没有就用 DEFAULT_INDICES
+"""
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from bar_cache import BarCache
+
+INDEX_CACHE_DIR = os.path.join("data", "index_bars")
+CONFIG_FILE = os.path.join("data", "indices.json")
+INDEX_NAMES = {
+    "sh000001": "上证指数",
+    "sz399001": "深证成指",
+    "sz399006": "创业板指",
+    "sh000300": "沪深300",
+    "sh000905": "中证500",
+    "sh000688": "科创50",
+}
+DEFAULT_INDICES = ("sh000001", "sz399001")
+SUMMARY_COLUMNS = ["代码", "名称", "日期", "收盘", "日涨跌", "近5日", "近20日", "年初至今", "距60日高点", "20日年化波动"]
+
+
+def akshare_index_source(symbol: str, start_date: str, end_date: str, adjust: str = None) -> pd.DataFrame:
+    """东财指数日线，支持起止日期，增量补拉只下载缺的几天；adjust 对指数无意义，只为与 BarCache 数据源同签名"""
+    import akshare as ak
+    return ak.stock_zh_index_daily_em(symbol=symbol, start_date=start_date, end_date=end_date)
+
+
+def load_indices(path: str = CONFIG_FILE) -> dict:
+    """{代码: 名称}，按配置文件顺序"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        data = list(DEFAULT_INDICES)
+    if isinstance(data, dict):
+        return {code: name or INDEX_NAMES.get(code, code) for code, name in data.items()}
+    return {code: INDEX_NAMES.get(code, code) for code in data}
+
+
+def save_indices(indices, path: str = CONFIG_FILE):
+    indices = indices if isinstance(indices, dict) else {c: INDEX_NAMES.get(c, c) for c in indices}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(indices, f, ensure_ascii=False, indent=2)
+
+
+# ---------- 指标 ----------
+def summarize(frames: dict, names: dict = None) -> pd.DataFrame:
+    """
+    frames: {代码: 日线}；每个指数一行：最新收盘、日 / 5 日 / 20 日涨跌、年初至今、距 60 日最高、20 日年化波动
+    K线不够的项为 NaN
+    """
+    names = names or {}
+    rows = []
+    for code, df in frames.items():
+        if df is None or df.empty:
+            continue
+        close = df["close"].to_numpy(dtype=float)
+        high = df["high"].to_numpy(dtype=float) if "high" in df.columns else close
+        dates = pd.to_datetime(df["date"])
+        last = close[-1]
+
+        def change(k):
+            return last / close[-1 - k] - 1 if len(close) > k else np.nan
+
+        prev_year = close[(dates.dt.year < dates.iloc[-1].year).to_numpy()]
+        rets = np.diff(np.log(close[-21:]))
+        rows.append({
+            "代码": code,
+            "名称": names.get(code, INDEX_NAMES.get(code, code)),
+            "日期": dates.iloc[-1].strftime("%Y-%m-%d"),
+            "收盘": last,
+            "日涨跌": change(1),
+            "近5日": change(5),
+            "近20日": change(20),
+            "年初至今": last / prev_year[-1] - 1 if len(prev_year) else np.nan,
+            "距60日高点": last / high[-60:].max() - 1,
+            "20日年化波动": rets.std(ddof=1) * np.sqrt(252) if len(rets) >= 20 else np.nan,
+        })
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+
+# ---------- 服务 ----------
+class IndexService:
+    """
+    线程安全：不同指数互不阻塞，同一指数的并发请求由 BarCache 的品种锁合并成一次联网
+    """
+
+    def __init__(self, indices: dict = None, cache: BarCache = None):
+        self.indices = dict(indices) if indices is not None else load_indices()
+        self.cache = cache or BarCache(INDEX_CACHE_DIR, source=akshare_index_source)
+        self._lock = threading.Lock()
+
+    def set_indices(self, indices):
+        with self._lock:
+            self.indices = indices if isinstance(indices, dict) else {c: INDEX_NAMES.get(c, c) for c in indices}
+
+    def bars(self, code: str, n: int = None, refresh: bool = True) -> pd.DataFrame:
+        """最近 n 根日线；本地已是最新（收盘后查过）时只读内存 / 磁盘"""
+        return self.cache.get(code, n=n, adjust=None, refresh=refresh)
+
+    def refresh_all(self, codes=None) -> dict:
+        """并发补齐指数（默认全部配置的），返回 {代码: DataFrame 或异常}；盘后任务调用"""
+        return self.cache.refresh_many(list(codes or self.indices), adjust=None)
+
+    def frames(self, codes=None, n: int = None) -> dict:
+        """{代码: 最近 n 根日线 或 异常}；过期的一起并发补拉"""
+        got = self.refresh_all(codes)
+        return {code: df.tail(n) if n and isinstance(df, pd.DataFrame) else df for code, df in got.items()}
+
+    def summary(self, frames: dict = None) -> pd.DataFrame:
+        frames = self.frames() if frames is None else frames
+        return summarize({c: f for c, f in frames.items() if isinstance(f, pd.DataFrame)}, {**INDEX_NAMES, **self.indices})
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> IndexService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = IndexService()
+        return _service
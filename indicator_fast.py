@@ -0,0 +1,210 @@
+"""
+单遍融合的指标内核
+在连续 float64 数组上一次算完 compute_enhanced_indicators 的全部指标，写进预分配的 (n, 12) 输出块；
+装了 numba 就 JIT 编译成单循环（输入含 NaN 时除外），否则退回 NumPy 向量化实现
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from indicator_stream import INDICATOR_COLUMNS
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+(COL_DIF, COL_SIGNAL, COL_MACD, COL_K, COL_D, COL_J, COL_RSI,
+ COL_MA5, COL_MA10, COL_MA20, COL_VMA5, COL_VMA10) = range(len(INDICATOR_COLUMNS))
+
+
+# ---------- 单循环内核（numba 编译用） ----------
+def _window_mean(x, i, w):
+    s = 0.0
+    for k in range(i - w + 1, i + 1):
+        s += x[k]
+    return s / w
+
+
+def _fused_loop(close, high, low, volume, out):
+    n = close.shape[0]
+    nan = np.nan
+    a_fast, a_slow, a_sign, a_rsi = 2.0 / 13.0, 2.0 / 27.0, 2.0 / 10.0, 1.0 / 14.0
+    ema_fast = ema_slow = ema_sign = up = dn = 0.0
+    n_sign = 0
+    for i in range(n):
+        c = close[i]
+
+        # MACD(12, 26, 9)：信号线从 MACD 线第一个有效值开始递推
+        if i == 0:
+            ema_fast = c
+            ema_slow = c
+        else:
+            ema_fast += a_fast * (c - ema_fast)
+            ema_slow += a_slow * (c - ema_slow)
+        signal = nan
+        hist = nan
+        if i >= 25:
+            line = ema_fast - ema_slow
+            if n_sign == 0:
+                ema_sign = line
+            else:
+                ema_sign += a_sign * (line - ema_sign)
+            n_sign += 1
+            if n_sign >= 9:
+                signal = ema_sign
+                hist = line - ema_sign
+        out[i, 0] = hist
+        out[i, 1] = signal
+        out[i, 2] = hist - signal
+
+        # KDJ(9, 3)
+        k = nan
+        if i >= 8:
+            lo = low[i]
+            hi = high[i]
+            for j in range(i - 8, i):
+                if low[j] < lo:
+                    lo = low[j]
+                if high[j] > hi:
+                    hi = high[j]
+            rng = hi - lo
+            if rng != 0.0:
+                k = 100.0 * (c - lo) / rng
+            elif c != lo:
+                k = np.inf if c > lo else -np.inf
+        out[i, 3] = k
+        d = nan
+        if i >= 10:
+            d = (out[i - 2, 3] + out[i - 1, 3] + k) / 3.0
+        out[i, 4] = d
+        out[i, 5] = 3.0 * k - 2.0 * d
+
+        # RSI(14)，Wilder 平滑，首根K线涨跌记 0
+        if i > 0:
+            diff = c - close[i - 1]
+            up += a_rsi * ((diff if diff > 0 else 0.0) - up)
+            dn += a_rsi * ((-diff if diff < 0 else 0.0) - dn)
+        if i < 13:
+            out[i, 6] = nan
+        elif dn == 0.0:
+            out[i, 6] = 100.0
+        else:
+            out[i, 6] = 100.0 - 100.0 / (1.0 + up / dn)
+
+        # 均线 / 量均线：窗口内直接求和，不累积误差
+        out[i, 7] = _window_mean(close, i, 5) if i >= 4 else nan
+        out[i, 8] = _window_mean(close, i, 10) if i >= 9 else nan
+        out[i, 9] = _window_mean(close, i, 20) if i >= 19 else nan
+        out[i, 10] = _window_mean(volume, i, 5) if i >= 4 else nan
+        out[i, 11] = _window_mean(volume, i, 10) if i >= 9 else nan
+
+
+if njit is not None:
+    _window_mean = njit(cache=True)(_window_mean)
+    _fused_loop = njit(cache=True)(_fused_loop)
+
+
+# ---------- NumPy 退路 ----------
+# 输入可以是一维（单只股票）或二维（日期 × 股票，按列各自独立计算），时间轴都是第 0 维
+def _rolling(x, w, how, out_col):
+    out_col[:w - 1] = np.nan
+    if len(x) >= w:
+        view = sliding_window_view(x, w, axis=0)
+        getattr(view, how)(axis=-1, out=out_col[w - 1:])
+
+
+def _ewm(x, **kw):
+    # pandas 的 ewm 是 C 实现的递推，和 ta 的结果逐位一致；二维时逐列递推
+    obj = pd.DataFrame(x, copy=False) if x.ndim == 2 else pd.Series(x, copy=False)
+    return obj.ewm(adjust=False, **kw).mean().to_numpy()
+
+
+def _numpy_kernel(close, high, low, volume, out):
+    line = _ewm(close, span=12, min_periods=12) - _ewm(close, span=26, min_periods=26)
+    signal = _ewm(line, span=9, min_periods=9)
+    np.subtract(line, signal, out=out[:, COL_DIF])
+    out[:, COL_SIGNAL] = signal
+    np.subtract(out[:, COL_DIF], signal, out=out[:, COL_MACD])
+
+    lo = np.empty_like(close)
+    hi = np.empty_like(close)
+    _rolling(low, 9, "min", lo)
+    _rolling(high, 9, "max", hi)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(100.0 * (close - lo), hi - lo, out=out[:, COL_K])
+    _rolling(out[:, COL_K], 3, "mean", out[:, COL_D])
+    np.subtract(3.0 * out[:, COL_K], 2.0 * out[:, COL_D], out=out[:, COL_J])
+
+    diff = np.diff(close, axis=0, prepend=np.nan)
+    listed = np.maximum.accumulate(~np.isnan(close), axis=0)      # 开头的空行（尚未上市）不计入 RSI 平滑
+    up = _ewm(np.where(listed, np.where(diff > 0, diff, 0.0), np.nan), alpha=1 / 14, min_periods=14)
+    dn = _ewm(np.where(listed, np.where(diff < 0, -diff, 0.0), np.nan), alpha=1 / 14, min_periods=14)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[:, COL_RSI] = np.where(dn == 0, 100.0, 100.0 - 100.0 / (1.0 + up / dn))
+
+    for w, col in ((5, COL_MA5), (10, COL_MA10), (20, COL_MA20)):
+        _rolling(close, w, "mean", out[:, col])
+    for w, col in ((5, COL_VMA5), (10, COL_VMA10)):
+        _rolling(volume, w, "mean", out[:, col])
+
+
+# ---------- 入口 ----------
+def compute_indicator_block(close, high, low, volume, out=None) -> np.ndarray:
+    """
+    输入四个等长一维数组，返回 (n, 12) float64 块，列顺序同 INDICATOR_COLUMNS
+    块按列存储（Fortran 序），每列连续，可零拷贝交给 DataFrame；批量扫描时 out 可传入复用的预分配数组
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    high = np.ascontiguousarray(high, dtype=np.float64)
+    low = np.ascontiguousarray(low, dtype=np.float64)
+    volume = np.ascontiguousarray(volume, dtype=np.float64)
+    n = len(close)
+    if out is None:
+        out = np.empty((n, len(INDICATOR_COLUMNS)), dtype=np.float64, order="F")
+    if njit is not None and not (np.isnan(close).any() or np.isnan(high).any()
+                                 or np.isnan(low).any() or np.isnan(volume).any()):
+        _fused_loop(close, high, low, volume, out)
+    else:
+        _numpy_kernel(close, high, low, volume, out)
+    return out
+
+
+def compute_indicator_panel(close, high, low, volume) -> dict:
+    """
+    二维版本：输入 (日期, 股票) 矩阵，每列是一只股票的连续K线，开头可以是 NaN（尚未上市）
+    返回 {指标名: (日期, 股票) 矩阵}，各矩阵在一块连续内存里，互不重叠
+    """
+    close = np.asarray(close, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+    out = np.empty((len(INDICATOR_COLUMNS),) + close.shape).transpose(1, 0, 2)
+    _numpy_kernel(close, high, low, volume, out)
+    return {col: out[:, i] for i, col in enumerate(INDICATOR_COLUMNS)}
+
+
+def _copy_on_write() -> bool:
+    """pandas 3 起总是写时复制；2.x 要看 mode.copy_on_write 开没开"""
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    try:
+        return pd.get_option("mode.copy_on_write") is True
+    except KeyError:
+        return False
+
+
+def compute_indicators_fast(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    compute_enhanced_indicators(backend="fast") 的实现：返回新表，不改动入参
+    写时复制生效时原有列与入参共享内存，否则复制一份，两边原地修改互不影响
+    """
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    block = compute_indicator_block(df["close"].to_numpy(), df["high"].to_numpy(),
+                                    df["low"].to_numpy(), df["volume"].to_numpy())
+    # 指标列是新算的块，直接以视图方式装进结果；原有列只在没有写时复制时才复制
+    share = _copy_on_write()
+    cols = {c: df[c] if share else df[c].copy() for c in df.columns if c not in INDICATOR_COLUMNS}
+    cols.update(zip(INDICATOR_COLUMNS, block.T))
+    return pd.DataFrame(cols, index=df.index, copy=False)
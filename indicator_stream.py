@@ -0,0 +1,250 @@
+"""
+增量指标引擎
+按股票保存 EMA / Wilder-RSI / 滑动窗口 / 随机指标的状态，每来一根新K线 O(1) 更新全部指标列，
+结果与 compute_enhanced_indicators 的批量计算在浮点误差内一致
+"""
+import os
+import pickle
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+INDICATOR_COLUMNS = [
+    "macd_dif", "macd_signal", "macd", "kdj_k", "kdj_d", "kdj_j",
+    "rsi", "ma5", "ma10", "ma20", "volume_ma5", "volume_ma10",
+]
+STATE_FILE = os.path.join("data", "indicator_state.pkl")
+NAN = float("nan")
+
+
+# ---------- 基础状态 ----------
+class _Ema:
+    """pandas ewm(adjust=False, min_periods=...) 的递推版，开头的 NaN 跳过不计数"""
+    __slots__ = ("alpha", "min_periods", "value", "count")
+
+    def __init__(self, alpha: float, min_periods: int):
+        self.alpha = alpha
+        self.min_periods = min_periods
+        self.value = NAN
+        self.count = 0
+
+    def update(self, x: float) -> float:
+        if x != x:                                      # NaN：跳过，维持原值
+            return self.value if self.count >= self.min_periods else NAN
+        self.value = x if self.count == 0 else self.value + self.alpha * (x - self.value)
+        self.count += 1
+        return self.value if self.count >= self.min_periods else NAN
+
+    def peek(self, x: float) -> float:
+        """假如喂入 x 的结果，不改状态"""
+        if x != x:
+            return self.value if self.count >= self.min_periods else NAN
+        value = x if self.count == 0 else self.value + self.alpha * (x - self.value)
+        return value if self.count + 1 >= self.min_periods else NAN
+
+
+class _RollingMean:
+    """定长窗口均值，窗口未满为 NaN"""
+    __slots__ = ("window", "buf")
+
+    def __init__(self, window: int):
+        self.window = window
+        self.buf = deque(maxlen=window)
+
+    def update(self, x: float) -> float:
+        self.buf.append(x)
+        if len(self.buf) < self.window:
+            return NAN
+        return sum(self.buf) / self.window
+
+    def peek(self, x: float) -> float:
+        if len(self.buf) + 1 < self.window:
+            return NAN
+        vals = list(self.buf)[len(self.buf) + 1 - self.window:]    # 与 update 同样的求和顺序，结果逐位一致
+        vals.append(x)
+        return sum(vals) / self.window
+
+
+class _RollingExtreme:
+    """单调队列求滑动窗口最小/最大值，均摊 O(1)"""
+    __slots__ = ("window", "sign", "q", "i")
+
+    def __init__(self, window: int, is_max: bool):
+        self.window = window
+        self.sign = -1.0 if is_max else 1.0
+        self.q = deque()                                # (位置, sign*值)，值单调递增
+        self.i = 0
+
+    def update(self, x: float) -> float:
+        v = self.sign * x
+        while self.q and self.q[-1][1] >= v:
+            self.q.pop()
+        self.q.append((self.i, v))
+        if self.q[0][0] <= self.i - self.window:
+            self.q.popleft()
+        self.i += 1
+        if self.i < self.window:
+            return NAN
+        return self.sign * self.q[0][1]
+
+    def peek(self, x: float) -> float:
+        if self.i + 1 < self.window:
+            return NAN
+        v = self.sign * x
+        # 队列值单调递增，窗口内第一个元素就是最值；新位置 i 进来后最多挤掉队首一个
+        head = self.q[0] if self.q[0][0] > self.i - self.window else (self.q[1] if len(self.q) > 1 else None)
+        return self.sign * (v if head is None else min(head[1], v))
+
+
+# ---------- 单只股票 ----------
+class IndicatorState:
+    """
+    单只股票的全部指标状态
+    参数与 compute_enhanced_indicators 一致：MACD(12,26,9)、KDJ(9,3)、RSI(14)、MA5/10/20、量均线5/10
+    """
+
+    def __init__(self):
+        self.ema_fast = _Ema(2 / 13, 12)
+        self.ema_slow = _Ema(2 / 27, 26)
+        self.ema_sign = _Ema(2 / 10, 9)
+        self.rsi_up = _Ema(1 / 14, 14)
+        self.rsi_dn = _Ema(1 / 14, 14)
+        self.low_min = _RollingExtreme(9, is_max=False)
+        self.high_max = _RollingExtreme(9, is_max=True)
+        self.k_mean = _RollingMean(3)
+        self.ma = {w: _RollingMean(w) for w in (5, 10, 20)}
+        self.vol_ma = {w: _RollingMean(w) for w in (5, 10)}
+        self.prev_close = NAN
+        self.last_date = None
+        self.bars = 0
+
+    def _step(self, bar, op: str) -> dict:
+        """op="update" 推进状态；op="peek" 只算结果，状态不变"""
+        close = float(bar["close"])
+        high, low, volume = float(bar["high"]), float(bar["low"]), float(bar["volume"])
+
+        # MACD：ta.trend.macd_diff 返回的是柱状线，这里沿用 analysis 里的列名
+        fast, slow = getattr(self.ema_fast, op)(close), getattr(self.ema_slow, op)(close)
+        macd_line = fast - slow
+        signal = getattr(self.ema_sign, op)(macd_line)
+        hist = macd_line - signal
+
+        # KDJ
+        smin, smax = getattr(self.low_min, op)(low), getattr(self.high_max, op)(high)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            k = float(np.float64(100.0) * (close - smin) / np.float64(smax - smin))
+        d = getattr(self.k_mean, op)(k)
+
+        # RSI（Wilder 平滑，首根K线涨跌记 0）
+        diff = close - self.prev_close
+        up = diff if diff > 0 else 0.0
+        dn = -diff if diff < 0 else 0.0
+        emaup, emadn = getattr(self.rsi_up, op)(up), getattr(self.rsi_dn, op)(dn)
+        if emadn == 0:
+            rsi = 100.0
+        else:
+            rsi = 100 - 100 / (1 + emaup / emadn) if emadn == emadn and emaup == emaup else NAN
+
+        return {
+            "macd_dif": hist,
+            "macd_signal": signal,
+            "macd": hist - signal,
+            "kdj_k": k,
+            "kdj_d": d,
+            "kdj_j": 3 * k - 2 * d,
+            "rsi": rsi,
+            "ma5": getattr(self.ma[5], op)(close),
+            "ma10": getattr(self.ma[10], op)(close),
+            "ma20": getattr(self.ma[20], op)(close),
+            "volume_ma5": getattr(self.vol_ma[5], op)(volume),
+            "volume_ma10": getattr(self.vol_ma[10], op)(volume),
+        }
+
+    def update(self, bar) -> dict:
+        """喂入一根K线（需含 close/high/low/volume，可含 date），返回该K线的全部指标"""
+        out = self._step(bar, "update")
+        self.prev_close = float(bar["close"])
+        if "date" in bar:
+            self.last_date = pd.Timestamp(bar["date"])
+        self.bars += 1
+        return out
+
+    def preview(self, bar) -> dict:
+        """
+        盘中用：假如追加这根（尚未收盘的）K线，各指标是多少；状态不变，可对同一天反复调用
+        """
+        return self._step(bar, "peek")
+
+    def run(self, df: pd.DataFrame) -> pd.DataFrame:
+        """逐根喂入整张表，返回带指标列的新表（与 compute_enhanced_indicators 同形）"""
+        df = df.sort_index()
+        cols = ["close", "high", "low", "volume"] + (["date"] if "date" in df.columns else [])
+        rows = [self.update(bar) for bar in df[cols].to_dict("records")]
+        block = pd.DataFrame(rows, index=df.index, columns=INDICATOR_COLUMNS)
+        return pd.concat([df.drop(columns=INDICATOR_COLUMNS, errors="ignore"), block], axis=1)  # 一次拼接，逐列赋值很慢
+
+
+# ---------- 多只股票 ----------
+class IndicatorEngine:
+    """
+    按股票代码保存 IndicatorState；update_frame 只处理比上次更新更晚的K线
+    状态可 pickle 落盘，下次启动直接接着算
+    """
+
+    def __init__(self, path: str = STATE_FILE):
+        self.path = path
+        self.states = {}
+        self._lock = threading.Lock()
+
+    def state(self, symbol: str) -> IndicatorState:
+        with self._lock:
+            return self.states.setdefault(symbol, IndicatorState())
+
+    def update(self, symbol: str, bar) -> dict:
+        return self.state(symbol).update(bar)
+
+    def update_frame(self, symbol: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        把 df 中比状态里 last_date 更新的K线依次喂入，返回这些新K线及其指标
+        首次调用相当于全量预热
+        """
+        st = self.state(symbol)
+        new = df if st.last_date is None else df[pd.to_datetime(df["date"]) > st.last_date]
+        if new.empty:
+            return new
+        return st.run(new)
+
+    def advance(self, symbol: str, df: pd.DataFrame) -> int:
+        """只推进状态、不产出指标表（盘中预热用，省掉逐只建表的开销）；返回喂入的K线根数"""
+        st = self.state(symbol)
+        dates = pd.to_datetime(df["date"])
+        if st.last_date is not None:
+            df, dates = df[dates > st.last_date], dates[dates > st.last_date]
+        cols = [df[c].to_numpy(dtype=float) for c in ("close", "high", "low", "volume")]
+        for close, high, low, volume, date in zip(*cols, dates):
+            st.update({"close": close, "high": high, "low": low, "volume": volume, "date": date})
+        return len(df)
+
+    def reset(self, symbol: str):
+        """除权后前复权历史整体变化，需要清掉状态重新预热"""
+        with self._lock:
+            self.states.pop(symbol, None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with self._lock, open(tmp, "wb") as f:
+            pickle.dump(self.states, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+    @classmethod
+    def load(cls, path: str = STATE_FILE) -> "IndicatorEngine":
+        engine = cls(path)
+        try:
+            with open(path, "rb") as f:
+                engine.states = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            pass
+        return engine
@@ -1,68 +1,166 @@
 import streamlit as st
 import pandas as pd
-import json
 import os
+import sys
 from datetime import datetime
-import akshare as ak
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 复用仓库根目录的模块
+from storage import EXPORT_FORMATS, add_stock, del_stock, export_stocks, import_stocks, parse_codes
+from watchlist import FAVORITES_LIST, get_store
 
 # =============================
 # 系统配置
 # =============================
 st.set_page_config(page_title="股票量化系统", layout="wide")
-DATA_FILE = "data/favorites.json"
 
 # =============================
 # 通用函数
 # =============================
-def load_favorites():
-    if not os.path.exists(DATA_FILE):
-        return []
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return []
-
-def save_favorites(favs):
-    os.makedirs("data", exist_ok=True)
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(favs, f, ensure_ascii=False, indent=2)
+def favorite_items():
+    """自选股统一存在 watchlist.db 的 favorites 分组，旧 data/favorites.json 首次打开时自动迁移"""
+    return get_store().items(FAVORITES_LIST)
 
 # =============================
 # 页面定义
 # =============================
 
-def dashboard_page():
-    """📊 仪表板"""
-    st.title("📊 股票量化系统 - 仪表板")
+@st.cache_resource
+def index_service():
+    """整个进程共用一个指数服务：N 个会话同时刷新，每个指数每个收盘只联网一次"""
+    from index_data import get_service
+    return get_service()
 
-    col1, col2 = st.columns(2)
 
-    with col1:
-        st.subheader("上证指数")
-        df_sh = ak.stock_zh_index_daily(symbol="sh000001").tail(100)
-        df_sh["date"] = pd.to_datetime(df_sh["date"])
-        st.line_chart(df_sh, x="date", y="close")
+def _pct(x):
+    return "-" if pd.isna(x) else f"{x:+.2%}"
 
-    with col2:
-        st.subheader("深证成指")
-        df_sz = ak.stock_zh_index_daily(symbol="sz399001").tail(100)
-        df_sz["date"] = pd.to_datetime(df_sz["date"])
-        st.line_chart(df_sz, x="date", y="close")
+
+def dashboard_page():
+    """📊 仪表板"""
+    from index_data import INDEX_NAMES, save_indices
+    from scheduler import load_signals
+
+    st.title("📊 股票量化系统 - 仪表板")
+    service = index_service()
+    names = {**INDEX_NAMES, **service.indices}
+    codes = st.multiselect("指数", list(names), default=list(service.indices), format_func=lambda c: names[c])
+    if st.button("设为默认指数") and codes:
+        save_indices({c: names[c] for c in codes})
+        service.set_indices({c: names[c] for c in codes})
+    if not codes:
+        st.info("请至少选择一个指数")
+        return
+
+    # 本地缓存已是最新就不联网；过期的几只并发补拉，耗时取决于最慢的那个
+    frames = service.frames(codes)
+    cols = st.columns(2)
+    for k, code in enumerate(codes):
+        df = frames[code]
+        with cols[k % 2]:
+            st.subheader(names[code])
+            if isinstance(df, Exception):
+                st.error(f"{names[code]}获取失败：{df}")
+            else:
+                st.line_chart(df.tail(100), x="date", y="close")
 
     st.markdown("---")
-    st.header("📈 核心指标汇总（示例）")
-    data = {
-        "指标": ["总持仓收益率", "本周收益", "仓位占比", "策略信号数"],
-        "数值": ["+8.2%", "+1.4%", "72%", "3个买入信号"],
-    }
-    st.table(pd.DataFrame(data))
+    st.header("📈 核心指标汇总")
+    summary = service.summary(frames)
+    if summary.empty:
+        st.info("暂无指数数据")
+    else:
+        pct_cols = ["日涨跌", "近5日", "近20日", "年初至今", "距60日高点"]
+        table = summary.drop(columns="代码").set_index("名称")
+        table["收盘"] = table["收盘"].map("{:.2f}".format)
+        table[pct_cols] = table[pct_cols].apply(lambda c: c.map(_pct))
+        table["20日年化波动"] = table["20日年化波动"].map(lambda x: "-" if pd.isna(x) else f"{x:.2%}")
+        st.table(table)
+
+    # 组合指标来自 portfolio.py 的成交流水，信号数来自盘后预计算
+    from portfolio import get_engine
+    perf = get_engine().summary()
+    _, meta = load_signals()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("总持仓收益率", _pct(perf["total_return"]) if perf else "-")
+    c2.metric("本周收益", _pct(perf["week_return"]) if perf else "-")
+    c3.metric("仓位占比", f"{perf['exposure']:.0%}" if perf else "-")
+    c4.metric("策略信号数", f"{meta.get('hits', 0)}个背离" if meta else "-")
+    if meta:
+        st.caption(f"盘后信号：{meta.get('hits', 0)} 个背离 / {meta.get('symbols', 0)} 只，"
+                   f"更新于 {meta.get('finished_at', '-')}")
+
+def holdings_page():
+    """💼 持仓列表"""
+    from portfolio import SIDE_NAMES, get_engine, get_store
+    from symbols import get_directory
+
+    st.title("💼 持仓列表")
+    store = get_store()
+
+    with st.expander("➕ 记一笔成交"):
+        with st.form("trade_form", clear_on_submit=True):
+            c1, c2, c3 = st.columns(3)
+            date = c1.date_input("日期", datetime.now())
+            side = c2.selectbox("类型", list(SIDE_NAMES), format_func=SIDE_NAMES.get)
+            code = c3.text_input("股票代码（入金 / 出金留空）", "")
+            c4, c5, c6 = st.columns(3)
+            qty = c4.number_input("数量（入金 / 出金 / 分红填金额）", min_value=0.0, step=100.0)
+            price = c5.number_input("价格（入金 / 出金 / 分红填 1）", min_value=0.0, value=1.0, step=0.01, format="%.3f")
+            fee = c6.number_input("费用", min_value=0.0, step=1.0)
+            note = st.text_input("备注", "")
+            if st.form_submit_button("保存"):
+                try:
+                    store.add(date, code, side, qty, price, fee, note)
+                    st.success("已记录")
+                except ValueError as e:
+                    st.error(str(e))
+
+    engine = get_engine()
+    if st.button("🔄 更新行情"):
+        engine.refresh()
+        engine = get_engine()
+    if engine.daily.empty:
+        st.info("暂无成交记录，请先记一笔。")
+        return
+
+    perf = engine.summary()
+    cols = st.columns(5)
+    cols[0].metric("持仓市值", f"{perf['market_value']:,.0f}")
+    cols[1].metric("当日盈亏", f"{perf['day_pnl']:+,.0f}")
+    cols[2].metric("累计盈亏", f"{perf['total_pnl']:+,.0f}")
+    cols[3].metric("总收益率", _pct(perf["total_return"]))
+    cols[4].metric("仓位占比", f"{perf['exposure']:.0%}")
+    st.caption(f"估值日期 {perf['date']:%Y-%m-%d}，现金 {perf['cash']:,.0f}")
+
+    st.subheader("📑 当前持仓")
+    h = engine.holdings()
+    names = get_directory().resolve_many(h["symbol"].tolist(), default="")
+    h.insert(1, "name", h["symbol"].map(names))
+    st.dataframe(h.rename(columns={
+        "symbol": "代码", "name": "名称", "qty": "数量", "avg_cost": "成本价", "price": "现价",
+        "market_value": "市值", "unrealized": "浮动盈亏", "unrealized_pct": "浮盈比例",
+        "realized": "已实现盈亏", "day_pnl": "当日盈亏", "weight": "权重",
+    }), use_container_width=True, hide_index=True)
+
+    st.subheader("📈 净值与周收益")
+    c1, c2 = st.columns(2)
+    c1.line_chart(engine.daily, x="date", y="nav")
+    week = engine.weekly().tail(26)
+    c2.bar_chart(week.assign(week=week["week"].astype(str)), x="week", y="return")
+
+    st.subheader("🧾 成交流水")
+    trades = engine.trades.assign(side=engine.trades["side"].map(SIDE_NAMES))
+    st.dataframe(trades, use_container_width=True, hide_index=True)
+    del_id = st.selectbox("选择要删除的流水", [None] + trades["id"].tolist()[::-1])
+    if st.button("删除选中流水") and del_id is not None:
+        store.remove(del_id)
+        st.success(f"已删除流水 {del_id}")
 
 def favorites_page():
     """📋 自选股"""
     st.title("📋 自选股管理")
 
-    favorites = load_favorites()
+    favorites = favorite_items()
 
     st.subheader("➕ 添加股票")
     col1, col2 = st.columns([2, 1])
@@ -72,23 +170,36 @@ def favorites_page():
         add_btn = st.button("添加")
 
     if add_btn and new_code:
-        new_code = new_code.strip()
-        if new_code not in favorites:
-            favorites.append(new_code)
-            save_favorites(favorites)
-            st.success(f"已添加：{new_code}")
+        if add_stock(new_code, list_name=FAVORITES_LIST):
+            st.success(f"已添加：{new_code.strip()}")
+            favorites = favorite_items()
         else:
             st.warning("该股票已存在")
 
+    with st.expander("📥 批量导入 / 📤 导出"):
+        upload = st.file_uploader("CSV / TXT / JSON 文件", type=["csv", "txt", "json"])
+        pasted = st.text_area("或粘贴代码（空格、逗号、换行分隔均可，也支持简称、600519.SH、bj830799）", "")
+        if st.button("批量导入"):
+            text = upload.getvalue().decode("utf-8-sig", errors="ignore") if upload else ""
+            result = import_stocks(parse_codes(text) + parse_codes(pasted), list_name=FAVORITES_LIST)
+            st.success(f"新增 {len(result['added'])} 只，已存在 {len(result['existing'])} 只")
+            if result["invalid"]:
+                st.warning("无法识别：" + " ".join(result["invalid"][:50]))
+            favorites = favorite_items()
+        cols = st.columns(len(EXPORT_FORMATS))
+        for col, fmt in zip(cols, EXPORT_FORMATS):
+            data = export_stocks(FAVORITES_LIST, fmt)
+            col.download_button(f"导出 {fmt.upper()}", data.encode("utf-8-sig" if fmt == "csv" else "utf-8"),
+                                file_name=f"favorites.{fmt}", mime="text/csv" if fmt == "csv" else "application/json")
+
     st.subheader("📑 当前自选股")
     if favorites:
-        df = pd.DataFrame({"股票代码": favorites})
+        df = pd.DataFrame(favorites).rename(columns={"code": "股票代码", "name": "股票名称"})
         st.dataframe(df, use_container_width=True)
 
-        del_code = st.selectbox("选择要删除的股票", [""] + favorites)
+        del_code = st.selectbox("选择要删除的股票", [""] + [x["code"] for x in favorites])
         if st.button("删除选中股票") and del_code:
-            favorites = [x for x in favorites if x != del_code]
-            save_favorites(favorites)
+            del_stock(del_code, list_name=FAVORITES_LIST)
             st.success(f"已删除：{del_code}")
     else:
         st.info("暂无自选股，请先添加。")
@@ -103,8 +214,8 @@ page = st.sidebar.radio(
     [
         "📊 仪表板",
         "📋 自选股",
+        "💼 持仓列表",
         # 未来可扩展：
-        # "💼 持仓列表",
         # "🔍 股票分析",
         # "⚙️ 系统设置"
     ],
@@ -114,3 +225,5 @@ if page == "📊 仪表板":
     dashboard_page()
 elif page == "📋 自选股":
     favorites_page()
+elif page == "💼 持仓列表":
+    holdings_page()
@@ -1,28 +1,18 @@
 import streamlit as st
-import json
 import os
+import sys
 import pandas as pd
 
-st.set_page_config(page_title="自选股管理", layout="wide")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 复用仓库根目录的模块
+from storage import add_stock, del_stock
+from watchlist import FAVORITES_LIST, get_store
 
-DATA_FILE = "data/favorites.json"
+st.set_page_config(page_title="自选股管理", layout="wide")
 
 # === 初始化 ===
-def load_favorites():
-    if not os.path.exists(DATA_FILE):
-        return []
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return []
-
-def save_favorites(favs):
-    os.makedirs("data", exist_ok=True)
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(favs, f, ensure_ascii=False, indent=2)
-
-favorites = load_favorites()
+# 自选股存在 watchlist.db 的 favorites 分组，与 app.py 共用；旧 data/favorites.json 首次打开时自动迁移
+store = get_store()
+favorites = store.items(FAVORITES_LIST)
 
 # === 页面标题 ===
 st.title("📋 自选股管理")
@@ -37,11 +27,9 @@ with col2:
     add_btn = st.button("添加")
 
 if add_btn and new_code:
-    new_code = new_code.strip()
-    if new_code not in favorites:
-        favorites.append(new_code)
-        save_favorites(favorites)
-        st.success(f"已添加：{new_code}")
+    if add_stock(new_code, list_name=FAVORITES_LIST):
+        st.success(f"已添加：{new_code.strip()}")
+        favorites = store.items(FAVORITES_LIST)
     else:
         st.warning("该股票已存在")
 
@@ -49,15 +37,13 @@ if add_btn and new_code:
 st.subheader("📑 当前自选股")
 
 if favorites:
-    df = pd.DataFrame({"股票代码": favorites})
+    df = pd.DataFrame(favorites).rename(columns={"code": "股票代码", "name": "股票名称"})
     st.dataframe(df, use_container_width=True)
 
     # 删除操作
-    del_code = st.selectbox("选择要删除的股票", [""] + favorites)
+    del_code = st.selectbox("选择要删除的股票", [""] + [x["code"] for x in favorites])
     if st.button("删除选中股票") and del_code:
-        favorites = [x for x in favorites if x != del_code]
-        save_favorites(favorites)
+        del_stock(del_code, list_name=FAVORITES_LIST)
         st.success(f"已删除：{del_code}")
 else:
     st.info("暂无自选股，请先添加。")
-
@@ -0,0 +1,281 @@
+"""
+列式面板
+全市场行情按 (日期 × 股票) 对齐成矩阵，每个字段一个 .npy 文件，打开时内存映射；
+指标、趋势、背离都按列一次算完，横截面筛选（如 close > ma20 & rsi < 30）是一次向量化掩码
+停牌 / 未上市的格子为 NaN；按列计算时先把每只股票的有效K线压到底部，结果与逐只计算一致
+用法：python panel.py build --universe all；python panel.py select "close > ma20 and rsi < 30"
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from analysis import NS_PER_DAY
+
+PANEL_DIR = os.path.join("data", "panel")
+OHLCV = ("open", "high", "low", "close", "volume")
+
+
+# ---------- 按列压紧 ----------
+def _pack_index(valid: np.ndarray):
+    """每列的有效格子按原顺序搬到该列底部：返回 (源行, 列, 目标行)"""
+    n = valid.shape[0]
+    rank = np.cumsum(valid, axis=0) - 1
+    rows, cols = np.nonzero(valid)
+    dst = n - valid.sum(axis=0)[cols] + rank[rows, cols]
+    return rows, cols, dst
+
+
+def _pack(x: np.ndarray, index) -> np.ndarray:
+    rows, cols, dst = index
+    out = np.full(x.shape, np.nan)
+    out[dst, cols] = x[rows, cols]
+    return out
+
+
+def _unpack(y: np.ndarray, index, dtype) -> np.ndarray:
+    rows, cols, dst = index
+    out = np.full(y.shape, np.nan, dtype=dtype)
+    out[rows, cols] = y[dst, cols]
+    return out
+
+
+# ---------- 面板 ----------
+class Panel:
+    """
+    dates：datetime64[ns] 一维数组；symbols：代码列表；fields：字段名 → (日期, 股票) 矩阵
+    从磁盘打开的矩阵是只读内存映射，新算的字段在内存里，save() 后落盘
+    """
+
+    def __init__(self, dates, symbols, fields: dict, path: str = None):
+        self.dates = np.asarray(dates, dtype="datetime64[ns]")
+        self.symbols = list(symbols)
+        self.fields = dict(fields)
+        self.path = path
+        self._col = {s: j for j, s in enumerate(self.symbols)}
+
+    # ----- 构建 / 读写 -----
+    @classmethod
+    def from_frames(cls, frames: dict, dtype=np.float64) -> "Panel":
+        """frames：{代码: 日线表}，各表日期取并集对齐"""
+        frames = {s: df for s, df in frames.items() if df is not None and not df.empty}
+        symbols = list(frames)
+        stamps = {s: df["date"].to_numpy(dtype="datetime64[ns]") for s, df in frames.items()}
+        dates = np.unique(np.concatenate(list(stamps.values()))) if stamps else np.array([], "datetime64[ns]")
+        fields = {f: np.full((len(dates), len(symbols)), np.nan, dtype=dtype) for f in OHLCV}
+        for j, s in enumerate(symbols):
+            rows = np.searchsorted(dates, stamps[s])
+            for f in OHLCV:
+                fields[f][rows, j] = frames[s][f].to_numpy()
+        return cls(dates, symbols, fields)
+
+    @classmethod
+    def build(cls, symbols, adjust: str = "qfq", start=None, dtype=np.float64, refresh: bool = False) -> "Panel":
+        """从日线缓存构建；start 可截掉更早的历史以控制矩阵大小"""
+        from bar_cache import get_cache
+        cache = get_cache()
+        symbols = list(dict.fromkeys(symbols))
+        if refresh:
+            cache.refresh_many(symbols, adjust)
+        frames = {}
+        for s in symbols:
+            df = cache.read(s, adjust)
+            if start is not None and not df.empty:
+                df = df[df["date"] >= pd.Timestamp(start)]
+            frames[s] = df
+        return cls.from_frames(frames, dtype)
+
+    def save(self, path: str = None):
+        """每个字段一个 .npy，先写临时文件再替换"""
+        path = path or self.path or PANEL_DIR
+        os.makedirs(path, exist_ok=True)
+        for name, arr in list(self.fields.items()) + [("dates", self.dates.view(np.int64))]:
+            tmp = os.path.join(path, f"{name}.{os.getpid()}.tmp.npy")
+            np.save(tmp, np.ascontiguousarray(arr))
+            os.replace(tmp, os.path.join(path, f"{name}.npy"))
+        meta = {"symbols": self.symbols, "fields": list(self.fields)}
+        tmp = os.path.join(path, f"meta.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(path, "meta.json"))
+        self.path = path
+
+    @classmethod
+    def open(cls, path: str = PANEL_DIR, mmap_mode: str = "r") -> "Panel":
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        dates = np.load(os.path.join(path, "dates.npy")).view("datetime64[ns]")
+        fields = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in meta["fields"]}
+        return cls(dates, meta["symbols"], fields, path)
+
+    # ----- 访问 -----
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.fields[field]
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.fields
+
+    @property
+    def shape(self):
+        return len(self.dates), len(self.symbols)
+
+    def row(self, date=None) -> int:
+        """date 当天（或之前最近一个交易日）所在行，None 为最后一行"""
+        if date is None:
+            return len(self.dates) - 1
+        r = int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date), "ns"), side="right")) - 1
+        if r < 0:
+            raise KeyError(f"面板里没有 {date} 之前的数据")
+        return r
+
+    def frame(self, symbol: str) -> pd.DataFrame:
+        """取出单只股票的日线表（去掉停牌 / 未上市的行），可交给原有的逐只分析函数"""
+        j = self._col[symbol]
+        data = {f: np.asarray(arr[:, j]) for f, arr in self.fields.items()}
+        keep = ~np.isnan(data["close"])
+        df = pd.DataFrame({"date": self.dates[keep], **{f: v[keep] for f, v in data.items()}})
+        return df.reset_index(drop=True)
+
+    def snapshot(self, date=None) -> pd.DataFrame:
+        """某一天的横截面：每只股票一行、每个字段一列"""
+        r = self.row(date)
+        return pd.DataFrame({f: np.asarray(arr[r]) for f, arr in self.fields.items()}, index=self.symbols)
+
+    def select(self, expr: str, date=None) -> list:
+        """横截面筛选，expr 用 DataFrame.query 语法，如 "close > ma20 and rsi < 30"；NaN 比较为假"""
+        return self.snapshot(date).query(expr).index.tolist()
+
+    # ----- 按列计算 -----
+    def _packed(self, names, end: int = None):
+        """把若干字段截到第 end 行，并按列把有效K线压到底部，返回 (打包后的字段, 打包索引)"""
+        end = len(self.dates) if end is None else end
+        close = np.asarray(self.fields["close"][:end], dtype=np.float64)
+        index = _pack_index(~np.isnan(close))
+        return {f: _pack(np.asarray(self.fields[f][:end], dtype=np.float64), index) for f in names}, index
+
+    def compute_indicators(self) -> "Panel":
+        """compute_enhanced_indicators 的按列版本，指标字段加进面板（与 OHLCV 同 dtype）"""
+        from indicator_fast import compute_indicator_panel
+        packed, index = self._packed(("close", "high", "low", "volume"))
+        dtype = self.fields["close"].dtype
+        for col, mat in compute_indicator_panel(packed["close"], packed["high"], packed["low"],
+                                                packed["volume"]).items():
+            self.fields[col] = _unpack(mat, index, dtype)
+        return self
+
+    def bar_counts(self, date=None) -> np.ndarray:
+        """截至 date 每只股票的K线根数"""
+        return np.count_nonzero(~np.isnan(self.fields["close"][:self.row(date) + 1]), axis=0)
+
+    def trend(self, date=None) -> pd.Series:
+        """analyze_trend 的按列版本；取每只股票截至 date 的最后一根K线"""
+        packed, _ = self._packed(("close", "ma5", "ma10", "ma20"), self.row(date) + 1)
+        cur = {f: m[-1] for f, m in packed.items()}
+        score = ((cur["close"] > cur["ma5"]).astype(int) + (cur["close"] > cur["ma10"])
+                 + (cur["close"] > cur["ma20"]))
+        label = np.where(score >= 2, "短期上升趋势", np.where(score == 1, "震荡趋势", "下跌趋势"))
+        label = np.where(self.bar_counts(date) < 20, "数据不足", label)
+        return pd.Series(label, index=self.symbols, name="trend")
+
+    def divergence(self, date=None, params: dict = None) -> pd.DataFrame:
+        """
+        comprehensive_divergence_analysis 的按列版本：每只股票截至 date 的最近 lookback 根K线里
+        找最后两个低点并打分，规则和参数与 backtest.score_pairs 相同
+        返回每只股票一行：level（无背离为空）、confidence、n_signals、date1、date2、price1、price2
+        """
+        from numpy.lib.stride_tricks import sliding_window_view
+        from backtest import DEFAULT_PARAMS, level_name, score_pairs
+        p = {**DEFAULT_PARAMS, **(params or {})}
+        end = self.row(date) + 1
+        packed, index = self._packed(("close", "macd", "macd_dif", "rsi", "volume"), end)
+        days = (self.dates[:end].view(np.int64) // NS_PER_DAY).astype(np.float64)
+        packed["day"] = _pack(np.broadcast_to(days[:, None], (end, len(self.symbols))), index)
+        block = {f: m[-p["lookback"]:] for f, m in packed.items()}
+
+        close, w = block["close"], p["window"]
+        n, m = close.shape
+        i1 = np.full(m, -1, dtype=np.int64)
+        i2 = np.full(m, -1, dtype=np.int64)
+        if n >= 2 * w + 1:
+            mins = sliding_window_view(close, w, axis=0).min(axis=-1)         # mins[k] = min(close[k:k+w])
+            with np.errstate(invalid="ignore"):
+                hit = (close[w:n - w] <= mins[:n - 2 * w]) & (close[w:n - w] <= mins[w + 1:])
+            # 间隔过滤是贪心的，只能按时间顺序推进，但每一步对全部股票同时进行
+            last = np.full(m, -np.inf)
+            day = block["day"]
+            for r in range(w, n - w):
+                keep = hit[r - w] & (day[r] - last >= p["min_days"])
+                if keep.any():
+                    i1 = np.where(keep, i2, i1)
+                    i2 = np.where(keep, r, i2)
+                    last = np.where(keep, day[r], last)
+
+        cols = np.arange(m)
+        ok = i1 >= 0
+        f1 = np.where(ok, i1 * m + cols, -1)
+        f2 = np.where(ok, i2 * m + cols, -1)
+        scored = score_pairs(f1, f2, close.ravel(), block["macd"].ravel(), block["macd_dif"].ravel(),
+                             block["rsi"].ravel(), block["volume"].ravel(), p)
+        valid = scored["valid"].to_numpy()
+        pick = lambda x, i: np.where(ok, x.ravel()[np.where(ok, i * m + cols, 0)], np.nan)
+        to_date = lambda d: pd.to_datetime(np.where(valid, d, np.nan) * NS_PER_DAY)
+        return pd.DataFrame({
+            "level": [level_name(c) for c in scored["level"].to_numpy()],
+            "confidence": scored["confidence"].to_numpy(),
+            "n_signals": np.where(valid, scored["n_signals"].to_numpy(), 0),
+            "date1": to_date(pick(block["day"], i1)),
+            "date2": to_date(pick(block["day"], i2)),
+            "price1": np.where(valid, pick(close, i1), np.nan),
+            "price2": np.where(valid, pick(close, i2), np.nan),
+        }, index=pd.Index(self.symbols, name="symbol"))
+
+
+def build_panel(symbols=None, universe: str = "watchlist", adjust: str = "qfq", start=None,
+                dtype=np.float64, refresh: bool = True, path: str = PANEL_DIR) -> Panel:
+    """构建面板 + 指标并落盘，返回的面板字段已切换为内存映射"""
+    if symbols is None:
+        from screener import load_universe
+        symbols = load_universe(universe)
+    panel = Panel.build(symbols, adjust, start, dtype, refresh).compute_indicators()
+    panel.save(path)
+    return Panel.open(path)
+
+
+# ---------- 命令行 ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="列式面板：构建 / 横截面筛选")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="从日线缓存构建面板并计算指标")
+    b.add_argument("symbols", nargs="*")
+    b.add_argument("--universe", choices=["watchlist", "all"], default="watchlist")
+    b.add_argument("--start", help="只保留该日期之后的K线，如 2018-01-01")
+    b.add_argument("--float32", action="store_true", help="用 float32 存储，内存减半")
+    b.add_argument("--offline", action="store_true", help="只用本地缓存，不联网")
+    s = sub.add_parser("select", help="横截面筛选")
+    s.add_argument("expr", help='如 "close > ma20 and rsi < 30"')
+    s.add_argument("--date", help="默认最后一个交易日")
+    s.add_argument("--divergence", action="store_true", help="附上当天的背离判定")
+    parser.add_argument("--path", default=PANEL_DIR)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "build":
+        from analysis import normalize_symbol
+        symbols = [normalize_symbol(x) for x in args.symbols] or None
+        panel = build_panel(symbols, args.universe, start=args.start, refresh=not args.offline,
+                            dtype=np.float32 if args.float32 else np.float64, path=args.path)
+        print(f"{panel.shape[1]} 只股票 × {panel.shape[0]} 个交易日 → {args.path}")
+        return panel
+
+    panel = Panel.open(args.path)
+    hits = panel.select(args.expr, args.date)
+    out = panel.snapshot(args.date).loc[hits, ["close", "ma20", "rsi"]]
+    if args.divergence:
+        out = out.join(panel.divergence(args.date)[["level", "confidence"]])
+    print(out.to_string() if len(out) else "没有符合条件的股票")
+    return out
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+持仓与收益
+成交记录存在 SQLite（data/portfolio.db，与自选股库一样 WAL + 单事务写入）；
+收益引擎把全部持仓对着收盘价矩阵一次性估值：持仓 = 成交量矩阵按日累加，市值 = 持仓 × 前值填充后的收盘价，
+日收益、按周复合、累计净值、仓位占比都是整列运算；新K线到来时从检查点接着算，只处理最近几行
+价格用不复权日线，成交价就是当时的真实价格；除息记一笔“分红”，送转股记一笔零价买入
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+DB_FILE = os.path.join("data", "portfolio.db")
+DEFAULT_ACCOUNT = "default"
+ADJUST = ""                          # 不复权
+BUSY_TIMEOUT_MS = 5000
+REWIND = 5                           # 每次增量重算最近几个交易日，晚到的K线（停牌复牌、数据源延迟）也能更正
+
+BUY, SELL, DIVIDEND, DEPOSIT, WITHDRAW = "buy", "sell", "dividend", "deposit", "withdraw"
+SIDE_NAMES = {BUY: "买入", SELL: "卖出", DIVIDEND: "分红", DEPOSIT: "入金", WITHDRAW: "出金"}
+CASH_SIDES = (DEPOSIT, WITHDRAW)     # 不挂股票；金额 = qty × price，一般记 qty=金额、price=1
+TRADE_COLUMNS = ["id", "date", "symbol", "side", "qty", "price", "fee", "note"]
+DAILY_COLUMNS = ["date", "market_value", "cash", "equity", "buys", "sells", "income", "flows",
+                 "pnl", "return", "nav", "exposure"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    id       INTEGER PRIMARY KEY,
+    account  TEXT NOT NULL,
+    date     TEXT NOT NULL,
+    symbol   TEXT NOT NULL DEFAULT '',
+    side     TEXT NOT NULL,
+    qty      REAL NOT NULL,
+    price    REAL NOT NULL,
+    fee      REAL NOT NULL DEFAULT 0,
+    note     TEXT NOT NULL DEFAULT '',
+    added_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_trades_account_date ON trades (account, date);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+# ---------- 成交记录 ----------
+def _check(row: dict) -> tuple:
+    """校验并规整一条成交，返回 (date, symbol, side, qty, price, fee, note)"""
+    from analysis import normalize_symbol
+    side = row["side"]
+    if side not in SIDE_NAMES:
+        raise ValueError(f"未知的成交类型：{side}")
+    qty, price, fee = float(row["qty"]), float(row["price"]), float(row.get("fee") or 0)
+    if qty <= 0 or price < 0 or fee < 0:
+        raise ValueError(f"数量必须为正、价格和费用不能为负：{row}")
+    symbol = "" if side in CASH_SIDES else normalize_symbol(str(row.get("symbol") or ""))
+    if side not in CASH_SIDES and not symbol:
+        raise ValueError(f"{SIDE_NAMES[side]}需要股票代码")
+    return (f"{pd.Timestamp(row['date']):%Y-%m-%d}", symbol, side, qty, price, fee, str(row.get("note") or ""))
+
+
+class PortfolioStore:
+    """
+    按账户分组的成交流水；每个线程一条连接，写操作 BEGIN IMMEDIATE
+    每次写入给账户的版本号加一，引擎据此判断要不要重新载入
+    """
+
+    def __init__(self, path: str = DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self, account: str):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, '1') "
+                         "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+                         (f"version:{account}",))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # ----- 查询 -----
+    def accounts(self) -> list:
+        rows = self._conn().execute("SELECT DISTINCT account FROM trades ORDER BY account").fetchall()
+        return [r[0] for r in rows]
+
+    def version(self, account: str = DEFAULT_ACCOUNT) -> int:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (f"version:{account}",)).fetchone()
+        return int(row[0]) if row else 0
+
+    def trades(self, account: str = DEFAULT_ACCOUNT) -> pd.DataFrame:
+        """按日期、录入顺序排好的流水，date 为 datetime64"""
+        rows = self._conn().execute(
+            f"SELECT {', '.join(TRADE_COLUMNS)} FROM trades WHERE account = ? ORDER BY date, id", (account,)
+        ).fetchall()
+        df = pd.DataFrame(rows, columns=TRADE_COLUMNS)
+        df["date"] = pd.to_datetime(df["date"])
+        return df.astype({"qty": float, "price": float, "fee": float})
+
+    # ----- 修改 -----
+    def add(self, date, symbol: str, side: str, qty: float, price: float, fee: float = 0.0,
+            note: str = "", account: str = DEFAULT_ACCOUNT) -> int:
+        """记一笔，返回流水 id"""
+        row = _check({"date": date, "symbol": symbol, "side": side, "qty": qty, "price": price,
+                      "fee": fee, "note": note})
+        with self._tx(account) as conn:
+            cur = conn.execute("INSERT INTO trades (account, date, symbol, side, qty, price, fee, note, added_at) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (account, *row, time.time()))
+            return cur.lastrowid
+
+    def add_many(self, rows, account: str = DEFAULT_ACCOUNT) -> int:
+        """rows: [{date, symbol, side, qty, price, fee, note}, ...]，先全部校验再一个事务写入"""
+        checked = [_check(r) for r in rows]
+        now = time.time()
+        with self._tx(account) as conn:
+            conn.executemany("INSERT INTO trades (account, date, symbol, side, qty, price, fee, note, added_at) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [(account, *r, now) for r in checked])
+        return len(checked)
+
+    def remove(self, trade_id: int, account: str = DEFAULT_ACCOUNT) -> bool:
+        with self._tx(account) as conn:
+            before = conn.total_changes
+            conn.execute("DELETE FROM trades WHERE account = ? AND id = ?", (account, int(trade_id)))
+            return conn.total_changes > before
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> PortfolioStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PortfolioStore()
+    return _store
+
+
+# ---------- 估值 ----------
+def _ffill(x: np.ndarray, first: np.ndarray) -> np.ndarray:
+    """按列前值填充；first 是第 0 行之前的值（上一段的期末价）"""
+    x = np.vstack([first[None, :], x])
+    idx = np.where(np.isnan(x), 0, np.arange(len(x))[:, None])
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return x[idx, np.arange(x.shape[1])][1:]
+
+
+def _empty_state(m: int) -> dict:
+    return {"date": None, "pos": np.zeros(m), "px": np.full(m, np.nan), "cash": 0.0, "mv": 0.0, "nav": 1.0}
+
+
+def revalue(close, dq, tp, buys, sells, income, flows, state: dict) -> dict:
+    """
+    一段交易日上的估值，全部是整列运算
+    close / dq / tp：(日, 股) 矩阵，分别是收盘价（NaN 为停牌或无数据）、持仓变动（买正卖负）、
+    当日成交价（没有收盘价的日子用它估值，NaN 为当日无成交）
+    buys / sells / income / flows：每日买入支出（含费）、卖出回款（扣费）、分红、入金（出金为负）
+    state：上一段期末的 pos / px / cash / mv / nav
+    日收益 = 当日盈亏 / (昨日市值 + 当日买入)，按日复合成净值，即时间加权收益，不受出入金影响
+    """
+    pos = state["pos"] + np.cumsum(dq, axis=0)
+    px = _ffill(np.where(np.isnan(close), tp, close), state["px"])
+    mv = np.where(pos != 0, pos * px, 0.0).sum(axis=1)
+    cash = state["cash"] + np.cumsum(flows + sells + income - buys)
+    prev_mv = np.concatenate([[state["mv"]], mv[:-1]])
+    pnl = mv - prev_mv - buys + sells + income
+    base = prev_mv + buys
+    ret = np.divide(pnl, base, out=np.zeros_like(pnl), where=base > 0)
+    nav = state["nav"] * np.cumprod(1 + ret)
+    gross = mv + np.maximum(cash, 0)
+    exposure = np.divide(mv, gross, out=np.zeros_like(mv), where=gross > 0)
+    return {"pos": pos, "px": px, "market_value": mv, "cash": cash, "equity": mv + cash, "pnl": pnl,
+            "return": ret, "nav": nav, "exposure": exposure}
+
+
+def _cached_history(symbol: str) -> pd.DataFrame:
+    from bar_cache import get_cache
+    return get_cache().read(symbol, ADJUST)
+
+
+class PortfolioEngine:
+    """
+    history(symbol) -> 日线表，默认只读本地不复权缓存（refresh() 联网补齐）
+    set_trades() 换流水；advance() 读新K线，从检查点（REWIND 个交易日前的期末状态）接着算
+    流水只在检查点之后有变动、且股票集合不变时也走增量，否则整段重算
+    """
+
+    def __init__(self, trades: pd.DataFrame = None, history=None):
+        self.history = history or _cached_history
+        self.trades = pd.DataFrame(columns=TRADE_COLUMNS)
+        self.symbols = []
+        self.daily = pd.DataFrame(columns=DAILY_COLUMNS)
+        self._state = _empty_state(0)
+        self._last_px = self._prev_px = np.zeros(0)
+        self.version = None
+        if trades is not None:
+            self.set_trades(trades)
+
+    def set_trades(self, trades: pd.DataFrame):
+        trades = trades.sort_values("date", kind="stable").reset_index(drop=True)
+        symbols = sorted(set(trades.loc[~trades["side"].isin(CASH_SIDES), "symbol"]))
+        ck = self._state["date"]
+        keys = ["date", "symbol", "side", "qty", "price", "fee"]
+        same = (symbols == self.symbols and ck is not None
+                and trades.loc[trades["date"] <= ck, keys].reset_index(drop=True).equals(
+                    self.trades.loc[self.trades["date"] <= ck, keys].reset_index(drop=True)))
+        self.trades, self.symbols = trades, symbols
+        if not same:
+            self._state = _empty_state(len(symbols))
+            self.daily = pd.DataFrame(columns=DAILY_COLUMNS)
+        return self
+
+    def refresh(self) -> dict:
+        """联网补齐持仓股票的不复权日线"""
+        from bar_cache import get_cache
+        return get_cache().refresh_many(self.symbols, ADJUST)
+
+    def _segment(self, start):
+        """检查点之后的日期轴和各矩阵"""
+        t = self.trades if start is None else self.trades[self.trades["date"] > start]
+        since = np.datetime64(start if start is not None else self.trades["date"].iloc[0], "ns")
+        how = "right" if start is not None else "left"
+        series = {}
+        for j, s in enumerate(self.symbols):
+            df = self.history(s)
+            if df is None or df.empty:
+                continue
+            d = df["date"].to_numpy()
+            i = int(np.searchsorted(d, since.astype(d.dtype), side=how))    # 日线按日期升序，二分切片代替布尔掩码
+            series[j] = (d[i:].astype("datetime64[ns]"), df["close"].to_numpy(dtype=float)[i:])
+        stamps = [d for d, _ in series.values()]
+        dates = np.unique(np.concatenate(stamps + [t["date"].to_numpy(dtype="datetime64[ns]")]))
+        n, m = len(dates), len(self.symbols)
+        close = np.full((n, m), np.nan)
+        for j, (d, c) in series.items():
+            close[np.searchsorted(dates, d), j] = c
+
+        rows = np.searchsorted(dates, t["date"].to_numpy(dtype="datetime64[ns]"))
+        side, qty, price, fee = t["side"].to_numpy(), t["qty"].to_numpy(), t["price"].to_numpy(), t["fee"].to_numpy()
+        amount = qty * price
+        dq = np.zeros((n, m))
+        tp = np.full((n, m), np.nan)
+        stock = ~np.isin(side, CASH_SIDES)
+        col = {s: j for j, s in enumerate(self.symbols)}
+        cols = np.array([col.get(s, 0) for s in t["symbol"]], dtype=np.int64)
+        sign = np.select([side == BUY, side == SELL], [1.0, -1.0], 0.0)
+        np.add.at(dq, (rows[stock], cols[stock]), sign[stock] * qty[stock])
+        traded = (side == BUY) | (side == SELL)
+        tp[rows[traded], cols[traded]] = price[traded]             # 同日多笔取最后一笔
+        daily = lambda mask, v: np.bincount(rows[mask], v[mask], minlength=n)
+        return dates, {
+            "close": close, "dq": dq, "tp": tp,
+            "buys": daily(side == BUY, amount + fee),
+            "sells": daily(side == SELL, amount - fee),
+            "income": daily(side == DIVIDEND, amount - fee),
+            "flows": daily(side == DEPOSIT, amount) - daily(side == WITHDRAW, amount + fee),
+        }
+
+    def advance(self) -> pd.DataFrame:
+        """补算到最新K线，返回完整的逐日表"""
+        if self.trades.empty:
+            return self.daily
+        st = self._state
+        dates, seg = self._segment(st["date"])
+        if not len(dates):
+            return self.daily
+        out = revalue(seg["close"], seg["dq"], seg["tp"], seg["buys"], seg["sells"], seg["income"],
+                      seg["flows"], st)
+        new = pd.DataFrame({"date": pd.to_datetime(dates), "buys": seg["buys"], "sells": seg["sells"],
+                            "income": seg["income"], "flows": seg["flows"],
+                            **{k: out[k] for k in DAILY_COLUMNS if k in out}})[DAILY_COLUMNS]
+        if st["date"] is None:
+            self.daily = new
+        else:
+            self.daily = pd.concat([self.daily[self.daily["date"] <= st["date"]], new], ignore_index=True)
+        self._last_px = out["px"][-1]
+        self._prev_px = out["px"][-2] if len(dates) > 1 else st["px"]
+        # 检查点放在最后一根K线之前 REWIND 天：只有成交没有K线的日子随时可能补上行情，不能越过
+        bars = np.flatnonzero(~np.isnan(seg["close"]).all(axis=1))
+        k = (bars[-1] if len(bars) else -1) - REWIND
+        if k >= 0:
+            self._state = {"date": pd.Timestamp(dates[k]), "pos": out["pos"][k], "px": out["px"][k],
+                           "cash": out["cash"][k], "mv": out["market_value"][k], "nav": out["nav"][k]}
+        return self.daily
+
+    def run(self) -> pd.DataFrame:
+        """整段重算"""
+        self._state = _empty_state(len(self.symbols))
+        return self.advance()
+
+    # ----- 报表 -----
+    def weekly(self) -> pd.DataFrame:
+        """按自然周（周五收）复合的周收益与周盈亏"""
+        d = self.daily
+        if d.empty:
+            return pd.DataFrame(columns=["week", "return", "pnl"])
+        g = d.groupby(d["date"].dt.to_period("W-FRI"))
+        out = pd.DataFrame({"return": g["return"].apply(lambda r: np.prod(1 + r.to_numpy()) - 1), "pnl": g["pnl"].sum()})
+        return out.rename_axis("week").reset_index()
+
+    def holdings(self) -> pd.DataFrame:
+        """当前持仓：移动加权平均成本、浮动 / 已实现盈亏（含分红）、当日盈亏、权重"""
+        cost, qty, realized = {}, {}, {}
+        for s, side, q, p, f in self.trades[["symbol", "side", "qty", "price", "fee"]].itertuples(index=False):
+            if side == BUY:
+                cost[s] = cost.get(s, 0.0) + q * p + f
+                qty[s] = qty.get(s, 0.0) + q
+            elif side == SELL:
+                held = qty.get(s, 0.0)
+                avg = cost.get(s, 0.0) / held if held else 0.0
+                realized[s] = realized.get(s, 0.0) + q * (p - avg) - f
+                cost[s] = cost.get(s, 0.0) - q * avg
+                qty[s] = held - q
+            elif side == DIVIDEND:
+                realized[s] = realized.get(s, 0.0) + q * p - f
+        j = {s: k for k, s in enumerate(self.symbols)}
+        rows = []
+        for s in self.symbols:
+            q = qty.get(s, 0.0)
+            if abs(q) < 1e-9 and not realized.get(s):
+                continue
+            px = self._last_px[j[s]] if len(self._last_px) else np.nan
+            prev = self._prev_px[j[s]] if len(self._prev_px) else np.nan
+            prev = px if np.isnan(prev) else prev                # 当天才建仓，昨天没有价格
+            mv = q * px
+            rows.append({"symbol": s, "qty": q, "avg_cost": cost.get(s, 0.0) / q if q else np.nan,
+                         "price": px, "market_value": mv, "unrealized": mv - cost.get(s, 0.0),
+                         "unrealized_pct": mv / cost[s] - 1 if q and cost.get(s) else np.nan,
+                         "realized": realized.get(s, 0.0), "day_pnl": q * (px - prev) if q else 0.0})
+        df = pd.DataFrame(rows, columns=["symbol", "qty", "avg_cost", "price", "market_value", "unrealized",
+                                         "unrealized_pct", "realized", "day_pnl"])
+        total = df["market_value"].where(df["qty"] != 0).sum()
+        df["weight"] = df["market_value"] / total if total else np.nan
+        return df
+
+    def summary(self) -> dict:
+        """仪表板用的几项核心指标"""
+        d = self.daily
+        if d.empty:
+            return {}
+        last = d.iloc[-1]
+        week = self.weekly()
+        return {
+            "date": last["date"],
+            "market_value": last["market_value"],
+            "cash": last["cash"],
+            "total_return": last["nav"] - 1,
+            "week_return": week["return"].iloc[-1],
+            "day_pnl": last["pnl"],
+            "total_pnl": d["pnl"].sum(),
+            "exposure": last["exposure"],
+        }
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(account: str = DEFAULT_ACCOUNT, store: PortfolioStore = None, history=None) -> PortfolioEngine:
+    """进程内每个账户一个引擎；流水版本变了才重载，每次调用补算新K线"""
+    store = store or get_store()
+    with _engines_lock:
+        engine = _engines.get(account)
+        if engine is None:
+            engine = _engines[account] = PortfolioEngine(history=history)
+        version = store.version(account)
+        if engine.version != version:
+            engine.set_trades(store.trades(account))
+            engine.version = version
+        engine.advance()
+        return engine
+
+
+def refresh_bars(accounts=None, store: PortfolioStore = None) -> dict:
+    """联网补齐各账户持仓股票的日线，盘后任务调用"""
+    store = store or get_store()
+    symbols = set()
+    for account in accounts or store.accounts():
+        t = store.trades(account)
+        symbols.update(t.loc[~t["side"].isin(CASH_SIDES), "symbol"])
+    from bar_cache import get_cache
+    return get_cache().refresh_many(sorted(symbols), ADJUST)
@@ -0,0 +1,151 @@
+"""
+盘后信号预计算
+常驻进程，每个工作日收盘后补齐自选股（或全市场）的日线缓存，重算指标和背离，
+结果连同计算时间写进信号表；前端直接读表，不再现场联网等待
+用法：python scheduler.py                    # 常驻，工作日 15:45 执行
+      python scheduler.py --once --universe all
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from bar_cache import _FORMAT, _last_close_time
+
+SIGNALS_FILE = os.path.join("data", f"signals.{_FORMAT}")
+META_FILE = os.path.join("data", "signals.meta.json")
+RUN_AT = "15:45"                 # 数据源一般在 15:30 后出当日K线
+POLL_SECONDS = 30
+
+log = logging.getLogger("scheduler")
+
+
+# ---------- 读写 ----------
+def _atomic_write(path: str, write):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def save_signals(df: pd.DataFrame, meta: dict, path: str = SIGNALS_FILE, meta_path: str = META_FILE):
+    """先写表再写元数据，读到的元数据总是对应一张完整的表"""
+    if _FORMAT == "parquet":
+        _atomic_write(path, lambda tmp: df.to_parquet(tmp, index=False))
+    else:
+        _atomic_write(path, df.to_pickle)
+
+    def _dump(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+    _atomic_write(meta_path, _dump)
+
+
+def load_signals(path: str = SIGNALS_FILE, meta_path: str = META_FILE):
+    """返回 (信号表, 元数据)；还没跑过返回 (空表, {})"""
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        df = pd.read_parquet(path) if _FORMAT == "parquet" else pd.read_pickle(path)
+    except (OSError, json.JSONDecodeError):
+        return pd.DataFrame(), {}
+    return df, meta
+
+
+def is_stale(meta: dict, now: datetime = None) -> bool:
+    """最近一次计算早于最近一个收盘时刻就算过期"""
+    if not meta.get("finished_at"):
+        return True
+    return datetime.fromisoformat(meta["finished_at"]) < _last_close_time(now or datetime.now())
+
+
+def freshness(meta: dict, now: datetime = None) -> str:
+    """给页面展示的新鲜度说明"""
+    if not meta.get("finished_at"):
+        return "尚未生成预计算信号，请运行 python scheduler.py --once"
+    now = now or datetime.now()
+    done = datetime.fromisoformat(meta["finished_at"])
+    hours = (now - done).total_seconds() / 3600
+    ago = f"{int(hours * 60)} 分钟前" if hours < 1 else f"{hours:.0f} 小时前" if hours < 48 else f"{hours / 24:.0f} 天前"
+    text = f"更新于 {done:%m-%d %H:%M}（{ago}），最新K线 {meta.get('last_bar') or '-'}，共 {meta.get('symbols', 0)} 只"
+    return text + "；已过期，等待下一次盘后任务" if is_stale(meta, now) else text
+
+
+# ---------- 任务 ----------
+def run_job(symbols=None, universe: str = "watchlist", workers: int = None,
+            path: str = SIGNALS_FILE, meta_path: str = META_FILE) -> pd.DataFrame:
+    """补齐行情 → 指标 → 背离 → 建议，整张表带上计算时间落盘"""
+    from screener import screen
+    started = datetime.now()
+    result = screen(symbols, universe=universe, workers=workers, refresh=True, share=True)    # 指标表留在共享内存给页面用
+    finished = datetime.now()
+    result["computed_at"] = pd.Timestamp(finished)
+    last_bar = pd.to_datetime(result["last_date"]).max() if len(result) else None
+    meta = {
+        "universe": universe if symbols is None else "custom",
+        "started_at": started.isoformat(timespec="seconds"),
+        "finished_at": finished.isoformat(timespec="seconds"),
+        "seconds": round((finished - started).total_seconds(), 1),
+        "symbols": int(len(result)),
+        "hits": int(result["level"].notna().sum()) if len(result) else 0,
+        "errors": int(result["error"].notna().sum()) if len(result) else 0,
+        "last_bar": None if last_bar is None or pd.isna(last_bar) else f"{last_bar:%Y-%m-%d}",
+    }
+    save_signals(result, meta, path, meta_path)
+    log.info("信号表已更新：%s 只，%s 个背离，%s 个失败，用时 %ss",
+             meta["symbols"], meta["hits"], meta["errors"], meta["seconds"])
+    return result
+
+
+def serve(universe: str = "watchlist", at: str = RUN_AT, workers: int = None):
+    """常驻：启动时若信号已过期先补跑一次（周末也补），之后每个工作日 at 时刻执行"""
+    import schedule
+
+    def _job():
+        try:
+            run_job(universe=universe, workers=workers)
+        except Exception:
+            log.exception("盘后任务失败，下个交易日重试")
+        try:
+            from index_data import get_service
+            from portfolio import refresh_bars
+            get_service().refresh_all()          # 仪表板的指数、持仓股的不复权日线也顺手补齐，页面打开时直接读盘
+            refresh_bars()
+        except Exception:
+            log.exception("指数 / 持仓行情补拉失败，页面打开时再拉")
+
+    def _scheduled():
+        # 只有定时触发跳过周末；周五失败、周末启动时的补跑不受影响
+        if datetime.now().weekday() < 5:
+            _job()
+
+    _, meta = load_signals()
+    if is_stale(meta):
+        log.info("预计算信号已过期，先补跑一次")
+        _job()
+    schedule.every().day.at(at).do(_scheduled)
+    log.info("已启动，每个工作日 %s 执行（股票池：%s）", at, universe)
+    while True:
+        schedule.run_pending()
+        time.sleep(POLL_SECONDS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="盘后信号预计算")
+    parser.add_argument("--universe", choices=["watchlist", "all"], default="watchlist")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认 CPU 核数")
+    parser.add_argument("--at", default=RUN_AT, help="每天执行时刻 HH:MM")
+    parser.add_argument("--once", action="store_true", help="立即执行一次后退出")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.once:
+        return run_job(universe=args.universe, workers=args.workers)
+    serve(args.universe, args.at, args.workers)
+
+
+if __name__ == "__main__":
+    main()
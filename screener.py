@@ -0,0 +1,233 @@
+"""
+批量背离扫描
+自选股或全市场，进程池并发执行 取数 → 指标 → 背离 → 建议，按级别和置信度排序
+用法：python screener.py --universe all --workers 8 --top 50 --out scan.csv
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+LEVEL_RANK = {"强烈背离": 3, "小背离": 2, "普通背离": 1}
+RESULT_COLUMNS = [
+    "symbol", "name", "level", "confidence", "signals", "date1", "date2", "time_span",
+    "trend", "close", "rsi", "advice", "last_date", "error",
+]
+
+
+# ---------- 股票池 ----------
+def load_universe(universe: str = "watchlist") -> list:
+    """watchlist：self_selection.json 里的自选股；all：全部 A 股"""
+    from analysis import normalize_symbol
+    if universe == "watchlist":
+        from storage import load_self
+        return [item["code"] for item in load_self()]
+    if universe == "all":
+        from symbols import get_directory
+        return [normalize_symbol(code) for code in get_directory().codes()]
+    raise ValueError(f"未知股票池: {universe}")
+
+
+# ---------- 单只 / 批量（在子进程里执行） ----------
+def analyze_symbol(symbol: str, lookback: int = 150, refresh: bool = True, backend: str = "fast",
+                   frames: dict = None) -> dict:
+    """单只股票的完整流水线，异常不外抛，记在 error 列；指标默认走融合内核；给了 frames 时把指标表也存进去"""
+    from analysis import (analyze_trend, compute_enhanced_indicators,
+                          comprehensive_divergence_analysis, generate_trading_advice)
+    from bar_cache import get_cache
+
+    row = {"symbol": symbol}
+    try:
+        df = get_cache().get(symbol, n=lookback, refresh=refresh)
+        if df.empty:
+            row["error"] = "无数据"
+            return row
+        df = compute_enhanced_indicators(df, backend=backend)
+        if frames is not None:
+            frames[symbol] = df
+        div, _ = comprehensive_divergence_analysis(df)
+        latest = df.iloc[-1]
+        row.update(
+            trend=analyze_trend(df),
+            close=float(latest["close"]),
+            rsi=float(latest["rsi"]),
+            advice=generate_trading_advice(div, df),
+            last_date=pd.Timestamp(latest["date"]),
+        )
+        if div:
+            from signal_store import to_row
+            row.update(
+                level=div["level"],
+                confidence=float(div["confidence"]),
+                signals=",".join(div["signals"]),
+                date1=div["date1"],
+                date2=div["date2"],
+                time_span=div["time_span"],
+                signal_row=to_row(symbol, div, latest["date"], "screener"),   # 回到父进程后统一写信号历史库
+            )
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    return row
+
+
+_worker_fetcher = None
+
+
+def _fetcher_for(workers: int):
+    """子进程各有一个令牌桶，限速按进程数均分，合起来仍是 DEFAULT_RATE；单进程用共享取数器"""
+    global _worker_fetcher
+    if workers <= 1:
+        return None
+    if _worker_fetcher is None:
+        from fetcher import DEFAULT_BURST, DEFAULT_RATE, AsyncFetcher
+        _worker_fetcher = AsyncFetcher(rate=DEFAULT_RATE / workers, burst=max(1, DEFAULT_BURST // workers))
+    return _worker_fetcher
+
+
+def _analyze_chunk(symbols, lookback, refresh, share=False, workers=1):
+    # 一个任务处理一批股票，摊薄进程间调度和序列化开销；整批先并发补齐行情
+    # share=True 时整批指标表写进一段共享内存，回传的只是每只几十字节的句柄（放在 shm 键里）
+    if refresh:
+        from bar_cache import get_cache
+        get_cache().refresh_many(symbols, fetcher=_fetcher_for(workers))
+    frames = {} if share else None
+    rows = [analyze_symbol(s, lookback, refresh=False, frames=frames) for s in symbols]
+    if share:
+        from shared_frames import publish
+        handles = publish(frames)
+        for r in rows:
+            if r["symbol"] in handles:
+                r["shm"] = handles[r["symbol"]]
+    return rows
+
+
+# ---------- 调度 ----------
+def rank_results(rows) -> pd.DataFrame:
+    """按背离级别、置信度降序排；没有背离的排在后面"""
+    df = pd.DataFrame(rows).reindex(columns=RESULT_COLUMNS)
+    df["_rank"] = df["level"].map(LEVEL_RANK).fillna(0)
+    df = df.sort_values(["_rank", "confidence"], ascending=False, na_position="last", kind="stable")
+    return df.drop(columns="_rank").reset_index(drop=True)
+
+
+def _run_pool(chunks, workers, max_inflight, lookback, refresh, share, rows, progress, total):
+    # 结果边收边放进 rows；中途出错时等已在跑的任务结束，把它们的结果也收进来，好让调用方回收共享内存
+    pending = iter(chunks)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        inflight = set()
+        for chunk in pending:
+            inflight.add(pool.submit(_analyze_chunk, chunk, lookback, refresh, share, workers))
+            if len(inflight) >= max_inflight:
+                break
+        try:
+            while inflight:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    inflight.discard(fut)
+                    rows.extend(fut.result())
+                    nxt = next(pending, None)
+                    if nxt is not None:
+                        inflight.add(pool.submit(_analyze_chunk, nxt, lookback, refresh, share, workers))
+                if progress:
+                    progress(len(rows), total)
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            for fut in inflight:
+                if not fut.cancelled() and fut.exception() is None:
+                    rows.extend(fut.result())
+            raise
+
+
+def _unlink_published(rows):
+    from shared_frames import unlink
+    for name in {r["shm"]["segment"] for r in rows if "shm" in r}:
+        unlink(name)
+
+
+def screen(symbols=None, universe: str = "watchlist", workers: int = None, lookback: int = 150,
+           refresh: bool = True, chunksize: int = 16, max_inflight: int = None, progress=None,
+           share: bool = False, record: bool = True) -> pd.DataFrame:
+    """
+    批量扫描入口
+    workers：进程数，默认 CPU 核数；1 表示在当前进程串行执行
+    max_inflight：同时在途的任务数上限，控制内存和对数据源的并发压力，默认 workers*2
+    progress：可选回调 progress(done, total)
+    share：指标表经共享内存发布并登记到 shared_frames 注册表，页面和其他进程可零拷贝读取
+    record：检出的背离一个事务写进 signal_store 信号历史库（同一对低点去重）
+    """
+    full = symbols is None                      # 扫的是整个股票池，注册表里池外的旧代码可以注销
+    if symbols is None:
+        symbols = load_universe(universe)
+    symbols = list(dict.fromkeys(symbols))
+    total = len(symbols)
+    workers = workers or os.cpu_count() or 1
+    chunks = [symbols[i:i + chunksize] for i in range(0, total, chunksize)]
+    rows = []
+
+    try:
+        if workers <= 1:
+            for chunk in chunks:
+                rows.extend(_analyze_chunk(chunk, lookback, refresh, share))
+                if progress:
+                    progress(len(rows), total)
+        else:
+            _run_pool(chunks, workers, max_inflight or workers * 2, lookback, refresh, share, rows, progress, total)
+    except BaseException:
+        # 子进程发布的共享内存段不归 resource_tracker 管，登记进注册表之前中断就得自己回收
+        _unlink_published(rows)
+        raise
+
+    handles = {r["symbol"]: r.pop("shm") for r in rows if "shm" in r}
+    if handles or (share and full):
+        from shared_frames import Registry
+        Registry().update(handles, universe=symbols if full else None)
+    detections = [r.pop("signal_row") for r in rows if "signal_row" in r]
+    if detections and record:
+        from signal_store import get_store
+        get_store().record_many(detections)
+    if rows:
+        from symbols import get_directory
+        names = get_directory().resolve_many([r["symbol"] for r in rows], default="")
+        for r in rows:
+            r["name"] = names[r["symbol"]]
+    return rank_results(rows)
+
+
+# ---------- 命令行 ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量底背离扫描")
+    parser.add_argument("symbols", nargs="*", help="指定代码；留空则用 --universe")
+    parser.add_argument("--universe", choices=["watchlist", "all"], default="watchlist")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认 CPU 核数")
+    parser.add_argument("--lookback", type=int, default=150)
+    parser.add_argument("--offline", action="store_true", help="只用本地缓存，不联网")
+    parser.add_argument("--top", type=int, default=30, help="打印前 N 条")
+    parser.add_argument("--share", action="store_true", help="指标表发布到共享内存，供页面零拷贝读取")
+    parser.add_argument("--no-record", action="store_true", help="不写信号历史库")
+    parser.add_argument("--out", help="结果保存为 CSV")
+    args = parser.parse_args(argv)
+
+    from analysis import normalize_symbol
+    symbols = [normalize_symbol(s) for s in args.symbols] or None
+
+    def _progress(done, total):
+        print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    t0 = time.perf_counter()
+    result = screen(symbols, universe=args.universe, workers=args.workers, lookback=args.lookback,
+                    refresh=not args.offline, progress=_progress, share=args.share, record=not args.no_record)
+    print(f"\n扫描 {len(result)} 只，用时 {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    hits = result[result["level"].notna()]
+    print(hits.head(args.top)[["symbol", "name", "level", "confidence", "signals", "time_span", "trend"]]
+          .to_string(index=False) if not hits.empty else "未检测到背离")
+    if args.out:
+        result.to_csv(args.out, index=False, encoding="utf-8-sig")
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+进程间共享指标表
+子进程把一批股票的指标表拼成一张 Arrow 表，按 IPC 格式写进一块 multiprocessing.shared_memory，
+只把 (段名, 行偏移, 行数) 这样几十字节的句柄传回父进程；父进程把句柄记进注册表 data/shm_registry.json，
+页面和其他进程按代码查表、attach 后切片读取，数值列直接是共享内存上的只读 numpy 视图，不拷贝、不反序列化
+段的生命周期归注册表管：某段里的股票全部被新结果替换、或移出股票池后才 unlink，已 attach 的读者不受影响
+"""
+import json
+import os
+import secrets
+import threading
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+REGISTRY_FILE = os.path.join("data", "shm_registry.json")
+PREFIX = "mystock_"              # macOS 的 POSIX 共享内存名最长 31 字符
+
+
+# ---------- 共享内存段 ----------
+class _Segment(shared_memory.SharedMemory):
+    """还有零拷贝视图引用时 close 会抛 BufferError，这种情况留给进程退出时回收"""
+
+    def close(self):
+        try:
+            super().close()
+        except BufferError:
+            pass
+
+
+def _open(name: str = None, size: int = 0) -> _Segment:
+    """
+    创建 / 打开一段共享内存，并且不交给 resource_tracker 管
+    否则创建它的子进程一退出，tracker 就会把段 unlink 掉；3.13 起可直接传 track=False
+    """
+    create = name is None
+    name = name or PREFIX + secrets.token_hex(6)
+    try:
+        return _Segment(name, create=create, size=size, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        seg = _Segment(name, create=create, size=size)
+        resource_tracker.unregister(seg._name, "shared_memory")
+        return seg
+
+
+def unlink(name: str):
+    try:
+        seg = _open(name)
+    except FileNotFoundError:
+        return
+    seg.close()
+    if getattr(seg, "_track", True):
+        # 3.13 以前 unlink 会顺带向 tracker 注销，先登记回去，免得 tracker 报 KeyError
+        from multiprocessing import resource_tracker
+        resource_tracker.register(seg._name, "shared_memory")
+    seg.unlink()
+
+
+# ---------- 写端（在子进程里执行） ----------
+def _to_table(frames: dict):
+    import pyarrow as pa
+    parts = list(frames.values())
+    columns = list(parts[0].columns)
+    data = {}
+    for col in columns:
+        values = np.concatenate([f[col].to_numpy() for f in parts])
+        # 数值列按 numpy 原样写入：NaN 仍是 NaN 而不是 null，读出来才能零拷贝转 numpy
+        data[col] = pa.array(values, from_pandas=values.dtype == object)
+    return pa.table(data)
+
+
+def publish(frames: dict) -> dict:
+    """
+    frames: {代码: DataFrame}，列相同；整批写进一段共享内存
+    返回 {代码: 句柄}，句柄是可 JSON 化的小字典，直接交给 Registry.update
+    """
+    import pyarrow as pa
+    frames = {s: f.reset_index(drop=True) for s, f in frames.items() if f is not None and not f.empty}
+    if not frames:
+        return {}
+    table = _to_table(frames)
+    probe = pa.MockOutputStream()
+    with pa.ipc.new_stream(probe, table.schema) as w:
+        w.write_table(table)
+    seg = _open(size=probe.size())
+    try:
+        with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(seg.buf)), table.schema) as w:
+            w.write_table(table)
+    finally:
+        seg.close()
+
+    handles, offset = {}, 0
+    created = datetime.now().isoformat(timespec="seconds")
+    for sym, f in frames.items():
+        last = f["date"].iloc[-1] if "date" in f.columns else None
+        handles[sym] = {"segment": seg.name, "offset": offset, "rows": len(f), "created": created,
+                        "last_date": None if last is None else f"{pd.Timestamp(last):%Y-%m-%d}"}
+        offset += len(f)
+    return handles
+
+
+# ---------- 注册表 ----------
+class Registry:
+    """
+    代码 -> 句柄 的 JSON 文件；只由父进程（screener / scheduler）写，写入走临时文件 + 原子替换
+    """
+
+    def __init__(self, path: str = REGISTRY_FILE):
+        self.path = path
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save(self, entries: dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def update(self, handles: dict, universe=None) -> list:
+        """
+        登记新句柄；不再被任何代码引用的旧段随即 unlink，返回被释放的段名
+        universe：本次扫描的完整股票池，给了就把池外的旧代码一并注销，它们独占的段同样释放
+        """
+        entries = self.load()
+        before = {h["segment"] for h in entries.values()}
+        if universe is not None:
+            keep = set(universe) | set(handles)
+            entries = {s: h for s, h in entries.items() if s in keep}
+        entries.update(handles)
+        self._save(entries)
+        freed = sorted(before - {h["segment"] for h in entries.values()})
+        for name in freed:
+            unlink(name)
+        return freed
+
+    def clear(self):
+        for name in {h["segment"] for h in self.load().values()}:
+            unlink(name)
+        self._save({})
+
+
+# ---------- 读端 ----------
+class SharedFrames:
+    """
+    按代码读共享指标表；每段只 attach 一次并缓存，注册表文件一变就重新载入
+    返回的 DataFrame / 数组都是共享内存上的只读视图，需要原地修改时先 .copy()
+    """
+
+    def __init__(self, path: str = REGISTRY_FILE):
+        self.registry = Registry(path)
+        self._entries = {}
+        self._mtime = None
+        self._tables = {}                        # 段名 -> (段, Arrow 表)
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.path.getmtime(self.registry.path)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._entries = self.registry.load()
+        self._mtime = mtime
+        live = {h["segment"] for h in self._entries.values()}
+        for name in list(self._tables):
+            if name not in live:
+                self._tables.pop(name)[0].close()
+
+    def handle(self, symbol: str):
+        with self._lock:
+            self._refresh()
+            return self._entries.get(symbol)
+
+    def table(self, symbol: str):
+        """该股票的 Arrow 表切片（零拷贝）；没有登记或段已被释放返回 None"""
+        import pyarrow as pa
+        with self._lock:
+            self._refresh()
+            h = self._entries.get(symbol)
+            if h is None:
+                return None
+            cached = self._tables.get(h["segment"])
+            if cached is None:
+                try:
+                    seg = _open(h["segment"])
+                except FileNotFoundError:
+                    return None
+                cached = self._tables[h["segment"]] = (seg, pa.ipc.open_stream(pa.py_buffer(seg.buf)).read_all())
+        return cached[1].slice(h["offset"], h["rows"])
+
+    def columns(self, symbol: str) -> dict:
+        """{列名: 只读 numpy 视图}"""
+        t = self.table(symbol)
+        if t is None:
+            return None
+        out = {}
+        for name, col in zip(t.column_names, t.columns):
+            chunk = col.chunk(0) if col.num_chunks == 1 else col.combine_chunks()
+            out[name] = chunk.to_numpy(zero_copy_only=False)     # 无 null 的数值 / 日期列本身就是零拷贝
+        return out
+
+    def frame(self, symbol: str, last_date=None):
+        """DataFrame 视图；给了 last_date 时最后一根K线对不上（结果过期）返回 None"""
+        h = self.handle(symbol)
+        if h is None or (last_date is not None and h["last_date"] != f"{pd.Timestamp(last_date):%Y-%m-%d}"):
+            return None
+        cols = self.columns(symbol)
+        return None if cols is None else pd.DataFrame(cols, copy=False)
+
+
+_reader = None
+
+
+def get_reader() -> SharedFrames:
+    global _reader
+    if _reader is None:
+        _reader = SharedFrames()
+    return _reader
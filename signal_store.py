@@ -0,0 +1,217 @@
+"""
+背离信号历史库
+comprehensive_divergence_analysis 的每次检出都落进 SQLite（data/signals.db，WAL），
+同一只股票的同一对低点 (date1, date2) 只存一行，重复检出只更新最后检出日和次数；
+(level, detected) 与 (symbol, detected) 两个索引让“近 30 天的强烈背离”“某只股票的历史信号”
+在几百万行里也只扫命中的那一段
+用法：python signal_store.py recent --level 强烈背离 --days 30
+      python signal_store.py history sz000001
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+DB_FILE = os.path.join("data", "signals.db")
+BUSY_TIMEOUT_MS = 5000
+LEVELS = ("强烈背离", "小背离", "普通背离")
+VALUE_FIELDS = ("price1", "price2", "macd1", "macd2", "dif1", "dif2", "rsi1", "rsi2", "volume1", "volume2")
+COLUMNS = ["symbol", "detected", "level", "confidence", "date1", "date2", *VALUE_FIELDS,
+           "signals", "source", "last_detected", "hits"]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS signals (
+    id            INTEGER PRIMARY KEY,
+    symbol        TEXT NOT NULL,
+    detected      TEXT NOT NULL,          -- 第一次检出时最后一根K线的日期
+    level         TEXT NOT NULL,
+    confidence    REAL,
+    date1         TEXT NOT NULL,
+    date2         TEXT NOT NULL,
+    {", ".join(f"{f} REAL" for f in VALUE_FIELDS)},
+    signals       TEXT NOT NULL DEFAULT '',
+    source        TEXT NOT NULL DEFAULT '',
+    last_detected TEXT NOT NULL,
+    hits          INTEGER NOT NULL DEFAULT 1,
+    created_at    REAL NOT NULL,
+    UNIQUE (symbol, date1, date2)
+);
+CREATE INDEX IF NOT EXISTS idx_signals_level_detected ON signals (level, detected);
+CREATE INDEX IF NOT EXISTS idx_signals_symbol_detected ON signals (symbol, detected);
+CREATE INDEX IF NOT EXISTS idx_signals_detected ON signals (detected);
+"""
+
+_INSERT_COLUMNS = ["symbol", "detected", "level", "confidence", "date1", "date2", *VALUE_FIELDS,
+                   "signals", "source", "last_detected", "created_at"]
+_INSERT = f"""
+INSERT OR IGNORE INTO signals ({", ".join(_INSERT_COLUMNS)})
+VALUES ({", ".join("?" * len(_INSERT_COLUMNS))})
+"""
+# 同一对低点再次检出：只有检出日更晚才算一次新的命中（同一根K线重复扫描不累加）
+_BUMP = """
+UPDATE signals SET hits = hits + (? > last_detected), last_detected = max(last_detected, ?)
+WHERE symbol = ? AND date1 = ? AND date2 = ?
+"""
+
+
+def _day(value) -> str:
+    return f"{pd.Timestamp(value):%Y-%m-%d}"
+
+
+def to_row(symbol: str, div: dict, detected, source: str = "") -> tuple:
+    """comprehensive_divergence_analysis 的结果字典 → 一行参数"""
+    signals = div.get("signals") or []
+    return (symbol, _day(detected), div["level"], float(div["confidence"]), _day(div["date1"]), _day(div["date2"]),
+            *(None if div.get(f) is None else float(div[f]) for f in VALUE_FIELDS),
+            signals if isinstance(signals, str) else ",".join(signals), source, _day(detected), time.time())
+
+
+class SignalStore:
+    """每个线程一条连接；批量写入一个事务"""
+
+    def __init__(self, path: str = DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # ----- 写入 -----
+    def record(self, symbol: str, div: dict, detected, source: str = "") -> bool:
+        """记一次检出，返回是否是新信号"""
+        return self.record_many([to_row(symbol, div, detected, source)]) == 1
+
+    def record_many(self, rows) -> int:
+        """rows：to_row 生成的元组；一个事务写完，返回新增的信号数（重复检出不算）"""
+        rows = list(rows)
+        if not rows:
+            return 0
+        with self._tx() as conn:
+            before = conn.total_changes
+            conn.executemany(_INSERT, rows)
+            added = conn.total_changes - before
+            if added < len(rows):
+                conn.executemany(_BUMP, [(r[1], r[1], r[0], r[4], r[5]) for r in rows])
+            return added
+
+    # ----- 查询 -----
+    def query(self, level=None, since=None, until=None, symbol: str = None, min_confidence: float = None,
+              limit: int = 1000) -> pd.DataFrame:
+        """
+        按检出日倒序；level 可以是单个级别或列表，since / until 为检出日闭区间
+        条件都落在索引列上，SQLite 按 level 或 symbol 选对应的索引
+        """
+        where, args = [], []
+        if level:
+            levels = [level] if isinstance(level, str) else list(level)
+            where.append(f"level IN ({', '.join('?' * len(levels))})")
+            args += levels
+        if symbol:
+            where.append("symbol = ?")
+            args.append(symbol)
+        if since is not None:
+            where.append("detected >= ?")
+            args.append(_day(since))
+        if until is not None:
+            where.append("detected <= ?")
+            args.append(_day(until))
+        if min_confidence is not None:
+            where.append("confidence >= ?")
+            args.append(float(min_confidence))
+        sql = f"SELECT {', '.join(COLUMNS)} FROM signals"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY detected DESC, id DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return pd.DataFrame(self._conn().execute(sql, args).fetchall(), columns=COLUMNS)
+
+    def recent(self, level="强烈背离", days: int = 30, limit: int = 1000, today=None) -> pd.DataFrame:
+        """最近 days 天（按检出日）的某级别信号"""
+        since = pd.Timestamp(today or datetime.now()).normalize() - timedelta(days=days)
+        return self.query(level=level, since=since, limit=limit)
+
+    def history(self, symbol: str, limit: int = 200) -> pd.DataFrame:
+        return self.query(symbol=symbol, limit=limit)
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM signals").fetchone()[0]
+
+    def level_counts(self, since=None) -> dict:
+        sql, args = "SELECT level, COUNT(*) FROM signals", []
+        if since is not None:
+            sql, args = sql + " WHERE detected >= ?", [_day(since)]
+        return dict(self._conn().execute(sql + " GROUP BY level", args).fetchall())
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> SignalStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SignalStore()
+    return _store
+
+
+# ---------- 命令行 ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="背离信号历史查询")
+    parser.add_argument("--db", default=DB_FILE)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("recent", help="最近 N 天的信号")
+    r.add_argument("--level", choices=LEVELS, nargs="*", default=["强烈背离"])
+    r.add_argument("--days", type=int, default=30)
+    r.add_argument("--limit", type=int, default=200)
+    h = sub.add_parser("history", help="某只股票的历史信号")
+    h.add_argument("symbol")
+    h.add_argument("--limit", type=int, default=200)
+    sub.add_parser("stats", help="各级别信号数")
+    args = parser.parse_args(argv)
+
+    store = SignalStore(args.db)
+    if args.cmd == "stats":
+        counts = store.level_counts()
+        for level in LEVELS:
+            print(f"{level}: {counts.get(level, 0)}")
+        return counts
+    if args.cmd == "recent":
+        df = store.recent(args.level, args.days, args.limit)
+    else:
+        from analysis import normalize_symbol
+        df = store.history(normalize_symbol(args.symbol), args.limit)
+    cols = ["symbol", "detected", "level", "confidence", "date1", "date2", "price1", "price2", "hits"]
+    print(df[cols].to_string(index=False) if len(df) else "没有信号")
+    return df
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,20 @@
 """
-自选股 JSON 存取
+自选股存取
 """
+import csv
+import io
 import json
-import os
-import akshare as ak
+import re
 
-SELF_SEL_FILE = "self_selection.json"
+from watchlist import DEFAULT_LIST, get_store
+
+SELF_SEL_FILE = "self_selection.json"                   # 旧版 JSON，仅用于首次迁移
+CODE_COLUMNS = ("code", "symbol", "代码", "股票代码", "证券代码")
+NAME_COLUMNS = ("name", "名称", "股票名称", "证券简称", "简称")
+EXPORT_FORMATS = ("csv", "json")
+
+_VALID_SYMBOL = re.compile(r"^(sh|sz|bj)\d{6}$")
+_SEPARATORS = re.compile(r"[\s,，;；、|]+")
 
 
 # ---------- 工具：拿股票简称 ----------
@@ -13,48 +22,149 @@ def _query_stock_name(symbol: str) -> str:
     """
     根据 sh/sz/bj/纯代码 返回股票简称，失败返回原串
     """
-    code = symbol.strip().lower()
-    for pre in ("sh", "sz", "bj"):
-        if code.startswith(pre):
-            code = code[2:]
-            break
-    try:
-        all_list = ak.stock_info_a_code_name()          # DataFrame
-        hit = all_list.loc[all_list["code"] == code, "name"]
-        return hit.values[0] if not hit.empty else symbol
-    except Exception:
-        from analysis import get_stock_name              # 兜底
-        return get_stock_name(symbol)
+    from analysis import get_stock_name                  # 先查本地代码目录，查不到再远程兜底
+    return get_stock_name(symbol)
 
 
 # ---------- 增删查存 ----------
-def load_self():
-    if not os.path.exists(SELF_SEL_FILE):
-        return []
-    with open(SELF_SEL_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+# 数据落在 watchlist.py 的 SQLite 库（default 分组），首次使用时自动迁移 SELF_SEL_FILE
+def load_self(list_name: str = DEFAULT_LIST):
+    return get_store().items(list_name)
 
 
-def save_self(data):
-    with open(SELF_SEL_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def save_self(data, list_name: str = DEFAULT_LIST):
+    get_store().replace([(item["code"], item.get("name", "")) for item in data], list_name)
 
 
-def add_stock(code: str, name: str = "") -> bool:
+def add_stock(code: str, name: str = "", list_name: str = DEFAULT_LIST) -> bool:
     """新增自选股；name 留空则自动查简称"""
     from analysis import normalize_symbol
     code = normalize_symbol(code)
-    lst = load_self()
-    if any(item["code"] == code for item in lst):
+    store = get_store()
+    if store.contains(code, list_name):
         return False                                    # 已存在
     name = name or _query_stock_name(code)
-    lst.append({"code": code, "name": name})
-    save_self(lst)
-    return True
+    return store.add(code, name, list_name)
 
 
-def del_stock(code):
+def del_stock(code, list_name: str = DEFAULT_LIST):
     from analysis import normalize_symbol
     code = normalize_symbol(code)
-    lst = [item for item in load_self() if item["code"] != code]
-    save_self(lst)
\ No newline at end of file
+    get_store().remove(code, list_name)
+
+
+# ---------- 批量导入 / 导出 ----------
+def parse_codes(text: str) -> list:
+    """
+    CSV / TXT / JSON / 粘贴板文本 → [(代码或简称, 附带的名称), ...]
+    JSON 同旧自选股文件格式；CSV 表头里有代码列时按列读（有名称列一并带上），
+    否则按空白、逗号、分号等切开，每一段当作一个代码或简称
+    """
+    text = text.lstrip("\ufeff").strip()
+    if not text:
+        return []
+    if text[0] in "[{":
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            pass
+        else:
+            data = data.get("items", []) if isinstance(data, dict) else data
+            out = []
+            for item in data:
+                if isinstance(item, dict) and item.get("code"):
+                    out.append((str(item["code"]), str(item.get("name") or "")))
+                elif isinstance(item, int):
+                    out.append((f"{item:06d}", ""))
+                elif isinstance(item, str) and item.strip():
+                    out.append((item.strip(), ""))
+            return out
+    delimiter = "\t" if "\t" in text.split("\n", 1)[0] else ","   # 从 Excel 复制出来是制表符分隔
+    rows = list(csv.reader(io.StringIO(text), delimiter=delimiter))
+    header = [h.strip().lower() for h in rows[0]] if rows else []
+    code_col = next((header.index(c) for c in CODE_COLUMNS if c in header), None)
+    if code_col is not None:
+        name_col = next((header.index(c) for c in NAME_COLUMNS if c in header), None)
+        out = []
+        for r in rows[1:]:
+            code = r[code_col].strip() if code_col < len(r) else ""
+            if code.isdigit() and len(code) < 6:
+                code = code.zfill(6)                    # Excel 存过的 CSV 会吃掉前导 0
+            if code:
+                out.append((code, r[name_col].strip() if name_col is not None and name_col < len(r) else ""))
+        return out
+    return [(token, "") for token in _SEPARATORS.split(text) if token]
+
+
+def import_stocks(source, list_name: str = DEFAULT_LIST) -> dict:
+    """
+    批量加入自选股：source 为 parse_codes 能读的文本，或代码列表 / [(代码, 名称), ...]
+    代码统一 normalize_symbol，认不出的按简称精确匹配；名称整批查一次本地代码目录（不逐只联网），
+    整批一个事务写入
+    返回 {"added": [...], "existing": [...], "invalid": [原始串, ...]}
+    """
+    from analysis import normalize_symbol
+    from symbols import get_directory
+    if isinstance(source, str):
+        pairs = parse_codes(source)
+    else:
+        pairs = [(str(c[0]), c[1] or "") if isinstance(c, (tuple, list)) else (str(c), "") for c in source]
+    directory = get_directory()
+    wanted, invalid = {}, []
+    for raw, name in pairs:
+        code = normalize_symbol(raw)
+        if not _VALID_SYMBOL.match(code):
+            bare = directory.code(raw)                  # 粘贴的可能是简称
+            code = normalize_symbol(bare) if bare else ""
+            if not _VALID_SYMBOL.match(code):
+                invalid.append(raw)
+                continue
+        if not wanted.get(code):
+            wanted[code] = name
+    names = directory.resolve_many(wanted, default="")
+    added = get_store().add_new([(code, names[code] or name) for code, name in wanted.items()], list_name)
+    new = set(added)
+    return {"added": added, "existing": [c for c in wanted if c not in new], "invalid": invalid}
+
+
+def export_stocks(list_name: str = DEFAULT_LIST, fmt: str = "csv") -> str:
+    """导出为 CSV（code,name 两列）或 JSON（旧自选股文件格式），都能原样再导入"""
+    items = load_self(list_name)
+    if fmt == "json":
+        return json.dumps(items, ensure_ascii=False, indent=2)
+    if fmt != "csv":
+        raise ValueError(f"不支持的导出格式：{fmt}")
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(["code", "name"])
+    writer.writerows((item["code"], item["name"]) for item in items)
+    return buf.getvalue()
+
+
+# ---------- 命令行 ----------
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="自选股批量导入 / 导出")
+    parser.add_argument("--list", default=DEFAULT_LIST, help="分组，myStock 用 favorites")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    i = sub.add_parser("import", help="从 CSV / TXT / JSON 文件导入")
+    i.add_argument("path")
+    e = sub.add_parser("export", help="导出到文件，按扩展名选 CSV / JSON")
+    e.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "import":
+        with open(args.path, "r", encoding="utf-8-sig") as f:
+            result = import_stocks(f.read(), args.list)
+        print(f"新增 {len(result['added'])}，已存在 {len(result['existing'])}，无法识别 {len(result['invalid'])}")
+        if result["invalid"]:
+            print("无法识别：" + " ".join(result["invalid"][:50]))
+        return result
+    fmt = "json" if args.path.lower().endswith(".json") else "csv"
+    with open(args.path, "w", encoding="utf-8-sig" if fmt == "csv" else "utf-8") as f:
+        f.write(export_stocks(args.list, fmt))
+    print(f"已导出 {len(load_self(args.list))} 只到 {args.path}")
+
+
+if __name__ == "__main__":
+    main()
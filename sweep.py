@@ -0,0 +1,236 @@
+"""
+背离参数寻优
+对底背离规则（divergence.BOTTOM_RULE，页面、回测、监控共用）的阈值（lookback、低点窗口、低点间隔、
+量比、跌幅、最少信号数、置信度权重）做网格或随机搜索，按历史信号的远期收益给每组参数排名；
+选出的一组可直接作为 params 传给 comprehensive_divergence_analysis
+复用顺序：指标每只股票只算一次；局部低点按 window 缓存；逐日低点对按 (lookback, window, min_days) 缓存；
+打分只取决于低点对本身，每组阈值只需对几十个不同的低点对打分；股票分批交给进程池并行
+用法：python sweep.py --universe watchlist --search random --n 300 --horizons 5 10 20 --out sweep.csv
+"""
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest import DEFAULT_PARAMS, HORIZONS, first_seen, latest_low_pairs, score_pairs
+
+# 每个参数的候选值；没列出的参数取 DEFAULT_PARAMS
+# 权重 w_* 只影响置信度，要和 min_confidence（低于它的信号不计，默认 0）一起搜才有意义
+SPACE = {
+    "lookback": [100, 150, 200, 250],
+    "window": [3, 5, 7, 10],
+    "min_days": [5, 10, 15, 20],
+    "vol_ratio": [1.0, 1.5, 2.0],
+    "price_drop": [0.0, 0.02, 0.03, 0.05],
+    "min_signals": [2, 3],
+}
+PAIR_KEYS = ("lookback", "window", "min_days")       # 决定低点对；其余只影响打分
+MIN_COUNT = 30                                       # 信号少于此数的参数组排在后面
+
+
+# ---------- 参数组合 ----------
+def grid(space: dict = None) -> list:
+    space = space or SPACE
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+
+def random_search(space: dict = None, n: int = 100, seed: int = 0) -> list:
+    """从网格里不放回地抽 n 组；不展开整张网格，按混合进制解码"""
+    space = space or SPACE
+    keys = list(space)
+    sizes = [len(space[k]) for k in keys]
+    total = int(np.prod(sizes))
+    picks = np.random.default_rng(seed).choice(total, min(n, total), replace=False)
+    out = []
+    for code in picks:
+        combo = {}
+        for k, size in zip(reversed(keys), reversed(sizes)):
+            code, i = divmod(int(code), size)
+            combo[k] = space[k][i]
+        out.append({k: combo[k] for k in keys})
+    return out
+
+
+def with_default(combos: list, space: dict = None) -> list:
+    """补上当前默认参数那一组，报表里作为基准"""
+    default = {k: DEFAULT_PARAMS.get(k, 0) for k in space or SPACE}
+    return combos if default in combos else combos + [default]
+
+
+# ---------- 单只股票（在子进程里执行） ----------
+def _stats_width(horizons) -> int:
+    return 4 + 4 * len(horizons)
+
+
+def prepare(df: pd.DataFrame, horizons=HORIZONS) -> dict:
+    """指标 + 各持有期远期收益，整段只算一次"""
+    from backtest import _prepare
+    df = _prepare(df)
+    close = df["close"].to_numpy(dtype=float)
+    n = len(close)
+    fwd = np.full((len(horizons), n), np.nan)
+    for k, h in enumerate(horizons):
+        if h < n:
+            fwd[k, :n - h] = close[h:] / close[:n - h] - 1
+    return {
+        "day_ns": pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[ns]").view(np.int64),
+        "close": close,
+        "macd": df["macd"].to_numpy(dtype=float),
+        "dif": df["macd_dif"].to_numpy(dtype=float),
+        "rsi": df["rsi"].to_numpy(dtype=float),
+        "volume": df["volume"].to_numpy(dtype=float),
+        "fwd": fwd,
+    }
+
+
+def evaluate(prep: dict, combos: list, horizons=HORIZONS) -> np.ndarray:
+    """
+    每组参数一行可累加的统计量：信号数、强烈 / 小 / 普通背离数，各持有期的 样本数、和、平方和、上涨数
+    多只股票的结果直接相加即可合并
+    """
+    from analysis import local_low_positions
+    out = np.zeros((len(combos), _stats_width(horizons)))
+    pivots, pairs = {}, {}
+    for c, combo in enumerate(combos):
+        p = {**DEFAULT_PARAMS, **combo}
+        w = p["window"]
+        if w not in pivots:
+            pivots[w] = local_low_positions(prep["close"], w)
+        key = tuple(p[k] for k in PAIR_KEYS)
+        if key not in pairs:
+            i1, i2 = latest_low_pairs(prep["day_ns"], prep["close"], p["lookback"], w, p["min_days"],
+                                      candidates=pivots[w])
+            t = first_seen(i1, i2)
+            pairs[key] = (t, i1[t], i2[t])
+        t, i1, i2 = pairs[key]
+        if not len(t):
+            continue
+        scored = score_pairs(i1, i2, prep["close"], prep["macd"], prep["dif"], prep["rsi"], prep["volume"], p)
+        keep = scored["valid"].to_numpy()
+        if p.get("min_confidence"):
+            keep = keep & (scored["confidence"].to_numpy() >= p["min_confidence"])
+        if not keep.any():
+            continue
+        level = scored["level"].to_numpy()[keep]
+        out[c, 0] = keep.sum()
+        out[c, 1:4] = [(level == 3).sum(), (level == 2).sum(), (level == 1).sum()]
+        r = prep["fwd"][:, t[keep]]
+        ok = ~np.isnan(r)
+        r0 = np.where(ok, r, 0.0)
+        out[c, 4::4] = ok.sum(axis=1)
+        out[c, 5::4] = r0.sum(axis=1)
+        out[c, 6::4] = (r0 * r0).sum(axis=1)
+        out[c, 7::4] = (r0 > 0).sum(axis=1)
+    return out
+
+
+def _sweep_chunk(items, combos, horizons):
+    # items：[(代码, 日线 或 None)]，None 时在子进程里读本地缓存，省掉父进程序列化整段历史
+    from bar_cache import get_cache
+    acc = np.zeros((len(combos), _stats_width(horizons)))
+    for symbol, df in items:
+        df = get_cache().read(symbol) if df is None else df
+        if df is None or len(df) < 60:
+            continue
+        acc += evaluate(prepare(df, horizons), combos, horizons)
+    return acc
+
+
+# ---------- 汇总 ----------
+def report(stats: np.ndarray, combos: list, horizons=HORIZONS, rank_by: str = None,
+           min_count: int = MIN_COUNT) -> pd.DataFrame:
+    """
+    每组参数一行：信号数、各级别数、各持有期 平均收益 / 胜率 / 标准差 / t 值（均值 ÷ 标准误）
+    默认按最长持有期的 t 值排名，信号数不足 min_count 的排在后面
+    """
+    df = pd.DataFrame(combos)
+    df["signals"] = stats[:, 0].astype(int)
+    for k, name in enumerate(("strong", "minor", "normal")):
+        df[name] = stats[:, 1 + k].astype(int)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for k, h in enumerate(horizons):
+            n, s, ss, win = (stats[:, 4 + 4 * k + j] for j in range(4))
+            mean = s / n
+            std = np.sqrt(np.maximum(ss / n - mean ** 2, 0) * n / (n - 1))
+            df[f"mean_{h}d"] = mean
+            df[f"hit_{h}d"] = win / n
+            df[f"std_{h}d"] = std
+            df[f"t_{h}d"] = mean / std * np.sqrt(n)
+    df["is_default"] = [all(v == DEFAULT_PARAMS.get(k, 0) for k, v in c.items()) for c in combos]
+    rank_by = rank_by or f"t_{horizons[-1]}d"
+    df["_enough"] = df["signals"] >= min_count
+    df = df.sort_values(["_enough", rank_by], ascending=False, na_position="last", kind="stable")
+    df = df.drop(columns="_enough").reset_index(drop=True)
+    df.insert(0, "rank", np.arange(1, len(df) + 1))
+    return df
+
+
+def sweep(symbols=None, frames: dict = None, combos: list = None, horizons=HORIZONS, workers: int = None,
+          chunksize: int = 8, rank_by: str = None, min_count: int = MIN_COUNT) -> pd.DataFrame:
+    """
+    frames：{代码: 日线}，给了就直接用；否则按 symbols 在子进程里读本地日线缓存
+    combos：参数组列表，默认整张 SPACE 网格；workers：进程数，默认 CPU 核数，1 为当前进程串行
+    """
+    combos = combos or with_default(grid())
+    horizons = tuple(horizons)
+    items = list(frames.items()) if frames is not None else [(s, None) for s in dict.fromkeys(symbols or [])]
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+    stats = np.zeros((len(combos), _stats_width(horizons)))
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            stats += _sweep_chunk(chunk, combos, horizons)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            for part in pool.map(_sweep_chunk, chunks, itertools.repeat(combos), itertools.repeat(horizons)):
+                stats += part
+    return report(stats, combos, horizons, rank_by, min_count)
+
+
+# ---------- 命令行 ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="背离参数寻优")
+    parser.add_argument("symbols", nargs="*", help="股票代码；留空则用 --universe")
+    parser.add_argument("--universe", choices=["watchlist", "all"], default="watchlist")
+    parser.add_argument("--search", choices=["grid", "random"], default="grid")
+    parser.add_argument("--n", type=int, default=200, help="随机搜索的组数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--space", help="JSON 文件，{参数: [候选值]}，覆盖默认搜索空间")
+    parser.add_argument("--horizons", type=int, nargs="+", default=list(HORIZONS))
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认 CPU 核数")
+    parser.add_argument("--rank-by", help="排名列，默认最长持有期的 t 值，如 mean_20d / hit_10d")
+    parser.add_argument("--min-count", type=int, default=MIN_COUNT)
+    parser.add_argument("--offline", action="store_true", help="只用本地缓存，不联网")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--out", help="完整报表保存为 CSV")
+    args = parser.parse_args(argv)
+
+    from analysis import normalize_symbol
+    from screener import load_universe
+    symbols = [normalize_symbol(s) for s in args.symbols] or load_universe(args.universe)
+    if not args.offline:
+        from bar_cache import get_cache
+        get_cache().refresh_many(symbols)
+    space = SPACE
+    if args.space:
+        with open(args.space, "r", encoding="utf-8") as f:
+            space = json.load(f)
+    combos = grid(space) if args.search == "grid" else random_search(space, args.n, args.seed)
+    result = sweep(symbols, combos=with_default(combos, space), horizons=args.horizons, workers=args.workers,
+                   rank_by=args.rank_by, min_count=args.min_count)
+    print(result.head(args.top).to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    base = result[result["is_default"]]
+    if len(base):
+        print(f"\n默认参数排第 {int(base['rank'].iloc[0])} / {len(result)}")
+    if args.out:
+        result.to_csv(args.out, index=False, encoding="utf-8-sig")
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+股票代码 ↔ 简称目录
+全市场列表只下载一次并落盘（带 TTL），之后按纯代码 / 带前缀代码 / 简称前缀做内存字典查询
+"""
+import bisect
+import json
+import os
+import threading
+import time
+
+SYMBOLS_FILE = os.path.join("data", "symbols.json")
+SYMBOLS_TTL = 24 * 3600          # 列表一天刷新一次，新股上市当天可能查不到
+RETRY_AFTER = 60                 # 下载失败后多久再试，避免每次查询都打网络
+
+PREFIXES = ("sh", "sz", "bj")
+
+
+# ---------- 数据源 ----------
+def akshare_code_name_source():
+    """默认数据源：返回 [(code, name), ...]"""
+    import akshare as ak
+    df = ak.stock_info_a_code_name()
+    return list(zip(df["code"].astype(str), df["name"].astype(str)))
+
+
+def bare_code(symbol: str) -> str:
+    """sh600519 / SZ000001 / 000001 → 纯 6 位代码"""
+    code = str(symbol).strip().lower()
+    for pre in PREFIXES:
+        if code.startswith(pre):
+            return code[2:]
+    return code
+
+
+# ---------- 目录 ----------
+class SymbolDirectory:
+    """
+    线程安全的懒加载目录；所有查询都是 O(1) 字典或 O(log n) 二分
+    """
+
+    def __init__(self, path: str = SYMBOLS_FILE, source=akshare_code_name_source, ttl: float = SYMBOLS_TTL,
+                 fetcher=None):
+        self.path = path
+        self.source = source
+        self.ttl = ttl
+        self.fetcher = fetcher                          # None 用进程共享的取数器
+        self._lock = threading.Lock()
+        self._by_code = None
+        self._by_name = {}
+        self._sorted_names = []
+        self._loaded_at = 0.0
+
+    # ----- 加载 -----
+    def _read_disk(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data["fetched_at"], data["rows"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return 0.0, []
+
+    def _write_disk(self, rows):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": time.time(), "rows": rows}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _download(self):
+        """经取数层下载全市场列表：限速、超时、重试，多个线程同时过期只下载一次"""
+        from fetcher import run_one
+        return [[c, n] for c, n in run_one(("symbols", self.path), self.source, fetcher=self.fetcher)]
+
+    def _build(self, rows, fetched_at):
+        self._by_code = {str(c): str(n) for c, n in rows}
+        self._by_name = {n: c for c, n in self._by_code.items()}
+        self._sorted_names = sorted(self._by_name)
+        self._loaded_at = fetched_at
+
+    def _ensure_loaded(self):
+        now = time.time()
+        if self._by_code is not None and now - self._loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self._by_code is not None and now - self._loaded_at < self.ttl:
+                return
+            fetched_at, rows = self._read_disk()
+            if rows and now - fetched_at < self.ttl:
+                self._build(rows, fetched_at)
+                return
+            try:
+                fresh = self._download()
+                self._write_disk(fresh)
+                self._build(fresh, now)
+                return
+            except Exception:
+                pass
+            # 联网失败：先用过期的本地数据（没有就空目录），RETRY_AFTER 秒后再试
+            if rows or self._by_code is None:
+                self._build(rows, 0.0)
+            self._loaded_at = now - self.ttl + RETRY_AFTER
+
+    def refresh(self):
+        """强制重新下载"""
+        with self._lock:
+            fresh = self._download()
+            self._write_disk(fresh)
+            self._build(fresh, time.time())
+
+    # ----- 查询 -----
+    def name(self, symbol: str, default=None):
+        """纯代码或 sh/sz/bj 前缀代码 → 简称"""
+        self._ensure_loaded()
+        return self._by_code.get(bare_code(symbol), default)
+
+    def code(self, name: str, default=None):
+        """简称精确匹配 → 纯代码"""
+        self._ensure_loaded()
+        return self._by_name.get(name.strip(), default)
+
+    def search(self, prefix: str, limit: int = 20):
+        """简称前缀搜索，返回 [(code, name), ...]"""
+        self._ensure_loaded()
+        prefix = prefix.strip()
+        if not prefix:
+            return []
+        names = self._sorted_names
+        out = []
+        i = bisect.bisect_left(names, prefix)
+        while i < len(names) and names[i].startswith(prefix) and len(out) < limit:
+            out.append((self._by_name[names[i]], names[i]))
+            i += 1
+        return out
+
+    def resolve_many(self, symbols, default=None) -> dict:
+        """整批解析：{输入代码: 简称}，只触发一次加载"""
+        self._ensure_loaded()
+        get = self._by_code.get
+        return {s: get(bare_code(s), default) for s in symbols}
+
+    def codes(self):
+        """全市场纯代码列表"""
+        self._ensure_loaded()
+        return list(self._by_code)
+
+    def __contains__(self, symbol) -> bool:
+        self._ensure_loaded()
+        return bare_code(symbol) in self._by_code
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._by_code)
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_directory() -> SymbolDirectory:
+    """进程内共享的目录实例"""
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                _directory = SymbolDirectory()
+    return _directory
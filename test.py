@@ -1,29 +1,13 @@
-import akshare as ak
-
 def get_stock_name(symbol: str) -> str:
     """
     根据股票代码获取股票名称（支持 sz/sh/bj）
     例如: sz000001, sh600519, bj430047
     """
     try:
-        # 清洗代码前缀
-        if symbol.startswith("sz"):
-            code = symbol[2:]
-            market = "sz"
-        elif symbol.startswith("sh"):
-            code = symbol[2:]
-            market = "sh"
-        elif symbol.startswith("bj"):
-            code = symbol[2:]
-            market = "bj"
-        else:
-            code = symbol
-            market = "sz"
-
-        stock_list = ak.stock_info_a_code_name()  # 获取沪深所有股票列表
-        name = stock_list.loc[stock_list["code"] == code, "name"]
-        if not name.empty:
-            return name.values[0]
+        from symbols import get_directory
+        name = get_directory().name(symbol)
+        if name:
+            return name
         else:
             return f"未找到股票代码 {symbol} 对应名称"
     except Exception as e:
@@ -0,0 +1,47 @@
+import os
+import sys
+
+# 项目模块都在仓库根目录，不是安装包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+class FakeBarCache:
+    """screener 用的假行情缓存：每只股票的K线由代码数字决定，不联网"""
+
+    def __init__(self, bars: int = 300):
+        self.bars = bars
+        self.refreshed = []
+
+    def read(self, symbol, adjust="qfq"):
+        from synthetic import make_bars
+        return make_bars(self.bars, int(symbol[2:]))
+
+    def get(self, symbol, n=150, adjust="qfq", refresh=True):
+        df = self.read(symbol, adjust)
+        return df.tail(n) if n else df
+
+    def refresh_many(self, symbols, adjust="qfq", fetcher=None):
+        self.refreshed.append(list(symbols))
+        return {s: self.read(s, adjust) for s in symbols}
+
+
+class FakeDirectory:
+    def resolve_many(self, codes, default=""):
+        return {c: c.upper() for c in codes}
+
+
+@pytest.fixture
+def fake_screen_env(tmp_path, monkeypatch):
+    """在临时目录里跑 screener.screen：假行情缓存 + 假代码目录，信号库 / 注册表都落在 tmp_path/data"""
+    import bar_cache
+    import signal_store
+    import symbols
+
+    monkeypatch.chdir(tmp_path)
+    cache = FakeBarCache()
+    monkeypatch.setattr(bar_cache, "get_cache", lambda: cache)
+    monkeypatch.setattr(symbols, "get_directory", lambda: FakeDirectory())
+    monkeypatch.setattr(signal_store, "_store", None)
+    return cache
@@ -0,0 +1,21 @@
+"""
+测试共用的合成日线：确定性随机游走，不联网
+"""
+import numpy as np
+import pandas as pd
+
+
+def make_bars(n, seed=0):
+    """列与 ak.stock_zh_a_daily 一致；第 200~215 根是一字横盘（KDJ 分母为 0 的边界）"""
+    rng = np.random.default_rng(seed)
+    close = np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.02, n))), 2)
+    df = pd.DataFrame({
+        "date": pd.bdate_range("2012-01-02", periods=n),
+        "open": close,
+        "high": np.round(close * (1 + rng.uniform(0, 0.03, n)), 2),
+        "low": np.round(close * (1 - rng.uniform(0, 0.03, n)), 2),
+        "close": close,
+        "volume": rng.uniform(1e5, 1e7, n),
+    })
+    df.loc[200:215, ["high", "low", "close"]] = 8.0
+    return df
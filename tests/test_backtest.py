@@ -0,0 +1,68 @@
+"""
+回测逐日判定与“截至当天切片后调用 comprehensive_divergence_analysis”完全一致
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import comprehensive_divergence_analysis
+from backtest import _prepare, backtest_symbol, latest_low_pairs, level_name, score_pairs
+from synthetic import make_bars
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_daily_replay_matches_sliced_analysis(seed):
+    df = _prepare(make_bars(500, seed))
+    day_ns = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    close = df["close"].to_numpy(float)
+    idx1, idx2 = latest_low_pairs(day_ns, close)
+    scored = score_pairs(idx1, idx2, close, df["macd"].to_numpy(), df["macd_dif"].to_numpy(),
+                         df["rsi"].to_numpy(), df["volume"].to_numpy())
+
+    for t in range(30, len(df)):
+        res, _ = comprehensive_divergence_analysis(df.iloc[:t + 1])
+        if res is None:
+            assert not scored["valid"][t], t
+            continue
+        assert scored["valid"][t], t
+        assert df["date"][idx1[t]] == res["date1"] and df["date"][idx2[t]] == res["date2"]
+        assert level_name(scored["level"][t]) == res["level"]
+        assert scored["confidence"][t] == res["confidence"]
+
+
+def test_events_are_deduplicated_and_forward_returns_align():
+    df = make_bars(1200, seed=7)
+    events = backtest_symbol(df, "sz000001", horizons=(5,))
+    assert not events.duplicated(["date1", "date2"]).any()
+    closes = df.set_index("date")["close"]
+    row = events[events["ret_5d"].notna()].iloc[0]
+    pos = closes.index.get_loc(row["date"])
+    assert row["ret_5d"] == pytest.approx(closes.iloc[pos + 5] / closes.iloc[pos] - 1)
+
+
+def test_params_come_from_the_rule_and_reach_the_analysis():
+    import backtest
+    import divergence
+
+    assert backtest.DEFAULT_PARAMS == divergence.rule_params(divergence.BOTTOM_RULE)
+    assert backtest.DEFAULT_PARAMS["vol_ratio"] == 1.5 and backtest.DEFAULT_PARAMS["w_macd"] == 0.3
+
+    # 扫描选出的一组参数：页面的分析函数与向量化打分给出同样的结论
+    params = {"lookback": 100, "window": 3, "min_days": 5, "vol_ratio": 1.0, "price_drop": 0.0, "min_signals": 3,
+              "w_rsi": 0.4, "levels": (("强烈背离", 2, 0.9, 0.9), ("小背离", 1, 0.5, 0.6), ("普通背离", 0, 0.5, 0.5))}
+    p = {**backtest.DEFAULT_PARAMS, **params}
+    df = _prepare(make_bars(400, 5))
+    day_ns = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    close = df["close"].to_numpy(float)
+    idx1, idx2 = latest_low_pairs(day_ns, close, p["lookback"], p["window"], p["min_days"])
+    scored = score_pairs(idx1, idx2, close, df["macd"].to_numpy(), df["macd_dif"].to_numpy(),
+                         df["rsi"].to_numpy(), df["volume"].to_numpy(), p)
+    hits = 0
+    for t in range(30, len(df)):
+        res, _ = comprehensive_divergence_analysis(df.iloc[:t + 1], params=params)
+        assert (res is not None) == scored["valid"][t], t
+        if res is not None:
+            hits += 1
+            assert level_name(scored["level"][t]) == res["level"]
+            assert scored["confidence"][t] == pytest.approx(res["confidence"])
+    assert hits
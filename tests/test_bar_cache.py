@@ -0,0 +1,136 @@
+"""
+日线缓存：只补拉缺失的尾部、除权后整段重拉、联网检查的节奏、取最近 N 根
+"""
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import bar_cache
+from fetcher import AsyncFetcher
+from synthetic import make_bars
+
+
+class _Feed:
+    """假数据源：available 控制“今天”之前能拉到多少根，记录每次请求的起始日"""
+
+    def __init__(self, history: pd.DataFrame, available: int):
+        self.history = history
+        self.available = available
+        self.starts = []
+
+    def __call__(self, symbol, start_date, end_date, adjust="qfq"):
+        self.starts.append(start_date)
+        df = self.history.iloc[:self.available]
+        return df[df["date"] >= pd.Timestamp(start_date)].reset_index(drop=True)
+
+
+def _expire(cache, symbol, adjust="qfq"):
+    key = cache._key(symbol, adjust)
+    cache._save_meta(key, {**cache._load_meta(key), "checked_at": 0})
+
+
+def test_refresh_fetches_only_missing_tail(tmp_path):
+    hist = make_bars(120, seed=1)
+    feed = _Feed(hist, 100)
+    cache = bar_cache.BarCache(str(tmp_path), source=feed)
+    assert len(cache.refresh("sz000001")) == 100
+    assert feed.starts == ["19900101"]
+
+    feed.available = 105
+    assert len(cache.refresh("sz000001")) == 100            # 刚检查过，不联网
+    assert len(feed.starts) == 1
+
+    _expire(cache, "sz000001")
+    df = cache.refresh("sz000001")
+    assert feed.starts[-1] == f"{hist['date'].iloc[99]:%Y%m%d}"     # 从本地最后一天开始补
+    pd.testing.assert_frame_equal(df, hist.iloc[:105].reset_index(drop=True), check_dtype=False)
+    assert cache.last_date("sz000001") == hist["date"].iloc[104]
+    pd.testing.assert_frame_equal(cache.read("sz000001"), df)
+
+
+def test_adjustment_mismatch_forces_full_refetch(tmp_path):
+    hist = make_bars(120, seed=2)
+    feed = _Feed(hist, 100)
+    cache = bar_cache.BarCache(str(tmp_path), source=feed)
+    cache.refresh("sz000002")
+
+    # 除权：前复权历史整体下移，超出 PRICE_TOL
+    adjusted = hist.copy()
+    adjusted[["open", "high", "low", "close"]] *= 0.9
+    feed.history, feed.available = adjusted, 103
+    _expire(cache, "sz000002")
+    df = cache.refresh("sz000002")
+    assert feed.starts[-2:] == [f"{hist['date'].iloc[99]:%Y%m%d}", "19900101"]
+    pd.testing.assert_frame_equal(df, adjusted.iloc[:103].reset_index(drop=True), check_dtype=False)
+
+    # 误差在容差内不算除权
+    nudged = adjusted.copy()
+    nudged.loc[102, "close"] += bar_cache.PRICE_TOL / 2
+    feed.history, feed.available = nudged, 104
+    _expire(cache, "sz000002")
+    cache.refresh("sz000002")
+    assert feed.starts[-1] != "19900101"
+
+
+def test_freshness_ttl_and_market_close(tmp_path, monkeypatch):
+    close = bar_cache._last_close_time
+    assert close(datetime(2024, 5, 14, 16, 0)) == datetime(2024, 5, 14, 15, 30)     # 周二收盘后
+    assert close(datetime(2024, 5, 14, 10, 0)) == datetime(2024, 5, 13, 15, 30)     # 盘中 → 昨收
+    assert close(datetime(2024, 5, 13, 9, 0)) == datetime(2024, 5, 10, 15, 30)      # 周一早上 → 周五
+    assert close(datetime(2024, 5, 18, 12, 0)) == datetime(2024, 5, 17, 15, 30)     # 周六 → 周五
+
+    cache = bar_cache.BarCache(str(tmp_path), source=_Feed(make_bars(10), 10), ttl=600)
+    now = time.time()
+    monkeypatch.setattr(bar_cache, "_last_close_time", lambda _now: datetime.fromtimestamp(now - 3600))
+    assert cache._is_fresh({"checked_at": now - 10})                 # TTL 内
+    assert cache._is_fresh({"checked_at": now - 1800})               # 过了 TTL，但在最近一次收盘之后
+    assert not cache._is_fresh({"checked_at": now - 7200})           # 收盘前检查的，收盘后要再拉
+    assert not cache._is_fresh({})
+
+
+def test_get_tail_and_bounded_memo(tmp_path):
+    hist = make_bars(80, seed=3)
+    cache = bar_cache.BarCache(str(tmp_path), source=_Feed(hist, 80), memo_size=2)
+    for s in ("sz000001", "sz000002", "sz000003"):
+        cache.refresh(s)
+    tail = cache.get("sz000001", n=20, refresh=False)
+    pd.testing.assert_frame_equal(tail, cache.read("sz000001").iloc[-20:])
+    assert len(cache.get("sz000001", n=0, refresh=False)) == 80
+    assert cache.get("sh999999", n=20, refresh=False).empty
+
+    for s in ("sz000001", "sz000002", "sz000003"):
+        cache.read(s)
+    assert list(cache._frames) == [cache.path(s) for s in ("sz000002", "sz000003")]
+
+
+def test_fetches_go_through_fetcher(tmp_path):
+    hist = make_bars(60, seed=4)
+    feed = _Feed(hist, 60)
+    calls = []
+
+    def flaky(symbol, start_date, end_date, adjust="qfq"):
+        calls.append(symbol)
+        if len(calls) == 1:
+            raise ConnectionError("断线")
+        return feed(symbol, start_date, end_date, adjust)
+
+    f = AsyncFetcher(retries=1, backoff=0.01)
+    cache = bar_cache.BarCache(str(tmp_path), source=flaky)
+    assert len(cache.refresh("sz000001", fetcher=f)) == 60                  # 第一次失败由取数层重试
+    assert f.stats == {"calls": 2, "coalesced": 0, "retries": 1, "failures": 0}
+
+    got = cache.refresh_many(["sz000002", "sz000003", "sz000001"], fetcher=f)
+    assert all(len(df) == 60 for df in got.values()) and f.stats["calls"] == 4
+
+
+def test_read_result_can_be_modified(tmp_path):
+    hist = make_bars(30, seed=5)
+    cache = bar_cache.BarCache(str(tmp_path), source=_Feed(hist, 30))
+    cache.refresh("sz000001")
+    first = cache.read("sz000001")
+    first.loc[0, "close"] = -1.0
+    first["extra"] = 1
+    again = cache.read("sz000001")                      # 命中内存缓存，不受上一个调用方改动的影响
+    assert again["close"].iloc[0] == hist["close"].iloc[0] and "extra" not in again.columns
+    assert len(cache.get("sz000001", n=10, refresh=False)) == 10
@@ -0,0 +1,82 @@
+"""
+LTTB 降采样与 WebGL 背离图
+"""
+import numpy as np
+import pandas as pd
+
+import charts
+from analysis import compute_enhanced_indicators, comprehensive_divergence_analysis
+from synthetic import make_bars
+
+
+def _lttb_reference(x, y, n_out):
+    """教科书式逐桶实现，用来核对向量化版本"""
+    n = len(x)
+    every = (n - 2) / (n_out - 2)
+    out, a = [0], 0
+    for i in range(n_out - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nlo, nhi = hi, min(int((i + 2) * every) + 1, n)
+        if i == n_out - 3:
+            nlo, nhi = n - 1, n
+        ax, ay = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        best, a_next = -1.0, lo
+        for k in range(lo, hi):
+            area = abs((x[a] - ax) * (y[k] - y[a]) - (x[a] - x[k]) * (ay - y[a]))
+            if area > best:
+                best, a_next = area, k
+        a = a_next
+        out.append(a)
+    return np.array(out + [n - 1])
+
+
+def test_lttb_matches_reference():
+    rng = np.random.default_rng(0)
+    y = np.cumsum(rng.normal(size=5000))
+    x = np.arange(len(y), dtype=float) * 1.4
+    for n_out in (3, 10, 500, 1777):
+        idx = charts.lttb(x, y, n_out)
+        assert len(idx) == n_out and idx[0] == 0 and idx[-1] == len(y) - 1
+        assert np.all(np.diff(idx) > 0)
+        assert np.array_equal(idx, _lttb_reference(x, y, n_out))
+    assert np.array_equal(charts.lttb(x[:100], y[:100], 500), np.arange(100))
+
+
+def test_downsample_skips_nan_and_forces_keep():
+    y = np.sin(np.linspace(0, 60, 3000))
+    y[:30] = np.nan
+    x = np.arange(len(y), dtype=float)
+    keep = np.array([5, 1234, 2222, 2999])
+    idx = charts.downsample(x, y, 400, keep)
+    assert len(idx) <= 400
+    assert not np.isnan(y[idx]).any()
+    assert {1234, 2222, 2999} <= set(idx) and 5 not in idx
+
+
+def test_figure_uses_webgl_and_keeps_pivots():
+    df = compute_enhanced_indicators(make_bars(2500, seed=3), backend="fast")
+    div, _ = comprehensive_divergence_analysis(df)
+    assert div
+    fig = charts.divergence_figure(df, div, "测试", max_points=600)
+    lines = [t for t in fig.data if t.mode == "lines" and t.showlegend is not False]
+    assert [t.name for t in lines] == ["收盘价", "MA5", "MA20", "MACD", "DIF", "DEA"]
+    assert all(type(t).__name__ == "Scattergl" for t in lines)
+    close = lines[0]
+    assert len(close.x) <= 600
+    xs = set(pd.to_datetime(close.x))
+    assert pd.Timestamp(div["date1"]) in xs and pd.Timestamp(div["date2"]) in xs
+    assert "底背离可视化" in fig.layout.title.text
+
+    plain = charts.divergence_figure(df.tail(150), None, "测试")
+    assert len(plain.data) == 6 and len(plain.data[0].x) == 150
+    assert "价格与均线" in plain.layout.title.text
+
+
+def test_cached_figure_built_once_per_last_bar():
+    df = compute_enhanced_indicators(make_bars(400, seed=5), backend="fast")
+    last = str(df["date"].iloc[-1])
+    a = charts.cached_figure("t000009", last, df, None, "x")
+    assert charts.cached_figure("t000009", last, df, None, "x") is a
+    longer = compute_enhanced_indicators(make_bars(401, seed=5), backend="fast")
+    b = charts.cached_figure("t000009", str(longer["date"].iloc[-1]), longer, None, "x")
+    assert b is not a
@@ -0,0 +1,65 @@
+"""
+通用背离引擎：默认规则与 comprehensive_divergence_analysis 一致，顶背离与自定义指标
+"""
+import numpy as np
+import pandas as pd
+
+import divergence
+from analysis import compute_enhanced_indicators, comprehensive_divergence_analysis
+from synthetic import make_bars
+
+
+def test_last_pair_matches_original():
+    checked = 0
+    for seed in range(8):
+        full = compute_enhanced_indicators(make_bars(700, seed=seed), backend="fast")
+        for end in range(160, 700, 23):
+            df = full.iloc[:end]
+            ref, _ = comprehensive_divergence_analysis(df)
+            got = divergence.detect(df, pairs="last")
+            if ref is None:
+                assert got.empty
+                continue
+            row = got.iloc[0]
+            assert (row["level"], row["date1"], row["date2"]) == (ref["level"], ref["date1"], ref["date2"])
+            assert row["confidence"] == ref["confidence"]
+            assert row["signals"] == ",".join(ref["signals"])
+            checked += 1
+    assert checked > 10
+
+
+def test_all_pairs_contains_last_pair():
+    df = compute_enhanced_indicators(make_bars(400, seed=5), backend="fast")
+    last = divergence.detect(df, pairs="last")
+    every = divergence.detect(df, pairs="all")
+    assert len(every) >= len(last)
+    if not last.empty:
+        keys = set(zip(every["date1"], every["date2"]))
+        assert (last["date1"].iloc[0], last["date2"].iloc[0]) in keys
+
+
+def _zigzag(peaks, osc):
+    """价格在 peaks 处见顶，osc 为同位置的指标值，其余位置线性插值"""
+    n = 120
+    pos = np.array([0, 20, 35, 50, 65, 80, 95, 110, n - 1])          # 峰谷交替
+    price = np.interp(np.arange(n), pos, [8, peaks[0], 8, peaks[1], 8, peaks[2], 8, peaks[3], 8])
+    x = np.interp(np.arange(n), pos, [0, osc[0], 0, osc[1], 0, osc[2], 0, osc[3], 0])
+    return pd.DataFrame({"date": pd.bdate_range("2020-01-01", periods=n), "close": price, "x": x})
+
+
+def test_top_divergence_on_custom_column():
+    rule = {
+        **divergence.TOP_RULE, "min_signals": 1,
+        "signals": [{"name": "X顶背离", "column": "x", "test": "diverge", "weight": 1.0, "core": True}],
+        "levels": [{"name": "顶背离", "min_core": 1, "scale": 1.0, "cap": 1.0},
+                   {"name": "无", "min_core": 0, "scale": 0.0, "cap": 0.0}],
+    }
+    df = _zigzag(peaks=[10, 11, 12, 13], osc=[5, 4, 6, 3])
+    got = divergence.detect(df, rule, pairs="all")
+    pairs = set(zip(got["date1"], got["date2"]))
+    # 价格逐个新高；指标 5→4、5→3、4→3、6→3 走低成立，5→6、4→6 不成立
+    dates = df["date"]
+    expect = {(dates[a], dates[b]) for a, b in [(20, 50), (20, 110), (50, 110), (80, 110)]}
+    assert pairs == expect
+    assert (got["level"] == "顶背离").all()
+
@@ -0,0 +1,103 @@
+"""
+异步取数层：合并重复请求、令牌桶限速、重试退避、超时按时返回
+"""
+import asyncio
+import threading
+import time
+
+import fetcher
+
+
+class _Api:
+    """假 akshare：记录每次调用，可设置延时和前几次失败"""
+
+    def __init__(self, delay=0.0, fail_first=0):
+        self.delay = delay
+        self.fail_first = fail_first
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def stock_zh_index_daily(self, symbol):
+        with self._lock:
+            self.calls.append(symbol)
+            n = len(self.calls)
+        time.sleep(self.delay)
+        if n <= self.fail_first:
+            raise ConnectionError(f"第 {n} 次失败")
+        return f"bars:{symbol}"
+
+
+def _requests(*symbols):
+    return [("stock_zh_index_daily", {"symbol": s}) for s in symbols]
+
+
+def test_duplicate_keys_are_coalesced():
+    api = _Api(delay=0.1)
+    f = fetcher.AsyncFetcher(api=api)
+    got = fetcher.fetch_many(_requests("sh000001", "sh000001", "sz399001", "sh000001"), f)
+    assert got == ["bars:sh000001", "bars:sh000001", "bars:sz399001", "bars:sh000001"]
+    assert sorted(api.calls) == ["sh000001", "sz399001"]
+    assert f.stats["coalesced"] == 2
+
+    # 两个线程各自 asyncio.run，同时请求同一个键，也只访问一次
+    api.calls.clear()
+    out = []
+    threads = [threading.Thread(target=lambda: out.extend(fetcher.fetch_many(_requests("sh000300"), f)))
+               for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert out == ["bars:sh000300"] * 3 and api.calls == ["sh000300"]
+
+
+def test_token_bucket_paces_requests_across_calls():
+    api = _Api()
+    f = fetcher.AsyncFetcher(rate=20, burst=2, max_concurrency=50, api=api)
+    t0 = time.perf_counter()
+    fetcher.fetch_many(_requests(*(f"sh{k:06d}" for k in range(2))), f)
+    fetcher.fetch_many(_requests(*(f"sz{k:06d}" for k in range(6))), f)
+    # 前两个用掉令牌，后六个按 20 次/秒放行：至少 6 / 20 秒（只断言下限）
+    assert time.perf_counter() - t0 >= 6 / 20 * 0.9
+    assert len(api.calls) == 8
+
+
+def test_retries_back_off_exponentially(monkeypatch):
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def _sleep(seconds, *args, **kwargs):
+        sleeps.append(seconds)
+        return await real_sleep(0)
+
+    monkeypatch.setattr(fetcher.random, "uniform", lambda a, b: 1.0)
+    monkeypatch.setattr(fetcher.asyncio, "sleep", _sleep)
+    api = _Api(fail_first=2)
+    f = fetcher.AsyncFetcher(retries=3, backoff=0.5, max_backoff=8.0, api=api)
+    assert fetcher.fetch_many(_requests("sh000001"), f) == ["bars:sh000001"]
+    assert f.stats == {"calls": 3, "coalesced": 0, "retries": 2, "failures": 0}
+    assert sleeps == [0.5, 1.0]
+
+    sleeps.clear()
+    api = _Api(fail_first=10)
+    f = fetcher.AsyncFetcher(retries=4, backoff=2.0, max_backoff=5.0, api=api)
+    [err] = fetcher.fetch_many(_requests("sh000001"), f)
+    assert isinstance(err, ConnectionError) and len(api.calls) == 5
+    assert f.stats["failures"] == 1 and f.stats["retries"] == 4
+    assert sleeps == [2.0, 4.0, 5.0, 5.0]                   # 翻倍，封顶 max_backoff
+
+
+def test_timeout_returns_without_waiting_for_the_stuck_call():
+    api = _Api(delay=3.0)
+    f = fetcher.AsyncFetcher(timeout=0.1, retries=0, api=api)
+    t0 = time.perf_counter()
+    [err] = fetcher.fetch_many(_requests("sh000001"), f)
+    assert isinstance(err, TimeoutError)
+    assert time.perf_counter() - t0 < 2.0                  # 不等卡住的线程跑完
+
+
+def test_sync_entry_points_share_one_fetcher():
+    assert fetcher.get_fetcher() is fetcher.get_fetcher()
+    api = _Api()
+    got = fetcher.run_many([(("k", 1), api.stock_zh_index_daily, ("a",)), (("k", 2), api.stock_zh_index_daily, ("b",))])
+    assert got == ["bars:a", "bars:b"]
@@ -0,0 +1,70 @@
+"""
+analysis 基础函数：find_recent_lows 向量化实现与原循环实现的等价性、analyze_trend 打分
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import analyze_trend, find_recent_lows
+
+
+def _loop_reference(df, lookback_days=150, min_days_between_lows=10, window=5):
+    """向量化之前的逐点循环实现，作为对照"""
+    df = df.sort_index().tail(lookback_days)
+    df_reset = df.reset_index()
+    dates = pd.to_datetime(df_reset["date"]) if "date" in df_reset.columns else pd.to_datetime(df_reset.index)
+    prices = df_reset["close"].values
+    lows = []
+    for i in range(window, len(prices) - window):
+        left_min = min(prices[i-window:i])
+        right_min = min(prices[i+1:i+window+1])
+        if prices[i] <= left_min and prices[i] <= right_min:
+            if lows:
+                days_diff = (dates.iloc[i] - dates.iloc[lows[-1]]).days
+                if days_diff >= min_days_between_lows:
+                    lows.append(i)
+            else:
+                lows.append(i)
+    return lows
+
+
+def _random_bars(rng, n, date_col=True):
+    # 四舍五入到分，制造大量平价，覆盖 <= 的边界
+    close = np.round(10 + np.cumsum(rng.normal(0, 0.2, n)), 2)
+    gaps = rng.choice([1, 1, 1, 1, 3, 5], size=n)        # 周末、长假造成的日期空档
+    dates = pd.Timestamp("2015-01-05") + pd.to_timedelta(np.cumsum(gaps), unit="D")
+    df = pd.DataFrame({"close": close})
+    if date_col:
+        df.insert(0, "date", dates)
+    else:
+        df.index = pd.DatetimeIndex(dates, name="date")
+    return df
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("window,min_days,lookback", [(5, 10, 150), (3, 7, 400), (8, 20, 2000), (5, 0, 150), (2, 1, 60)])
+def test_matches_loop_reference(seed, window, min_days, lookback):
+    rng = np.random.default_rng(seed)
+    df = _random_bars(rng, int(rng.integers(5, 2500)), date_col=bool(seed % 2))
+    lows, df_reset, dates = find_recent_lows(df, lookback, min_days, window=window)
+    assert lows == _loop_reference(df, lookback, min_days, window)
+    assert len(df_reset) == min(len(df), lookback)
+
+
+def test_flat_series_and_short_input():
+    df = pd.DataFrame({"date": pd.bdate_range("2024-01-01", periods=40), "close": 5.0})
+    assert find_recent_lows(df)[0] == _loop_reference(df)
+    assert find_recent_lows(df.head(8))[0] == []
+
+
+def test_analyze_trend_counts_moving_averages():
+    # 回归：三个 numpy 布尔相加曾是逻辑或，得分到不了 2，“短期上升趋势”永远不会出现
+    def _frame(close, ma5, ma10, ma20, n=20):
+        return pd.DataFrame({"close": np.full(n, close), "ma5": np.full(n, ma5),
+                             "ma10": np.full(n, ma10), "ma20": np.full(n, ma20)})
+
+    assert analyze_trend(_frame(10.0, 9.0, 9.5, 11.0)) == "短期上升趋势"      # 站上两条
+    assert analyze_trend(_frame(10.0, 9.0, 9.5, 9.8)) == "短期上升趋势"
+    assert analyze_trend(_frame(10.0, 9.0, 10.5, 11.0)) == "震荡趋势"
+    assert analyze_trend(_frame(10.0, 10.2, 10.5, 11.0)) == "下跌趋势"
+    assert analyze_trend(_frame(10.0, 9.0, 9.5, 9.8, n=19)) == "数据不足"
@@ -0,0 +1,101 @@
+"""
+指数服务：进程内共享缓存、增量补拉、并发会话只联网一次、汇总指标
+"""
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import index_data
+from bar_cache import BarCache
+from synthetic import make_bars
+
+CODES = {"sh000001": "上证指数", "sz399001": "深证成指", "sh000300": "沪深300"}
+
+
+class _Source:
+    """按起止日期切片的假数据源，记录每次调用"""
+
+    def __init__(self, n=500, delay=0.0):
+        self.full = {c: make_bars(600, seed=k) for k, c in enumerate(CODES)}
+        self.n = n
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, symbol, start_date, end_date, adjust):
+        with self._lock:
+            self.calls.append((symbol, start_date))
+        time.sleep(self.delay)
+        df = self.full[symbol].head(self.n)
+        return df[df["date"] >= pd.Timestamp(start_date)]
+
+
+@pytest.fixture
+def source():
+    return _Source()
+
+
+@pytest.fixture
+def service(tmp_path, source):
+    return index_data.IndexService(CODES, BarCache(str(tmp_path / "index_bars"), source=source))
+
+
+def _expire(cache, code):
+    key = cache._key(code, None)
+    meta = cache._load_meta(key)
+    cache._save_meta(key, {**meta, "checked_at": 0})
+
+
+def test_refresh_is_incremental(service, source):
+    first = service.frames()
+    assert all(len(df) == 500 for df in first.values())
+    assert {s for _, s in source.calls} == {"19900101"}
+
+    source.calls.clear()
+    assert len(service.frames(n=100)["sh000001"]) == 100
+    assert source.calls == []                                 # 收盘后已查过，不再联网
+
+    source.n = 505
+    for code in CODES:
+        _expire(service.cache, code)
+    got = service.frames()
+    last = first["sh000001"]["date"].iloc[-1].strftime("%Y%m%d")
+    assert sorted(source.calls) == sorted((c, last) for c in CODES)   # 只从本地最后一天补拉
+    pd.testing.assert_frame_equal(got["sz399001"].reset_index(drop=True),
+                                  source.full["sz399001"].head(505), check_dtype=False)
+
+
+def test_concurrent_sessions_fetch_once(service, source):
+    source.delay = 0.05
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(lambda _: service.frames(n=100), range(32)))
+    assert Counter(s for s, _ in source.calls) == {c: 1 for c in CODES}
+    assert all(len(r["sh000300"]) == 100 for r in results)
+
+
+def test_summary_matches_manual(service, source):
+    df = source.full["sh000001"].head(500)
+    close = df["close"].to_numpy()
+    row = service.summary().set_index("代码").loc["sh000001"]
+    assert row["名称"] == "上证指数" and row["日期"] == f"{df['date'].iloc[-1]:%Y-%m-%d}"
+    assert row["日涨跌"] == pytest.approx(close[-1] / close[-2] - 1)
+    assert row["近20日"] == pytest.approx(close[-1] / close[-21] - 1)
+    prev_year = df[df["date"].dt.year < df["date"].iloc[-1].year]
+    assert row["年初至今"] == pytest.approx(close[-1] / prev_year["close"].iloc[-1] - 1)
+    assert row["距60日高点"] == pytest.approx(close[-1] / df["high"].tail(60).max() - 1)
+    assert row["20日年化波动"] == pytest.approx(np.diff(np.log(close[-21:])).std(ddof=1) * np.sqrt(252))
+
+    short = index_data.summarize({"sz399001": df.head(3)})
+    assert np.isnan(short["近5日"].iloc[0]) and np.isnan(short["20日年化波动"].iloc[0])
+
+
+def test_indices_config(tmp_path):
+    path = str(tmp_path / "indices.json")
+    assert list(index_data.load_indices(path)) == list(index_data.DEFAULT_INDICES)
+    index_data.save_indices(["sz399006", "sh000300"], path)
+    assert index_data.load_indices(path) == {"sz399006": "创业板指", "sh000300": "沪深300"}
@@ -0,0 +1,35 @@
+"""
+融合内核（numba / NumPy 两条路径）与 ta 批量结果一致
+"""
+import numpy as np
+import pytest
+
+import indicator_fast
+from analysis import compute_enhanced_indicators
+from indicator_stream import INDICATOR_COLUMNS
+from synthetic import make_bars
+
+
+@pytest.mark.parametrize("use_numba", [True, False])
+@pytest.mark.parametrize("n", [20, 150, 3000])
+def test_fast_backend_matches_ta(monkeypatch, use_numba, n):
+    if use_numba and indicator_fast.njit is None:
+        pytest.skip("numba 未安装")
+    if not use_numba:
+        monkeypatch.setattr(indicator_fast, "njit", None)
+    df = make_bars(n, seed=n)
+    expected = compute_enhanced_indicators(df.copy())
+    got = compute_enhanced_indicators(df, backend="fast")
+    assert list(got.columns) == list(expected.columns)
+    for col in INDICATOR_COLUMNS:
+        np.testing.assert_allclose(got[col], expected[col], rtol=1e-9, atol=1e-8, equal_nan=True, err_msg=col)
+    assert "macd" not in df.columns
+
+
+@pytest.mark.parametrize("cow", [True, False])
+def test_result_shares_input_buffers_only_under_copy_on_write(monkeypatch, cow):
+    monkeypatch.setattr(indicator_fast, "_copy_on_write", lambda: cow)
+    df = make_bars(100, seed=2)
+    out = indicator_fast.compute_indicators_fast(df)
+    assert np.shares_memory(out["close"].to_numpy(), df["close"].to_numpy()) == cow
+    assert not np.shares_memory(out["macd"].to_numpy(), df["close"].to_numpy())
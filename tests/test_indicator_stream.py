@@ -0,0 +1,46 @@
+"""
+增量指标引擎与 compute_enhanced_indicators 批量结果一致
+"""
+import numpy as np
+
+from analysis import compute_enhanced_indicators
+from indicator_stream import INDICATOR_COLUMNS, IndicatorEngine, IndicatorState
+from synthetic import make_bars
+
+
+def test_stream_matches_batch():
+    df = make_bars(1500)
+    batch = compute_enhanced_indicators(df.copy())
+    stream = IndicatorState().run(df)
+    for col in INDICATOR_COLUMNS:
+        np.testing.assert_allclose(stream[col], batch[col], rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=col)
+
+
+def test_engine_only_feeds_new_bars(tmp_path):
+    df = make_bars(600, seed=3)
+    engine = IndicatorEngine(str(tmp_path / "state.pkl"))
+    engine.update_frame("sz000001", df.iloc[:500])
+    engine.save()
+
+    engine = IndicatorEngine.load(str(tmp_path / "state.pkl"))
+    new = engine.update_frame("sz000001", df)
+    assert len(new) == 100
+    assert engine.update_frame("sz000001", df).empty
+
+    batch = compute_enhanced_indicators(df.copy()).iloc[500:]
+    for col in INDICATOR_COLUMNS:
+        np.testing.assert_allclose(new[col], batch[col], rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=col)
+
+
+def test_preview_matches_update_without_mutating():
+    import copy
+    df = make_bars(80, seed=7)
+    for n in (1, 8, 9, 20, 26, 40, 79):
+        state = IndicatorState()
+        state.run(df.iloc[:n])
+        bar = df.iloc[n].to_dict()
+        before = state.bars
+        got = state.preview(bar)
+        assert state.bars == before
+        np.testing.assert_equal(state.preview(bar), got)
+        np.testing.assert_equal(got, copy.deepcopy(state).update(bar))      # 逐位一致，NaN 位置也一致
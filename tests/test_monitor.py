@@ -0,0 +1,155 @@
+"""
+盘中监控：增量预览、边沿告警、回放、固定周期
+"""
+import numpy as np
+import pandas as pd
+
+import monitor
+from backtest import DEFAULT_PARAMS, score_pairs
+from divergence import pivot_positions
+from indicator_fast import compute_indicators_fast
+from synthetic import make_bars
+
+SYMBOLS = ["sz000001", "sz000002", "sz000003"]
+
+
+def _histories(n=400):
+    return {s: make_bars(n, seed=k) for k, s in enumerate(SYMBOLS)}
+
+
+def _ticks(day, prices: dict, minutes=range(5)):
+    rows = []
+    for m in minutes:
+        for sym, path in prices.items():
+            p = path[m]
+            rows.append({"time": day + pd.Timedelta(hours=9, minutes=31 + m), "symbol": sym, "name": sym.upper(),
+                         "price": p, "open": path[0], "high": max(path[:m + 1]), "low": min(path[:m + 1]),
+                         "volume": 1e5 * (m + 1)})
+    return pd.DataFrame(rows)
+
+
+def test_cross_alert_is_edge_triggered_with_cooldown(tmp_path):
+    hists = _histories()
+    day = hists[SYMBOLS[0]]["date"].iloc[-1] + pd.offsets.BDay(1)
+    ma20 = {s: h["close"].tail(20).mean() for s, h in hists.items()}
+    # 先压到均线下 10%，再拉到上方 10%，回落，再拉上去
+    path = {s: [m * f for f in (0.9, 1.1, 0.9, 1.1, 1.1)] for s, m in ma20.items()}
+    tick_file = str(tmp_path / "ticks.csv")
+    rec = monitor.TickRecorder(tick_file)
+    for _, g in _ticks(day, path).groupby("time"):
+        rec.write(g)
+
+    sink = monitor.FileSink(str(tmp_path / "alerts.jsonl"))
+    rule = [{"name": "上穿MA20", "type": "above", "column": "price", "ref": "ma20"}]
+    m = monitor.Monitor(SYMBOLS, rule, [sink], history=hists.get, state_path=None)
+    stats = m.run(monitor.TickReplay(tick_file), interval=0)
+    assert stats["cycles"] == 5
+    got = monitor.read_alerts(sink.path)
+    assert sorted(got["symbol"]) == SYMBOLS                   # 第二次上穿在冷却期内，不重复告警
+    assert set(got["rule"]) == {"上穿MA20"} and got["message"].str.contains("ma20").all()
+
+    m = monitor.Monitor(SYMBOLS, rule, history=hists.get, cooldown=0, state_path=None)
+    alerts = m.run(monitor.TickReplay(tick_file), interval=0)
+    assert alerts["alerts"] == 2 * len(SYMBOLS)
+
+
+def test_snapshot_matches_full_recompute_and_divergence_score():
+    hists = {f"sz{k:06d}": make_bars(400, seed=k) for k in range(40)}
+    day = hists["sz000000"]["date"].iloc[-1] + pd.offsets.BDay(1)
+    rng = np.random.default_rng(3)
+    price = {s: h["close"].iloc[-1] * (1 + rng.normal(-0.05, 0.05)) for s, h in hists.items()}
+    quotes = pd.DataFrame({"time": day + pd.Timedelta(hours=10), "symbol": list(price), "price": list(price.values()),
+                           "open": list(price.values()), "high": list(price.values()), "low": list(price.values()),
+                           "volume": 5e6})
+    m = monitor.Monitor(list(hists), rules=[], history=hists.get, state_path=None)
+    m.step(quotes)
+    snap = m.snapshot
+    levels = 0
+    for sym, h in hists.items():
+        today = pd.DataFrame([{"date": day, "open": price[sym], "high": price[sym], "low": price[sym],
+                               "close": price[sym], "volume": 5e6}])
+        full = compute_indicators_fast(pd.concat([h.tail(monitor.WARMUP_BARS), today], ignore_index=True))
+        np.testing.assert_allclose(snap.loc[sym, ["ma20", "rsi", "macd"]].to_numpy(dtype=float),
+                                   full[["ma20", "rsi", "macd"]].iloc[-1].to_numpy(dtype=float), rtol=1e-7)
+        # 今天 vs 昨收为止最近一个低点，按回测同一套规则打分
+        hist = full.iloc[:-1].tail(DEFAULT_PARAMS["lookback"]).reset_index(drop=True)
+        day_ns = hist["date"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        piv = pivot_positions(hist["close"].to_numpy(), day_ns, "bottom")
+        both = pd.concat([hist, full.iloc[-1:]], ignore_index=True)
+        want = score_pairs(np.array([piv[-1]]), np.array([len(both) - 1]), *(both[c].to_numpy(dtype=float)
+                           for c in ("close", "macd", "macd_dif", "rsi", "volume")))
+        assert snap.loc[sym, "div_level"] == want["level"].iloc[0]
+        levels += int(want["level"].iloc[0] > 0)
+    assert levels > 0
+
+
+def test_state_persists_and_feeds_only_new_bars(tmp_path):
+    path = str(tmp_path / "state.pkl")
+    full = _histories(401)
+    first = {s: h.iloc[:-1] for s, h in full.items()}
+    day1 = full[SYMBOLS[0]]["date"].iloc[-1]
+    monitor.Monitor(SYMBOLS, history=first.get, state_path=path).warm(day1)
+
+    m = monitor.Monitor(SYMBOLS, history=full.get, state_path=path)
+    fed = {s: m.engine.state(s).bars for s in SYMBOLS}
+    m.warm(day1 + pd.offsets.BDay(1))
+    assert all(m.engine.state(s).bars == fed[s] + 1 for s in SYMBOLS)
+
+    # 除权后前复权历史整体变化：昨收对不上，整段重喂
+    adjusted = {s: h.assign(close=h["close"] * 0.9) for s, h in full.items()}
+    m = monitor.Monitor(SYMBOLS, history=adjusted.get, state_path=path)
+    m.warm(day1 + pd.offsets.BDay(1))
+    assert m.engine.state(SYMBOLS[0]).prev_close == adjusted[SYMBOLS[0]]["close"].iloc[-1]
+
+
+def test_run_holds_fixed_cycle():
+    class Clock:
+        t = 0.0
+
+    clock = Clock()
+    slept = []
+
+    class Source:
+        def poll(self):
+            clock.t += 0.3 if len(slept) != 2 else 2.5           # 第 3 拍超时
+            return pd.DataFrame(columns=monitor.QUOTE_COLUMNS)
+
+    def sleep(s):
+        slept.append(s)
+        clock.t += s
+
+    m = monitor.Monitor([], history=lambda s: None, state_path=None)
+    stats = m.run(Source(), interval=1.0, cycles=5, clock=lambda: clock.t, sleep=sleep)
+    assert stats["cycles"] == 5 and stats["overruns"] == 1
+    np.testing.assert_allclose(slept, [0.7, 0.7, 0.5, 0.7, 0.7], atol=1e-9)
+
+
+def test_empty_cycle_and_poll_errors_keep_state():
+    hists = _histories()
+    day = hists[SYMBOLS[0]]["date"].iloc[-1] + pd.offsets.BDay(1)
+    ticks = [g for _, g in _ticks(day, {s: [h["close"].iloc[-1]] * 3 for s, h in hists.items()},
+                                  range(3)).groupby("time")]
+    other = ticks[1].assign(symbol="sh600000")                  # 这一拍全是不监控的股票，过滤后为空
+
+    class Source:
+        def __init__(self):
+            self.items = [ticks[0], other, ConnectionError("断线"), ticks[2]]
+
+        def poll(self):
+            if not self.items:
+                return None
+            item = self.items.pop(0)
+            if isinstance(item, Exception):
+                raise item
+            return item
+
+    warmed, refreshed = [], []
+    m = monitor.Monitor(SYMBOLS, history=hists.get, state_path=None, refresh=refreshed.append)
+    real_warm = m.warm
+    m.warm = lambda d: warmed.append(pd.Timestamp(d).normalize()) or real_warm(d)
+    stats = m.run(Source(), interval=0)
+    assert warmed == [day] and refreshed == [SYMBOLS]           # 空周期不会拿墙上时钟换日，冷却和边沿状态不清空
+    assert stats["cycles"] == 3 and stats["errors"] == 1        # 取数失败不退出循环
+
+    m.step(ticks[0].assign(time=day + pd.offsets.BDay(1) + pd.Timedelta(hours=9, minutes=31)))
+    assert len(refreshed) == 2 and m.trade_date == day + pd.offsets.BDay(1)      # 常驻到第二天先补齐日线
@@ -0,0 +1,55 @@
+"""
+列式面板与逐只计算一致（含停牌缺口、上市时间不同）
+"""
+import numpy as np
+import pandas as pd
+
+from analysis import analyze_trend, compute_enhanced_indicators, comprehensive_divergence_analysis
+from indicator_stream import INDICATOR_COLUMNS
+from panel import Panel
+from synthetic import make_bars
+
+
+def _frames():
+    frames = {f"s{i:02d}": make_bars(600, seed=i) for i in range(12)}
+    frames["s01"] = frames["s01"].iloc[250:].reset_index(drop=True)            # 晚上市
+    frames["s02"] = frames["s02"].drop(index=range(300, 320)).reset_index(drop=True)   # 停牌 20 天
+    frames["s03"] = frames["s03"].iloc[:-5].reset_index(drop=True)             # 最近停牌
+    frames["s04"] = frames["s04"].iloc[:15].reset_index(drop=True)             # 数据不足
+    return frames
+
+
+def test_panel_matches_per_symbol():
+    frames = _frames()
+    panel = Panel.from_frames(frames).compute_indicators()
+    div, trend = panel.divergence(), panel.trend()
+    for sym, df in frames.items():
+        ref = compute_enhanced_indicators(df.copy())
+        got = panel.frame(sym)
+        assert len(got) == len(ref)
+        for col in INDICATOR_COLUMNS:
+            np.testing.assert_allclose(got[col], ref[col], rtol=1e-9, atol=1e-8, equal_nan=True, err_msg=col)
+        assert trend[sym] == analyze_trend(ref)
+        expected, _ = comprehensive_divergence_analysis(ref)
+        if expected is None:
+            assert pd.isna(div.loc[sym, "level"])
+        else:
+            assert div.loc[sym, "level"] == expected["level"]
+            assert div.loc[sym, "date1"] == expected["date1"] and div.loc[sym, "date2"] == expected["date2"]
+            assert abs(div.loc[sym, "confidence"] - expected["confidence"]) < 1e-12
+
+
+def test_select_and_mmap_roundtrip(tmp_path):
+    panel = Panel.from_frames(_frames()).compute_indicators()
+    snap = panel.snapshot()
+    expected = snap.index[(snap["close"] > snap["ma20"]) & (snap["rsi"] < 60)].tolist()
+    assert panel.select("close > ma20 and rsi < 60") == expected
+    assert "s03" not in panel.select("close > 0")                              # 当天停牌
+
+    panel.save(str(tmp_path))
+    opened = Panel.open(str(tmp_path))
+    assert isinstance(opened["close"], np.memmap)
+    assert opened.symbols == panel.symbols and (opened.dates == panel.dates).all()
+    assert opened.select("close > ma20 and rsi < 60") == expected
+    date = panel.dates[400]
+    pd.testing.assert_frame_equal(opened.divergence(date), panel.divergence(date))
@@ -0,0 +1,159 @@
+"""
+持仓与收益：成交流水、整列估值、增量补算、持仓成本
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import portfolio
+from synthetic import make_bars
+
+SYMBOLS = ["sz000001", "sz000002", "sh600000"]
+
+
+def _histories(n=300):
+    hists = {s: make_bars(n, seed=k) for k, s in enumerate(SYMBOLS)}
+    hists["sz000002"] = hists["sz000002"].drop(index=range(100, 110))          # 停牌十天
+    return hists
+
+
+def _trades(hists, n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = hists[SYMBOLS[0]]["date"]
+    rows = [{"date": dates.iloc[0], "side": portfolio.DEPOSIT, "qty": 1e5, "price": 1.0}]
+    held = dict.fromkeys(SYMBOLS, 0)
+    for d in sorted(rng.choice(len(dates) - 1, n, replace=False)):
+        s = SYMBOLS[rng.integers(len(SYMBOLS))]
+        price = float(dates.index[d] % 7 + 9)
+        if held[s] and rng.random() < 0.4:
+            q = held[s] // 2 or held[s]
+            rows.append({"date": dates.iloc[d], "symbol": s, "side": portfolio.SELL, "qty": q, "price": price, "fee": 5})
+            held[s] -= q
+        else:
+            q = int(rng.integers(1, 10)) * 100
+            rows.append({"date": dates.iloc[d], "symbol": s, "side": portfolio.BUY, "qty": q, "price": price, "fee": 5})
+            held[s] += q
+    rows.append({"date": dates.iloc[150], "symbol": "sz000001", "side": portfolio.DIVIDEND, "qty": 1, "price": 300.0})
+    df = pd.DataFrame(rows).fillna({"symbol": "", "fee": 0.0})
+    df.insert(0, "id", range(len(df)))
+    return df
+
+
+def _reference(trades, hists):
+    """逐日逐只的朴素估值，作为对照"""
+    dates = sorted(set(pd.concat([h["date"] for h in hists.values()])) | set(trades["date"]))
+    dates = [d for d in dates if d >= trades["date"].min()]
+    mv, pnl, prev = [], [], 0.0
+    for d in dates:
+        t = trades[trades["date"] <= d]
+        today = trades[trades["date"] == d]
+        value = 0.0
+        for s in SYMBOLS:
+            ts = t[t["symbol"] == s]
+            pos = ts.loc[ts["side"] == "buy", "qty"].sum() - ts.loc[ts["side"] == "sell", "qty"].sum()
+            if pos:
+                h = hists[s][hists[s]["date"] <= d]
+                last_trade = ts[ts["side"].isin(["buy", "sell"])].iloc[-1]
+                px = h["close"].iloc[-1] if len(h) and h["date"].iloc[-1] >= last_trade["date"] else last_trade["price"]
+                value += pos * px
+        amt = today["qty"] * today["price"]
+        flow = (-(amt + today["fee"])[today["side"] == "buy"].sum() + (amt - today["fee"])[today["side"] == "sell"].sum()
+                + (amt - today["fee"])[today["side"] == "dividend"].sum())
+        mv.append(value)
+        pnl.append(value - prev + flow)
+        prev = value
+    return pd.DataFrame({"date": dates, "market_value": mv, "pnl": pnl})
+
+
+def test_mark_to_market_matches_reference():
+    hists = _histories(180)
+    trades = _trades(hists, n=40)
+    engine = portfolio.PortfolioEngine(trades, history=hists.get)
+    daily = engine.run()
+    want = _reference(trades, hists)
+    assert list(daily["date"]) == list(want["date"])
+    np.testing.assert_allclose(daily["market_value"], want["market_value"], rtol=1e-12)
+    np.testing.assert_allclose(daily["pnl"], want["pnl"], rtol=1e-9, atol=1e-9)
+
+    # 现金 = 入金 - 买入 + 卖出 + 分红；净值按日复合
+    amt = trades["qty"] * trades["price"]
+    cash = 1e5 - (amt + trades["fee"])[trades["side"] == "buy"].sum() \
+        + (amt - trades["fee"])[trades["side"].isin(["sell", "dividend"])].sum()
+    assert daily["cash"].iloc[-1] == pytest.approx(cash)
+    assert daily["nav"].iloc[-1] == pytest.approx(np.prod(1 + daily["return"]))
+    assert daily["exposure"].between(0, 1).all()
+
+    week = engine.weekly()
+    assert week["pnl"].sum() == pytest.approx(daily["pnl"].sum())
+    assert engine.summary()["total_pnl"] == pytest.approx(daily["pnl"].sum())
+
+
+def test_incremental_advance_matches_full_run():
+    hists = _histories()
+    trades = _trades(hists)
+    cut = hists[SYMBOLS[0]]["date"].iloc[250]
+    partial = {s: h[h["date"] <= cut] for s, h in hists.items()}
+    partial["sh600000"] = partial["sh600000"].iloc[:-2]                     # 这只晚到两天
+    live = dict(partial)
+    engine = portfolio.PortfolioEngine(trades, history=live.get)
+    engine.run()
+    live.update(hists)
+    got = engine.advance()
+    assert engine._state["date"] is not None
+    want = portfolio.PortfolioEngine(trades, history=hists.get).run()
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), want, check_exact=False, rtol=1e-12)
+
+    # 检查点之后追加的成交走增量，之前的改动整段重算
+    extra = pd.DataFrame([{"id": 999, "date": hists[SYMBOLS[0]]["date"].iloc[-1], "symbol": "sz000001",
+                           "side": "buy", "qty": 100.0, "price": 10.0, "fee": 0.0}])
+    ck = engine._state["date"]
+    engine.set_trades(pd.concat([trades, extra], ignore_index=True))
+    assert engine._state["date"] == ck
+    got = engine.advance()
+    want = portfolio.PortfolioEngine(pd.concat([trades, extra]), history=hists.get).run()
+    np.testing.assert_allclose(got["market_value"], want["market_value"], rtol=1e-12)
+    engine.set_trades(trades.iloc[1:])
+    assert engine._state["date"] is None
+
+
+def test_holdings_average_cost():
+    dates = pd.bdate_range("2024-01-01", periods=5)
+    hists = {"sz000001": pd.DataFrame({"date": dates, "close": [10.0, 11, 12, 13, 14]})}
+    trades = pd.DataFrame([
+        {"date": dates[0], "symbol": "sz000001", "side": "buy", "qty": 100.0, "price": 10.0, "fee": 0.0},
+        {"date": dates[1], "symbol": "sz000001", "side": "buy", "qty": 100.0, "price": 12.0, "fee": 0.0},
+        {"date": dates[3], "symbol": "sz000001", "side": "sell", "qty": 50.0, "price": 13.0, "fee": 1.0},
+    ])
+    engine = portfolio.PortfolioEngine(trades, history=hists.get)
+    engine.run()
+    h = engine.holdings().set_index("symbol").loc["sz000001"]
+    assert h["qty"] == 150 and h["avg_cost"] == pytest.approx(11.0)
+    assert h["realized"] == pytest.approx(50 * 2 - 1)
+    assert h["unrealized"] == pytest.approx(150 * 3) and h["day_pnl"] == pytest.approx(150)
+    assert h["weight"] == 1
+    # 没有入金记录：资金视为随买随投，仓位 100%
+    assert engine.summary()["exposure"] == 1
+
+
+def test_store_roundtrip_and_engine_reload(tmp_path):
+    store = portfolio.PortfolioStore(str(tmp_path / "portfolio.db"))
+    assert store.version() == 0
+    store.add("2024-01-02", "000001", "buy", 100, 10.0, fee=5)
+    n = store.add_many([{"date": "2024-01-03", "symbol": "600000", "side": "buy", "qty": 200, "price": 8.0},
+                        {"date": "2024-01-01", "side": "deposit", "qty": 50000, "price": 1}])
+    assert n == 2 and store.version() == 2
+    t = store.trades()
+    assert list(t["symbol"]) == ["", "sz000001", "sh600000"]
+    with pytest.raises(ValueError):
+        store.add_many([{"date": "2024-01-04", "symbol": "000001", "side": "sell", "qty": 0, "price": 1},
+                        {"date": "2024-01-04", "symbol": "000001", "side": "buy", "qty": 1, "price": 1}])
+    assert len(store.trades()) == 3                          # 整批校验失败，一条都不写
+
+    dates = pd.bdate_range("2024-01-01", periods=5)
+    hists = {s: pd.DataFrame({"date": dates, "close": np.arange(5.0) + 10}) for s in ("sz000001", "sh600000")}
+    portfolio._engines.clear()
+    engine = portfolio.get_engine(store=store, history=hists.get)
+    assert engine.daily["market_value"].iloc[-1] == pytest.approx(100 * 14 + 200 * 14)
+    assert store.remove(int(t["id"].iloc[-1]))
+    assert portfolio.get_engine(store=store).daily["market_value"].iloc[-1] == pytest.approx(100 * 14)
+    portfolio._engines.clear()
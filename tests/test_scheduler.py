@@ -0,0 +1,81 @@
+"""
+盘后任务：信号表落盘 / 读取、新鲜度判定
+"""
+from datetime import datetime
+
+import pandas as pd
+
+import scheduler
+
+
+def test_run_job_writes_table_and_meta(tmp_path, monkeypatch):
+    import screener
+    rows = pd.DataFrame({
+        "symbol": ["sz000001", "sz000002"], "level": ["强烈背离", None],
+        "last_date": pd.to_datetime(["2024-05-08", "2024-05-09"]), "error": [None, None],
+    })
+    monkeypatch.setattr(screener, "screen", lambda *a, **kw: rows.copy())
+    path, meta_path = str(tmp_path / "signals.bin"), str(tmp_path / "meta.json")
+    scheduler.run_job(["sz000001", "sz000002"], path=path, meta_path=meta_path)
+
+    df, meta = scheduler.load_signals(path, meta_path)
+    assert list(df["symbol"]) == ["sz000001", "sz000002"]
+    assert df["computed_at"].notna().all()
+    assert (meta["symbols"], meta["hits"], meta["errors"], meta["last_bar"]) == (2, 1, 0, "2024-05-09")
+
+
+def test_missing_table():
+    df, meta = scheduler.load_signals("/nonexistent/signals", "/nonexistent/meta.json")
+    assert df.empty and meta == {}
+    assert scheduler.is_stale(meta)
+    assert "尚未生成" in scheduler.freshness(meta)
+
+
+def test_staleness_follows_market_close():
+    meta = {"finished_at": "2024-05-10T15:50:00", "symbols": 3, "last_bar": "2024-05-10"}   # 周五盘后
+    assert not scheduler.is_stale(meta, datetime(2024, 5, 11, 10))            # 周六
+    assert not scheduler.is_stale(meta, datetime(2024, 5, 13, 14))            # 周一盘中
+    assert scheduler.is_stale(meta, datetime(2024, 5, 13, 16))                # 周一收盘后
+    assert "已过期" in scheduler.freshness(meta, datetime(2024, 5, 13, 16))
+    assert "18 小时前" in scheduler.freshness(meta, datetime(2024, 5, 11, 10))
+
+
+def test_weekend_start_catches_up_but_schedule_skips_weekends(monkeypatch):
+    import schedule
+
+    import index_data
+    import portfolio
+
+    class _Clock(datetime):
+        current = datetime(2024, 5, 11, 10)                     # 周六，周五的盘后任务失败了
+
+        @classmethod
+        def now(cls, tz=None):
+            return cls.current
+
+    class _Stop(Exception):
+        pass
+
+    runs = []
+    monkeypatch.setattr(scheduler, "datetime", _Clock)
+    monkeypatch.setattr(scheduler, "load_signals", lambda: (pd.DataFrame(), {"finished_at": "2024-05-09T15:50:00"}))
+    monkeypatch.setattr(scheduler, "run_job", lambda **kw: runs.append(_Clock.current))
+    monkeypatch.setattr(index_data, "get_service", lambda: type("S", (), {"refresh_all": lambda self: None})())
+    monkeypatch.setattr(portfolio, "refresh_bars", lambda: None)
+    monkeypatch.setattr(scheduler.time, "sleep", lambda s: (_ for _ in ()).throw(_Stop()))
+    schedule.clear()
+    try:
+        try:
+            scheduler.serve()
+        except _Stop:
+            pass
+        assert runs == [datetime(2024, 5, 11, 10)]               # 启动即补跑
+
+        [job] = schedule.jobs
+        job.job_func()                                           # 周六的定时触发
+        assert len(runs) == 1
+        _Clock.current = datetime(2024, 5, 13, 15, 45)           # 周一
+        job.job_func()
+        assert runs[-1] == datetime(2024, 5, 13, 15, 45)
+    finally:
+        schedule.clear()
@@ -0,0 +1,87 @@
+"""
+批量扫描：排序、单只出错不影响整批、进程池路径与在途上限、子进程均分限速
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pytest
+
+import screener
+
+CODES = [f"sz{k:06d}" for k in range(24)]
+
+
+def test_rank_results_orders_by_level_then_confidence():
+    rows = [
+        {"symbol": "a"},
+        {"symbol": "b", "level": "普通背离", "confidence": 0.9},
+        {"symbol": "c", "level": "强烈背离", "confidence": 0.6},
+        {"symbol": "d", "error": "无数据"},
+        {"symbol": "e", "level": "小背离", "confidence": 0.7},
+        {"symbol": "f", "level": "强烈背离", "confidence": 0.8},
+        {"symbol": "g", "level": "小背离", "confidence": 0.75},
+    ]
+    df = screener.rank_results(rows)
+    assert list(df["symbol"]) == ["f", "c", "g", "e", "b", "a", "d"]
+    assert list(df.columns) == screener.RESULT_COLUMNS
+
+
+def test_per_symbol_errors_are_captured(fake_screen_env, monkeypatch):
+    real_get = fake_screen_env.get
+
+    def _get(symbol, n=150, adjust="qfq", refresh=True):
+        if symbol == "sz000005":
+            raise ConnectionError("断线")
+        if symbol == "sz000006":
+            return pd.DataFrame()
+        return real_get(symbol, n, adjust, refresh)
+
+    monkeypatch.setattr(fake_screen_env, "get", _get)
+    df = screener.screen(CODES[:8], workers=1, refresh=False).set_index("symbol")
+    assert df.loc["sz000005", "error"] == "ConnectionError: 断线"
+    assert df.loc["sz000006", "error"] == "无数据"
+    assert df.drop(index=["sz000005", "sz000006"])["error"].isna().all()
+    assert df.drop(index=["sz000005", "sz000006"])["close"].notna().all()
+
+
+def test_process_pool_matches_serial_and_bounds_inflight(fake_screen_env, monkeypatch):
+    peak = []
+
+    class _Pool(ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.live = []
+
+        def submit(self, *args, **kwargs):
+            fut = super().submit(*args, **kwargs)
+            self.live.append(fut)
+            peak.append(sum(not f.done() for f in self.live))
+            return fut
+
+    monkeypatch.setattr(screener, "ProcessPoolExecutor", _Pool)
+    done = []
+    serial = screener.screen(CODES, workers=1, refresh=False, record=False)
+    pooled = screener.screen(CODES, workers=2, chunksize=3, max_inflight=2, refresh=True, record=False,
+                             progress=lambda d, t: done.append((d, t)))
+    key = ["symbol"]
+    pd.testing.assert_frame_equal(pooled.sort_values(key).reset_index(drop=True),
+                                  serial.sort_values(key).reset_index(drop=True))
+    assert len(peak) == len(CODES) // 3 and max(peak) <= 2
+    assert done[-1] == (len(CODES), len(CODES))
+    # 排序只看级别和置信度：两种路径得到同样的级别序列
+    assert list(pooled["level"].fillna("")) == list(serial["level"].fillna(""))
+
+
+def test_workers_split_the_rate_limit(fake_screen_env, monkeypatch):
+    import fetcher
+
+    monkeypatch.setattr(screener, "_worker_fetcher", None)
+    seen = []
+    monkeypatch.setattr(fake_screen_env, "refresh_many",
+                        lambda symbols, adjust="qfq", fetcher=None: seen.append(fetcher) or {})
+    screener._analyze_chunk(CODES[:2], 150, refresh=True, workers=4)
+    screener._analyze_chunk(CODES[2:4], 150, refresh=True, workers=4)
+    assert seen[0] is seen[1]                                    # 同一进程内共用一个令牌桶
+    assert seen[0].rate == pytest.approx(fetcher.DEFAULT_RATE / 4)
+    screener._analyze_chunk(CODES[:2], 150, refresh=True, workers=1)
+    assert seen[-1] is None                                      # 单进程走共享取数器
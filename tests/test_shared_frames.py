@@ -0,0 +1,124 @@
+"""
+共享内存发布 / 注册表 / 零拷贝读取
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import shared_frames
+from analysis import compute_enhanced_indicators
+from synthetic import make_bars
+
+
+def _frame(seed):
+    return compute_enhanced_indicators(make_bars(300, seed), backend="fast").tail(150)
+
+
+def _publish_chunk(seeds):
+    return shared_frames.publish({f"sz{s:06d}": _frame(s) for s in seeds})
+
+
+@pytest.fixture
+def registry(tmp_path):
+    reg = shared_frames.Registry(str(tmp_path / "registry.json"))
+    yield reg
+    reg.clear()
+
+
+def test_worker_frames_read_zero_copy(registry):
+    with ProcessPoolExecutor(2) as pool:
+        handles = {}
+        for h in pool.map(_publish_chunk, [range(0, 5), range(5, 10)]):
+            handles.update(h)
+    assert len({h["segment"] for h in handles.values()}) == 2    # 子进程退出后段仍在
+    registry.update(handles)
+
+    reader = shared_frames.SharedFrames(registry.path)
+    got = reader.frame("sz000007")
+    pd.testing.assert_frame_equal(got, _frame(7).reset_index(drop=True), check_dtype=False)
+    close = reader.columns("sz000007")["close"]
+    assert not close.flags.writeable                              # 直接是共享内存上的视图
+    assert np.shares_memory(close, reader.frame("sz000007")["close"].to_numpy())
+    assert reader.frame("sz000007", last_date=got["date"].iloc[-1]) is not None
+    assert reader.frame("sz000007", last_date="2001-01-01") is None
+    assert reader.frame("sz999999") is None
+
+
+def test_segment_freed_only_when_all_symbols_replaced(registry):
+    first = _publish_chunk(range(4))
+    registry.update(first)
+    reader = shared_frames.SharedFrames(registry.path)
+    old = reader.frame("sz000001")
+    old_close = old["close"].to_numpy().copy()
+
+    assert registry.update(_publish_chunk(range(2))) == []        # 还有 sz000002/3 引用旧段
+    freed = registry.update(_publish_chunk(range(2, 4)))
+    assert freed == [first["sz000000"]["segment"]]
+    with pytest.raises(FileNotFoundError):
+        shared_frames._open(freed[0])
+    np.testing.assert_array_equal(old["close"], old_close)        # 已 attach 的读者不受 unlink 影响
+    assert reader.frame("sz000001") is not None                   # 注册表变了，自动换到新段
+
+
+def test_symbols_leaving_the_universe_release_segments(registry):
+    first, second = _publish_chunk(range(3)), _publish_chunk(range(3, 6))
+    registry.update({**first, **second})
+    # sz000003~5 移出股票池：它们独占的段释放；sz000002 仍在池里，第一段保留
+    freed = registry.update(_publish_chunk(range(2)), universe=[f"sz{k:06d}" for k in range(3)])
+    assert freed == [second["sz000003"]["segment"]]
+    assert sorted(registry.load()) == ["sz000000", "sz000001", "sz000002"]
+    with pytest.raises(FileNotFoundError):
+        shared_frames._open(freed[0])
+    assert registry.update({}, universe=["sz000000", "sz000001"]) == [first["sz000002"]["segment"]]
+
+
+def test_screen_publishes_frames(fake_screen_env, monkeypatch):
+    import screener
+
+    result = screener.screen([f"sz{k:06d}" for k in range(20)], workers=1, refresh=False, chunksize=8, share=True)
+    assert "shm" not in result.columns and len(result) == 20
+    reg = shared_frames.Registry()
+    try:
+        entries = reg.load()
+        assert len(entries) == 20 and len({h["segment"] for h in entries.values()}) == 3
+        got = shared_frames.SharedFrames().frame("sz000011")
+        want = compute_enhanced_indicators(make_bars(300, 11).tail(150), backend="fast")
+        np.testing.assert_allclose(got["rsi"], want["rsi"], equal_nan=True)
+
+        # 指定代码的扫描不动池外的登记；按股票池扫描时池外的一并注销
+        screener.screen(["sz000030"], workers=1, refresh=False, share=True)
+        assert len(reg.load()) == 21
+        monkeypatch.setattr(screener, "load_universe", lambda universe: [f"sz{k:06d}" for k in range(5)])
+        screener.screen(workers=1, refresh=False, share=True)
+        assert sorted(reg.load()) == [f"sz{k:06d}" for k in range(5)]
+        assert len({h["segment"] for h in reg.load().values()}) == 1
+    finally:
+        reg.clear()
+
+
+def _segments():
+    return {n for n in os.listdir("/dev/shm") if n.startswith(shared_frames.PREFIX)}
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="需要 /dev/shm 查看共享内存段")
+@pytest.mark.parametrize("workers", [1, 2])
+def test_screen_failure_unlinks_published_segments(fake_screen_env, workers):
+    import screener
+
+    before = _segments()
+    seen = []
+
+    def _progress(done, total):
+        seen.append(_segments() - before)
+        if len(seen) == 2:
+            raise KeyboardInterrupt                               # 扫到一半 Ctrl-C
+
+    with pytest.raises(KeyboardInterrupt):
+        screener.screen([f"sz{k:06d}" for k in range(40)], workers=workers, refresh=False, chunksize=4,
+                        share=True, progress=_progress)
+    assert seen[0]                                                # 中断前确实已经发布过段
+    assert _segments() == before
+    assert shared_frames.Registry().load() == {}
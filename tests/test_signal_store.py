@@ -0,0 +1,80 @@
+"""
+信号历史库：去重、按级别 / 股票查询走索引、扫描流水线写入
+"""
+import pandas as pd
+
+import signal_store
+from analysis import compute_enhanced_indicators, comprehensive_divergence_analysis
+from synthetic import make_bars
+
+
+def _div(level="强烈背离", date1="2024-03-01", date2="2024-04-01", confidence=0.9):
+    return {"level": level, "confidence": confidence, "date1": pd.Timestamp(date1), "date2": pd.Timestamp(date2),
+            "price1": 10.0, "price2": 9.5, "macd1": -0.2, "macd2": -0.1, "dif1": -0.3, "dif2": -0.2,
+            "rsi1": 25.0, "rsi2": 30.0, "volume1": 1e6, "volume2": 8e5, "signals": ["MACD柱状线背离", "DIF线背离"]}
+
+
+def test_repeat_detections_are_deduplicated(tmp_path):
+    store = signal_store.SignalStore(str(tmp_path / "signals.db"))
+    assert store.record("sz000001", _div(), "2024-04-08", "app")
+    assert not store.record("sz000001", _div(), "2024-04-08", "screener")        # 同一根K线重复扫描
+    assert not store.record("sz000001", _div(confidence=0.5), "2024-04-09")      # 第二天仍是这对低点
+    assert store.record("sz000001", _div(date2="2024-04-10"), "2024-04-17")
+    assert store.record("sz000002", _div(), "2024-04-08")
+    assert store.count() == 3
+
+    row = store.history("sz000001").set_index("date2").loc["2024-04-01"]
+    assert (row["detected"], row["last_detected"], row["hits"]) == ("2024-04-08", "2024-04-09", 2)
+    assert row["confidence"] == 0.9 and row["source"] == "app" and row["signals"] == "MACD柱状线背离,DIF线背离"
+
+
+def test_queries_filter_and_use_indexes(tmp_path):
+    store = signal_store.SignalStore(str(tmp_path / "signals.db"))
+    days = pd.bdate_range("2024-01-01", periods=120)
+    rows = []
+    for k, d in enumerate(days):
+        for s in range(20):
+            level = signal_store.LEVELS[(k + s) % 3]
+            rows.append(signal_store.to_row(f"sz{s:06d}", _div(level, d - pd.Timedelta(days=30), d), d, "screener"))
+    assert store.record_many(rows) == len(rows)
+    assert store.record_many(rows) == 0
+
+    today = days[-1]
+    recent = store.recent("强烈背离", days=30, today=today)
+    assert len(recent) and (recent["level"] == "强烈背离").all()
+    assert recent["detected"].min() >= f"{today - pd.Timedelta(days=30):%Y-%m-%d}"
+    assert recent["detected"].is_monotonic_decreasing
+    want = sum(1 for r in rows if r[2] == "强烈背离" and r[1] >= f"{today - pd.Timedelta(days=30):%Y-%m-%d}")
+    assert len(recent) == want
+
+    hist = store.history("sz000003")
+    assert len(hist) == len(days) and set(hist["symbol"]) == {"sz000003"}
+    both = store.query(level=["强烈背离", "小背离"], symbol="sz000003", since=days[100], min_confidence=0.5)
+    assert set(both["level"]) <= {"强烈背离", "小背离"} and (both["detected"] >= f"{days[100]:%Y-%m-%d}").all()
+    assert sum(store.level_counts().values()) == len(rows)
+
+    conn = store._conn()
+    plan = lambda sql, *a: " ".join(str(r[-1]) for r in conn.execute("EXPLAIN QUERY PLAN " + sql, a))
+    assert "idx_signals_level_detected" in plan(
+        "SELECT * FROM signals WHERE level IN (?) AND detected >= ? ORDER BY detected DESC", "强烈背离", "2024-05-01")
+    assert "idx_signals_symbol_detected" in plan(
+        "SELECT * FROM signals WHERE symbol = ? ORDER BY detected DESC", "sz000003")
+
+
+def test_screen_records_detections(fake_screen_env):
+    import screener
+
+    codes = [f"sz{k:06d}" for k in range(30)]
+    result = screener.screen(codes, workers=1, refresh=False)
+    hits = result[result["level"].notna()]
+    assert len(hits) and "signal_row" not in result.columns
+
+    store = signal_store.get_store()
+    assert store.count() == len(hits)
+    screener.screen(codes, workers=1, refresh=False)
+    assert store.count() == len(hits)                           # 重跑不重复
+    sym = hits["symbol"].iloc[0]
+    got = store.history(sym).iloc[0]
+    div, _ = comprehensive_divergence_analysis(compute_enhanced_indicators(make_bars(300, int(sym[2:])).tail(150),
+                                                                           backend="fast"))
+    assert got["level"] == div["level"] and got["price2"] == div["price2"] and got["source"] == "screener"
@@ -0,0 +1,66 @@
+"""
+参数寻优：复用低点 / 低点对的统计与逐组回测一致，并行与串行一致
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import sweep
+from backtest import backtest_symbol
+from synthetic import make_bars
+
+HORIZONS = (5, 20)
+COMBOS = [
+    {"lookback": 150, "window": 5, "min_days": 10, "vol_ratio": 1.5, "price_drop": 0.03, "min_signals": 2},
+    {"lookback": 100, "window": 3, "min_days": 5, "vol_ratio": 1.0, "price_drop": 0.0, "min_signals": 3},
+    {"lookback": 100, "window": 3, "min_days": 5, "vol_ratio": 2.0, "price_drop": 0.05, "min_signals": 2},
+    {"lookback": 250, "window": 7, "min_days": 20, "vol_ratio": 1.5, "price_drop": 0.02, "min_signals": 2,
+     "w_macd": 0.1, "min_confidence": 0.5},
+]
+
+
+def _frames(k=6, n=900):
+    return {f"sz{s:06d}": make_bars(n, seed=s) for s in range(k)}
+
+
+def test_stats_match_per_combo_backtest():
+    frames = _frames()
+    stats = sum(sweep.evaluate(sweep.prepare(df, HORIZONS), COMBOS, HORIZONS) for df in frames.values())
+    got = sweep.report(stats, COMBOS, HORIZONS, min_count=0).sort_values("lookback", kind="stable")
+    got = got.set_index(["lookback", "vol_ratio"])
+    for combo in COMBOS:
+        ev = pd.concat([backtest_symbol(df, s, HORIZONS, combo) for s, df in frames.items()], ignore_index=True)
+        if combo.get("min_confidence"):
+            ev = ev[ev["confidence"] >= combo["min_confidence"]]
+        assert len(ev)
+        row = got.loc[(combo["lookback"], combo["vol_ratio"])]
+        assert row["signals"] == len(ev) and row["strong"] == (ev["level"] == "强烈背离").sum()
+        for h in HORIZONS:
+            r = ev[f"ret_{h}d"].dropna()
+            assert row[f"mean_{h}d"] == pytest.approx(r.mean())
+            assert row[f"hit_{h}d"] == pytest.approx((r > 0).mean())
+            assert row[f"std_{h}d"] == pytest.approx(r.std())
+
+
+def test_parallel_matches_serial_and_ranking():
+    frames = _frames(8, 600)
+    combos = sweep.with_default(sweep.random_search(n=12, seed=1))
+    serial = sweep.sweep(frames=frames, combos=combos, horizons=HORIZONS, workers=1, min_count=40)
+    parallel = sweep.sweep(frames=frames, combos=combos, horizons=HORIZONS, workers=2, chunksize=3, min_count=40)
+    np.testing.assert_allclose(parallel.drop(columns="rank").select_dtypes("number"),
+                               serial.drop(columns="rank").select_dtypes("number"), equal_nan=True)
+    assert serial["is_default"].sum() == 1
+    enough = serial["signals"] >= 40
+    assert 0 < enough.sum() < len(serial)
+    assert list(serial["rank"]) == list(range(1, len(serial) + 1))
+    assert serial.loc[enough, "t_20d"].dropna().is_monotonic_decreasing
+    assert enough.iloc[:enough.sum()].all()                 # 样本不足的排在后面
+
+
+def test_random_search_samples_grid_without_repeats():
+    space = {"window": [3, 5], "min_days": [5, 10, 15], "vol_ratio": [1.0, 1.5]}
+    picks = sweep.random_search(space, n=8, seed=3)
+    full = sweep.grid(space)
+    assert len(picks) == 8 and all(p in full for p in picks)
+    assert len({tuple(p.values()) for p in picks}) == 8
+    assert len(sweep.random_search(space, n=100)) == len(full) == 12
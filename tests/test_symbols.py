@@ -0,0 +1,99 @@
+"""
+代码 ↔ 简称目录：TTL 过期重拉、断网退回本地旧文件、各种查询方式、整批解析
+"""
+import json
+
+import pytest
+
+import symbols
+from fetcher import AsyncFetcher
+
+ROWS = [("600519", "贵州茅台"), ("000001", "平安银行"), ("000002", "万科A"), ("600000", "浦发银行"),
+        ("601318", "中国平安"), ("830799", "艾融软件")]
+
+
+class _Source:
+    def __init__(self, rows=ROWS):
+        self.rows = rows
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("断网")
+        return list(self.rows)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(symbols.time, "time", lambda: now[0])
+    return now
+
+
+def test_lookups(tmp_path):
+    d = symbols.SymbolDirectory(str(tmp_path / "symbols.json"), source=_Source())
+    assert d.name("600519") == d.name("sh600519") == d.name(" SH600519 ") == "贵州茅台"
+    assert d.name("bj830799") == "艾融软件" and d.name("999999") is None and d.name("999999", "") == ""
+    assert d.code("平安银行") == "000001" and d.code("不存在") is None
+    assert d.search("浦") == [("600000", "浦发银行")]
+    assert d.search("中国") == [("601318", "中国平安")] and d.search("") == []
+    assert d.search("平安") == [("000001", "平安银行")]                  # 只按前缀，不做包含匹配
+    assert "sz000002" in d and "sz999999" not in d and len(d) == len(ROWS)
+
+
+def test_resolve_many_loads_once(tmp_path):
+    source = _Source()
+    d = symbols.SymbolDirectory(str(tmp_path / "symbols.json"), source=source)
+    got = d.resolve_many(["sh600519", "000002", "sz999999"], default="")
+    assert got == {"sh600519": "贵州茅台", "000002": "万科A", "sz999999": ""}
+    d.resolve_many(["600000"] * 100)
+    assert source.calls == 1
+
+
+def test_ttl_expiry_refetches(tmp_path, clock):
+    path = tmp_path / "symbols.json"
+    source = _Source()
+    d = symbols.SymbolDirectory(str(path), source=source, ttl=3600)
+    assert d.name("600519") == "贵州茅台" and source.calls == 1
+    assert json.loads(path.read_text("utf-8"))["rows"][0] == ["600519", "贵州茅台"]
+
+    # 新进程在 TTL 内直接读盘
+    again = symbols.SymbolDirectory(str(path), source=source, ttl=3600)
+    clock[0] += 1800
+    assert again.name("000001") == "平安银行" and source.calls == 1
+
+    source.rows = ROWS + [("688981", "中芯国际")]
+    clock[0] += 3600
+    assert d.name("688981") == "中芯国际" and source.calls == 2
+
+
+def test_offline_falls_back_to_stale_file(tmp_path, clock):
+    path = tmp_path / "symbols.json"
+    path.write_text(json.dumps({"fetched_at": clock[0] - 10 * 86400, "rows": [["600519", "贵州茅台"]]}), "utf-8")
+    source = _Source()
+    source.fail = True
+    d = symbols.SymbolDirectory(str(path), source=source, fetcher=AsyncFetcher(retries=0))
+    assert d.name("600519") == "贵州茅台" and source.calls == 1          # 过期的本地数据照样可用
+    d.name("000001")
+    assert source.calls == 1                                             # RETRY_AFTER 之内不再打网络
+
+    source.fail = False
+    clock[0] += symbols.RETRY_AFTER + 1
+    assert d.name("000001") == "平安银行" and source.calls == 2
+
+    empty = symbols.SymbolDirectory(str(tmp_path / "none.json"), source=_Source(), fetcher=AsyncFetcher(retries=0))
+    empty.source.fail = True
+    assert empty.name("600519") is None and len(empty) == 0              # 没有本地文件：空目录，不抛错
+
+
+def test_download_goes_through_fetcher(tmp_path):
+    source = _Source()
+    f = AsyncFetcher(retries=1, backoff=0.01)
+    source.fail = True
+    d = symbols.SymbolDirectory(str(tmp_path / "symbols.json"), source=source, fetcher=f)
+    assert d.name("600519") is None and source.calls == 2 and f.stats["retries"] == 1     # 失败先重试再退回
+    source.fail = False
+    d.refresh()
+    assert d.name("600519") == "贵州茅台" and f.stats["calls"] == 3
@@ -0,0 +1,45 @@
+"""
+日线聚合与多周期记忆
+"""
+import numpy as np
+import pandas as pd
+
+import timeframes
+from synthetic import make_bars
+
+
+def test_resample_matches_pandas():
+    df = make_bars(700)
+    for tf, rule in (("W", "W-SUN"), ("M", "ME")):
+        got = timeframes.resample_bars(df, tf)
+        ref = (df.set_index("date").resample(rule)
+               .agg({"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"})
+               .dropna())
+        np.testing.assert_allclose(got[["open", "high", "low", "close", "volume"]].to_numpy(), ref.to_numpy())
+        # 日期取周期内最后一个交易日，而不是周期末
+        last_days = df.groupby(df["date"].dt.to_period("W" if tf == "W" else "M"))["date"].max()
+        assert list(got["date"]) == list(last_days)
+
+
+def test_memo_recomputes_only_on_new_bar():
+    frames, results = timeframes.get_memo()
+    df = make_bars(600, seed=3)
+    first = timeframes.analyze_timeframes("t000001", daily=df)
+    misses = frames.misses
+    again = timeframes.analyze_timeframes("t000001", daily=df.copy())
+    assert frames.misses == misses and again["W"] is first["W"]
+
+    more = pd.concat([df, make_bars(601, seed=3).tail(1).assign(date=df["date"].iloc[-1] + pd.offsets.BDay())],
+                     ignore_index=True)
+    updated = timeframes.analyze_timeframes("t000001", daily=more)
+    assert frames.misses == misses + 2                            # 只记周线、月线
+    assert ("t000001", "qfq", "D") not in frames._data and ("t000001", "qfq", "W") in frames._data
+    assert updated["D"]["bars"] == 601
+    assert set(updated) == {"D", "W", "M"} and all("error" not in r for r in updated.values())
+
+    # 同一天的末根K线被修正（行数、日期都不变）也要重算
+    revised = more.copy()
+    revised.loc[revised.index[-1], ["close", "high"]] = revised[["close", "high"]].iloc[-1] * 1.05
+    timeframes.analyze_timeframes("t000001", daily=revised)
+    assert frames.misses == misses + 4
+    assert frames.get(("t000001", "qfq", "W"), revised, None)["close"].iloc[-1] == revised["close"].iloc[-1]
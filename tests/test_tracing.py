@@ -0,0 +1,98 @@
+"""
+追踪层：关闭时不产生记录，开启时记录嵌套 span、缓存命中与 JSONL
+"""
+import json
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    tracing.disable()
+    tracing.reset()
+    yield
+    tracing.disable()
+    tracing.reset()
+
+
+def test_disabled_is_noop():
+    calls = []
+    fn = tracing.traced()(lambda x: calls.append(x) or x)
+    with tracing.collect() as records:
+        assert fn(3) == 3
+        with tracing.span("x") as sp:
+            tracing.cache_event("c", hit=True)
+    assert sp is tracing._NOOP
+    assert calls == [3] and records == [] and tracing.report() == []
+
+
+def test_spans_nesting_and_cache_events(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracing.enable(str(path))
+
+    @tracing.traced("inner")
+    def inner():
+        tracing.cache_event("memo", hit=False)
+
+    with tracing.collect() as records:
+        with tracing.span("outer", symbol="sz000001"):
+            inner()
+            inner()
+    spans = [r for r in records if r["type"] == "span"]
+    assert [(r["name"], r["depth"], r["parent"]) for r in spans] == [
+        ("inner", 1, "outer"), ("inner", 1, "outer"), ("outer", 0, None)]
+    assert spans[-1]["symbol"] == "sz000001"
+
+    stats = {r["name"]: r for r in tracing.report()}
+    assert stats["inner"]["calls"] == 2 and stats["outer"]["calls"] == 1
+    assert stats["memo"]["misses"] == 2
+    tracing.disable()
+    lines = [json.loads(x) for x in path.read_text(encoding="utf-8").splitlines()]
+    assert len(lines) == len(records)
+
+
+def test_cached_span_counts_hits_and_misses():
+    tracing.enable()
+    memo = {}
+
+    def load(key):
+        if key not in memo:
+            tracing.mark_miss()
+            memo[key] = key * 2
+        return memo[key]
+
+    for key in (1, 1, 2, 1):
+        with tracing.cached_span("stage"):
+            load(key)
+    stats = {r["name"]: r for r in tracing.report()}["stage"]
+    assert (stats["calls"], stats["hits"], stats["misses"]) == (4, 2, 2)
+
+
+def test_span_records_exceptions():
+    tracing.enable()
+    with tracing.collect() as records, pytest.raises(ValueError):
+        with tracing.span("boom"):
+            raise ValueError
+    assert records[0]["error"] == "ValueError"
+
+
+def test_attributes_cannot_overwrite_reserved_fields(tmp_path):
+    import time
+
+    import bar_cache
+    from synthetic import make_bars
+
+    tracing.enable()
+    t0 = time.time()
+    with tracing.collect() as records:
+        with tracing.span("s", start="20240101", ms=-1, depth=9, type="x", symbol="sz000001"):
+            pass
+        cache = bar_cache.BarCache(str(tmp_path), source=lambda *a, **k: make_bars(10))
+        cache.refresh("sz000001")
+    span = records[0]
+    assert span["type"] == "span" and span["depth"] == 0 and span["ms"] >= 0
+    assert isinstance(span["start"], float) and span["start"] >= t0 and span["symbol"] == "sz000001"
+    fetch = next(r for r in records if r.get("name") == "bar_cache.fetch")
+    assert fetch["from_date"] == "19900101" and isinstance(fetch["start"], float)
@@ -0,0 +1,103 @@
+import json
+import threading
+
+from watchlist import DEFAULT_LIST, FAVORITES_LIST, WatchlistStore
+
+
+def _store(tmp_path, legacy=None):
+    return WatchlistStore(str(tmp_path / "watchlist.db"), legacy_files=legacy or {})
+
+
+def test_migrates_legacy_json_once(tmp_path):
+    self_sel = tmp_path / "self_selection.json"
+    favs = tmp_path / "favorites.json"
+    self_sel.write_text(json.dumps([{"code": "sz000001", "name": "平安银行"}, {"code": "600519"}]), "utf-8")
+    favs.write_text(json.dumps(["000002", "600519"]), "utf-8")
+    legacy = {DEFAULT_LIST: str(self_sel), FAVORITES_LIST: str(favs)}
+
+    store = _store(tmp_path, legacy)
+    assert store.items() == [{"code": "sz000001", "name": "平安银行"}, {"code": "sh600519", "name": ""}]
+    assert store.codes(FAVORITES_LIST) == ["sz000002", "sh600519"]
+
+    store.remove("sz000001")
+    assert _store(tmp_path, legacy).codes() == ["sh600519"]      # 已迁移过，不会把删掉的再导回来
+
+
+def test_batch_ops_and_lookup(tmp_path):
+    store = _store(tmp_path)
+    assert store.add_many([("sz000001", "a"), ("sz000002", "b"), ("sz000001", "dup")]) == 2
+    assert not store.add("sz000002")
+    assert store.add("sz000002", list_name="other")
+    assert store.lists_of("sz000002") == ["default", "other"]
+    assert store.remove_many(["sz000001", "sz999999"]) == 1
+    store.replace([("sh600000", "x")])
+    assert store.items() == [{"code": "sh600000", "name": "x"}]
+    store.set_name("sh600000", "浦发银行")
+    assert store.items()[0]["name"] == "浦发银行"
+    assert store.add_new([("sh600000", ""), ("sz000001", "a"), ("sz000001", "dup")]) == ["sz000001"]
+
+
+def test_concurrent_writers_do_not_lose_updates(tmp_path):
+    store = _store(tmp_path)
+
+    def worker(i):
+        for j in range(30):
+            store.add(f"sz{i:03d}{j:03d}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(store.codes()) == 180
+
+
+def test_normalize_symbol_markets():
+    from analysis import normalize_symbol
+    cases = {
+        "600519": "sh600519", "688981": "sh688981", "689009": "sh689009", "900901": "sh900901",
+        "000001": "sz000001", "300750": "sz300750", "200002": "sz200002",
+        "830799": "bj830799", "430047": "bj430047", "920001": "bj920001",
+        " SH600519 ": "sh600519", "600519.SH": "sh600519", "000001.sz": "sz000001",
+        "bj830799": "bj830799", "北交所830799": "bj830799", "深交所 000001": "sz000001",
+        "510300": "510300", "贵州茅台": "贵州茅台",
+    }
+    assert {c: normalize_symbol(c) for c in cases} == cases
+
+
+def test_bulk_import_export_roundtrip(tmp_path, monkeypatch):
+    import storage
+    import symbols
+
+    rows = [(f"{p}{i:05d}", f"股票{p}{i:05d}") for p in "036" for i in range(400)] + [("830799", "北交所样本")]
+    calls = []
+
+    def source():
+        calls.append(1)
+        return rows
+
+    directory = symbols.SymbolDirectory(str(tmp_path / "symbols.json"), source=source)
+    store = _store(tmp_path)
+    monkeypatch.setattr(symbols, "get_directory", lambda: directory)
+    monkeypatch.setattr(storage, "get_store", lambda: store)
+    store.add("sz000001", "股票000001")
+
+    text = "\n".join(c for c, _ in rows[:1000]) + "\n600519.SH, bj830799；股票600001 000001 abc 123"
+    result = storage.import_stocks(text)
+    assert calls == [1]                                               # 名称只加载一次目录，不逐只联网
+    assert len(result["added"]) == 1001 and result["existing"] == ["sz000001"]
+    assert result["invalid"] == ["abc", "123"]
+    assert "bj830799" in result["added"] and "sh600519" in result["added"]
+    items = {i["code"]: i["name"] for i in store.items()}
+    assert items["sz000002"] == "股票000002" and items["bj830799"] == "北交所样本" and items["sh600519"] == ""
+
+    for fmt in storage.EXPORT_FORMATS:
+        other = _store(tmp_path / fmt)
+        monkeypatch.setattr(storage, "get_store", lambda: store)
+        text = storage.export_stocks(fmt=fmt)
+        monkeypatch.setattr(storage, "get_store", lambda: other)
+        assert len(storage.import_stocks(text)["added"]) == len(items)
+        assert other.items() == store.items()
+
+    csv_text = "股票代码\t股票名称\n1\t平安银行\n600000\t浦发银行\n"          # Excel 复制：制表符分隔、前导 0 被吃掉
+    assert storage.parse_codes(csv_text) == [("000001", "平安银行"), ("600000", "浦发银行")]
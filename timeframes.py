@@ -0,0 +1,236 @@
+"""
+多周期背离
+把缓存里的日线一次向量化聚合成周线 / 月线，在每个周期上跑同一套背离和趋势判断，
+汇总成每只股票的多周期共振矩阵；聚合结果按 (股票, 周期) 记忆，只有来了新K线才重算
+用法：python timeframes.py sz000001 sh600519 --offline
+"""
+import argparse
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from analysis import NS_PER_DAY
+
+# 每个周期的背离参数：lookback 按K线根数，min_days 按自然日
+TIMEFRAMES = {
+    "D": {"label": "日线", "lookback": 150, "min_days": 10, "window": 5},
+    "W": {"label": "周线", "lookback": 104, "min_days": 35, "window": 3},
+    "M": {"label": "月线", "lookback": 60, "min_days": 120, "window": 2},
+}
+SUM_COLUMNS = ("volume", "amount")                      # 其余非价格列取周期内最后一根
+LAST_BAR_COLUMNS = ("open", "high", "low", "close", "volume")   # 末根K线的这些值进记忆的版本戳
+FRAME_MEMO_SIZE = 256                   # 只存周线 / 月线（日线的 1/5、1/21），约一两百只股票的工作集
+RESULT_MEMO_SIZE = 16384                # 分析结果很小，可以覆盖全市场
+
+
+# ---------- 聚合 ----------
+def _period_keys(day_ns: np.ndarray, timeframe: str) -> np.ndarray:
+    days = day_ns // NS_PER_DAY
+    if timeframe == "W":
+        return (days + 3) // 7                          # 1970-01-01 是周四，+3 后按周一到周日分组
+    if timeframe == "M":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    raise ValueError(f"未知周期: {timeframe}")
+
+
+def resample_bars(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """
+    日线 → 周线 / 月线，一次 reduceat 完成，不走 groupby
+    date 取周期内最后一个交易日，未走完的当前周期也保留（随新K线更新）
+    """
+    if timeframe == "D" or df.empty:
+        return df
+    df = df.sort_values("date") if "date" in df.columns else df.sort_index().reset_index()
+    dates = df["date"].to_numpy(dtype="datetime64[ns]")
+    key = _period_keys(dates.view(np.int64), timeframe)
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    ends = np.r_[starts[1:], len(key)] - 1
+
+    out = {"date": dates[ends]}
+    for col in df.columns:
+        if col == "date":
+            continue
+        x = df[col].to_numpy()
+        if col == "open":
+            out[col] = x[starts]
+        elif col == "high":
+            out[col] = np.maximum.reduceat(x.astype(float), starts)
+        elif col == "low":
+            out[col] = np.minimum.reduceat(x.astype(float), starts)
+        elif col in SUM_COLUMNS:
+            out[col] = np.add.reduceat(x.astype(float), starts)
+        else:
+            out[col] = x[ends]
+    return pd.DataFrame(out)
+
+
+# ---------- 记忆 ----------
+class TimeframeMemo:
+    """
+    键 → 由日线派生的结果（周期K线或分析结果），LRU 淘汰
+    以日线的 (行数, 首根收盘, 末根日期, 末根 OHLCV) 作为版本戳：新K线、除权重算、
+    或同一天的末根K线被修正（盘中临时收盘后重拉）都会让戳变化，其余情况直接复用
+    """
+
+    def __init__(self, maxsize: int = FRAME_MEMO_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def stamp(daily: pd.DataFrame):
+        if daily.empty:
+            return (0, None, None, ())
+        return (len(daily), float(daily["close"].iat[0]), pd.Timestamp(daily["date"].iat[-1]),
+                tuple(float(daily[c].iat[-1]) for c in LAST_BAR_COLUMNS if c in daily.columns))
+
+    def get(self, key, daily: pd.DataFrame, build):
+        stamp = self.stamp(daily)
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is not None and hit[0] == stamp:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+        frame = build(daily)
+        with self._lock:
+            self.misses += 1
+            self._data[key] = (stamp, frame)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return frame
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_frames = TimeframeMemo(FRAME_MEMO_SIZE)
+_results = TimeframeMemo(RESULT_MEMO_SIZE)
+
+
+def get_memo():
+    """(周期K线记忆, 分析结果记忆)"""
+    return _frames, _results
+
+
+def _build(timeframe: str):
+    def build(daily):
+        from analysis import compute_enhanced_indicators
+        bars = resample_bars(daily, timeframe)
+        return compute_enhanced_indicators(bars, backend="fast") if not bars.empty else bars
+    return build
+
+
+def timeframe_frame(symbol: str, timeframe: str = "W", adjust: str = "qfq", daily: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    某只股票某个周期的K线（含指标），daily 不传则读本地日线缓存的全部历史
+    周线 / 月线返回的表是共享的记忆结果，不要原地修改；日线本身已有 BarCache，不再记一份
+    """
+    if daily is None:
+        from bar_cache import get_cache
+        daily = get_cache().read(symbol, adjust)
+    if timeframe == "D":
+        return _build(timeframe)(daily)
+    return _frames.get((symbol, adjust, timeframe), daily, _build(timeframe))
+
+
+# ---------- 分析 ----------
+def _analyze(df: pd.DataFrame, cfg: dict) -> dict:
+    from analysis import analyze_trend, comprehensive_divergence_analysis
+    res = {"label": cfg["label"], "bars": len(df)}
+    if df.empty:
+        res["error"] = "无数据"
+        return res
+    div, _ = comprehensive_divergence_analysis(df, cfg["lookback"], cfg["min_days"], cfg["window"])
+    res.update(
+        last_date=df["date"].iloc[-1],
+        trend=analyze_trend(df),
+        level=div["level"] if div else None,
+        confidence=float(div["confidence"]) if div else None,
+        divergence=div,
+    )
+    return res
+
+
+def analyze_timeframes(symbol: str, timeframes=tuple(TIMEFRAMES), adjust: str = "qfq",
+                       daily: pd.DataFrame = None) -> dict:
+    """
+    返回 {周期: {label, bars, last_date, trend, level, confidence, divergence}}，异常记在 error
+    分析结果和周期K线共用版本戳，一起记忆
+    """
+    if daily is None:
+        from bar_cache import get_cache
+        daily = get_cache().read(symbol, adjust)
+
+    out = {}
+    for tf in timeframes:
+        cfg = TIMEFRAMES[tf]
+        try:
+            out[tf] = _results.get((symbol, adjust, tf), daily,
+                                   lambda d: _analyze(timeframe_frame(symbol, tf, adjust, d), cfg))
+        except Exception as e:
+            out[tf] = {"label": cfg["label"], "error": f"{type(e).__name__}: {e}"}
+    return out
+
+
+def confirmation_matrix(symbols, timeframes=tuple(TIMEFRAMES), adjust: str = "qfq", refresh: bool = False) -> pd.DataFrame:
+    """
+    多周期共振矩阵：每只股票一行，每个周期一组 级别 / 置信度 / 趋势 列，
+    confirmed 为出现背离的周期数；按 confirmed、最大周期上的背离级别排序
+    """
+    from bar_cache import get_cache
+    from screener import LEVEL_RANK
+    symbols = list(dict.fromkeys(symbols))
+    cache = get_cache()
+    if refresh:
+        cache.refresh_many(symbols, adjust)
+
+    rows = []
+    for sym in symbols:
+        res = analyze_timeframes(sym, timeframes, adjust, cache.read(sym, adjust))
+        row = {"symbol": sym}
+        for tf in timeframes:
+            r = res[tf]
+            row[f"{tf}_level"] = r.get("level")
+            row[f"{tf}_confidence"] = r.get("confidence")
+            row[f"{tf}_trend"] = r.get("trend")
+        row["confirmed"] = sum(res[tf].get("level") is not None for tf in timeframes)
+        row["_rank"] = tuple(LEVEL_RANK.get(res[tf].get("level"), 0) for tf in reversed(timeframes))
+        rows.append(row)
+    if not rows:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(rows)
+    order = sorted(range(len(rows)), key=lambda i: (rows[i]["confirmed"], rows[i]["_rank"]), reverse=True)
+    return df.drop(columns="_rank").iloc[order].reset_index(drop=True)
+
+
+# ---------- 命令行 ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多周期背离共振")
+    parser.add_argument("symbols", nargs="*", help="股票代码；留空用自选股")
+    parser.add_argument("--timeframes", nargs="+", choices=list(TIMEFRAMES), default=list(TIMEFRAMES))
+    parser.add_argument("--offline", action="store_true", help="只用本地缓存，不联网")
+    parser.add_argument("--out", help="结果保存为 CSV")
+    args = parser.parse_args(argv)
+
+    from analysis import normalize_symbol
+    if args.symbols:
+        symbols = [normalize_symbol(s) for s in args.symbols]
+    else:
+        from storage import load_self
+        symbols = [item["code"] for item in load_self()]
+    result = confirmation_matrix(symbols, tuple(args.timeframes), refresh=not args.offline)
+    print(result.to_string(index=False) if not result.empty else "没有数据")
+    if args.out:
+        result.to_csv(args.out, index=False, encoding="utf-8-sig")
+    return result
+
+
+if __name__ == "__main__":
+    main()
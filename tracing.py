@@ -0,0 +1,236 @@
+"""
+轻量追踪
+span / traced 记录每段代码的耗时、调用次数，cache_event 记录缓存命中 / 未命中；
+关闭时 span 返回同一个空上下文、traced 只多一次布尔判断，开销可忽略
+开启：环境变量 MYSTOCK_TRACE=1（只在内存里汇总）或 MYSTOCK_TRACE=路径.jsonl（同时逐条落盘），
+也可以在代码里 enable() / disable()
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+RECENT_SPANS = 2000
+
+_enabled = False
+_sink = None
+_lock = threading.Lock()
+_stats = {}                      # name -> [调用次数, 总耗时, 最大耗时, 命中, 未命中]
+_recent = deque(maxlen=RECENT_SPANS)
+_local = threading.local()       # 每个线程的 span 栈，用来记父子关系
+_collector = ContextVar("trace_collector", default=None)
+
+
+# ---------- 开关 ----------
+def enable(jsonl_path: str = None):
+    """打开追踪；给出 jsonl_path 时每个 span / 缓存事件追加一行 JSON"""
+    global _enabled, _sink
+    with _lock:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+        if jsonl_path:
+            os.makedirs(os.path.dirname(jsonl_path) or ".", exist_ok=True)
+            _sink = open(jsonl_path, "a", encoding="utf-8")
+        _enabled = True
+
+
+def disable():
+    global _enabled, _sink
+    with _lock:
+        _enabled = False
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _recent.clear()
+
+
+# ---------- 记录 ----------
+def _stat(name):
+    st = _stats.get(name)
+    if st is None:
+        st = _stats[name] = [0, 0.0, 0.0, 0, 0]
+    return st
+
+
+def _emit(record: dict):
+    # 调用方已持有 _lock
+    _recent.append(record)
+    bucket = _collector.get()
+    if bucket is not None:
+        bucket.append(record)
+    if _sink is not None:
+        _sink.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        _sink.flush()
+
+
+class _Span:
+    __slots__ = ("name", "attrs", "start", "t0", "depth", "parent")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1] if stack else None
+        self.depth = len(stack)
+        stack.append(self.name)
+        self.start = time.time()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.t0
+        _local.stack.pop()
+        # 自定义属性放在前面，固定字段后写：同名属性（start / ms ...）不会冲掉计时信息
+        record = {**self.attrs} if self.attrs else {}
+        record.update(type="span", name=self.name, ms=round(elapsed * 1000, 3), start=self.start,
+                      depth=self.depth, parent=self.parent, thread=threading.current_thread().name)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        with _lock:
+            st = _stat(self.name)
+            st[0] += 1
+            st[1] += elapsed
+            st[2] = max(st[2], elapsed)
+            _emit(record)
+        return False
+
+
+class _CachedSpan(_Span):
+    """包住一次可能命中缓存的调用；被包的函数体里调用 mark_miss() 即记为未命中"""
+    __slots__ = ("outer",)
+
+    def __enter__(self):
+        self.outer = getattr(_local, "missed", False)
+        _local.missed = False
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        missed = _local.missed
+        _local.missed = self.outer
+        super().__exit__(exc_type, exc, tb)
+        cache_event(self.name, hit=not missed)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **attrs):
+    """with span("fetch", symbol=s): ...；关闭时返回共享的空上下文"""
+    if not _enabled:
+        return _NOOP
+    return _Span(name, attrs)
+
+
+def cached_span(name: str, **attrs):
+    """
+    with cached_span("stage.fetch"): fetch_stage(...)
+    配合 st.cache_data / lru_cache 等外部缓存：缓存函数体里调用 mark_miss()，函数体没执行就算命中
+    """
+    if not _enabled:
+        return _NOOP
+    return _CachedSpan(name, attrs)
+
+
+def mark_miss():
+    if _enabled:
+        _local.missed = True
+
+
+def traced(name: str = None):
+    """函数装饰器，span 名默认取 模块.函数名"""
+    def deco(fn):
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(label, None):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def cache_event(name: str, hit: bool):
+    """记一次缓存命中 / 未命中"""
+    if not _enabled:
+        return
+    with _lock:
+        _stat(name)[3 if hit else 4] += 1
+        _emit({"type": "cache", "name": name, "hit": bool(hit), "start": time.time()})
+
+
+# ---------- 读取 ----------
+def start_collecting() -> list:
+    """
+    从现在起，当前上下文里的记录也追加到返回的列表
+    Streamlit 每次 rerun 在同一个线程里从头执行脚本，在脚本开头调用一次即可拿到本次运行的全部记录
+    """
+    bucket = []
+    _collector.set(bucket)
+    return bucket
+
+
+@contextmanager
+def collect():
+    """with collect() as records: ... 收集这段代码里产生的全部记录，退出后不再追加"""
+    bucket = []
+    token = _collector.set(bucket)
+    try:
+        yield bucket
+    finally:
+        _collector.reset(token)
+
+
+def report() -> list:
+    """按总耗时降序的汇总：name, calls, total_ms, mean_ms, max_ms, hits, misses"""
+    with _lock:
+        items = [(k, list(v)) for k, v in _stats.items()]
+    rows = []
+    for name, (calls, total, peak, hits, misses) in items:
+        rows.append({
+            "name": name, "calls": calls, "total_ms": round(total * 1000, 2),
+            "mean_ms": round(total * 1000 / calls, 3) if calls else None,
+            "max_ms": round(peak * 1000, 2), "hits": hits, "misses": misses,
+        })
+    return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+
+def recent(n: int = 200) -> list:
+    with _lock:
+        return list(_recent)[-n:]
+
+
+_env = os.environ.get("MYSTOCK_TRACE", "")
+JSONL_PATH = _env if _env not in ("", "0", "1") else None
+if _env and _env != "0":
+    enable(JSONL_PATH)
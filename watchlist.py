@@ -0,0 +1,193 @@
+"""
+自选股存储引擎
+SQLite（WAL 模式）保存多个命名分组，(分组, 代码) 唯一索引，批量增删在一个事务里完成，
+多个 Streamlit 会话同时写不会互相覆盖；首次打开时自动迁移旧的 JSON 文件
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DB_FILE = os.path.join("data", "watchlist.db")
+DEFAULT_LIST = "default"             # app_back.py 的自选股，原 self_selection.json
+FAVORITES_LIST = "favorites"         # myStock 的自选股，原 data/favorites.json
+LEGACY_FILES = {
+    DEFAULT_LIST: "self_selection.json",
+    FAVORITES_LIST: os.path.join("data", "favorites.json"),
+}
+BUSY_TIMEOUT_MS = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watchlist (
+    id       INTEGER PRIMARY KEY,
+    list     TEXT NOT NULL,
+    code     TEXT NOT NULL,
+    name     TEXT NOT NULL DEFAULT '',
+    added_at REAL NOT NULL,
+    UNIQUE (list, code)
+);
+CREATE INDEX IF NOT EXISTS idx_watchlist_code ON watchlist (code);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _legacy_items(path: str):
+    """两种旧格式：[{"code","name"}, ...] 或 ["600519", ...]"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+    out = []
+    for item in data if isinstance(data, list) else []:
+        if isinstance(item, dict) and item.get("code"):
+            out.append((str(item["code"]), str(item.get("name", ""))))
+        elif isinstance(item, str) and item.strip():
+            out.append((item.strip(), ""))
+    return out
+
+
+class WatchlistStore:
+    """
+    每个线程一条连接；写操作用 BEGIN IMMEDIATE 拿写锁，其余会话在 busy_timeout 内排队
+    """
+
+    def __init__(self, path: str = DB_FILE, legacy_files: dict = None):
+        self.path = path
+        self.legacy_files = LEGACY_FILES if legacy_files is None else legacy_files
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+        self._migrate()
+
+    # ----- 连接 / 事务 -----
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _migrate(self):
+        """旧 JSON 按文件各迁移一次，迁移标记记在 meta 表；原文件保留不动"""
+        from analysis import normalize_symbol
+        for list_name, path in self.legacy_files.items():
+            key = f"migrated:{list_name}:{os.path.abspath(path)}"
+            with self._tx() as conn:
+                if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                    continue
+                items = [(normalize_symbol(c), n) for c, n in _legacy_items(path)]
+                self._insert(conn, list_name, items)
+                conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, str(len(items))))
+
+    @staticmethod
+    def _insert(conn, list_name, items) -> int:
+        now = time.time()
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO watchlist (list, code, name, added_at) VALUES (?, ?, ?, ?)",
+            [(list_name, code, name or "", now) for code, name in items],
+        )
+        return conn.total_changes - before
+
+    # ----- 查询 -----
+    def lists(self) -> list:
+        rows = self._conn().execute("SELECT DISTINCT list FROM watchlist ORDER BY list").fetchall()
+        return [r[0] for r in rows]
+
+    def items(self, list_name: str = DEFAULT_LIST) -> list:
+        """按加入顺序返回 [{"code", "name"}, ...]，与旧 load_self() 同形"""
+        rows = self._conn().execute(
+            "SELECT code, name FROM watchlist WHERE list = ? ORDER BY id", (list_name,)
+        ).fetchall()
+        return [{"code": code, "name": name} for code, name in rows]
+
+    def codes(self, list_name: str = DEFAULT_LIST) -> list:
+        rows = self._conn().execute("SELECT code FROM watchlist WHERE list = ? ORDER BY id", (list_name,))
+        return [r[0] for r in rows]
+
+    def contains(self, code: str, list_name: str = DEFAULT_LIST) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM watchlist WHERE list = ? AND code = ?", (list_name, code)
+        ).fetchone()
+        return row is not None
+
+    def lists_of(self, code: str) -> list:
+        """某只股票在哪些分组里"""
+        rows = self._conn().execute("SELECT list FROM watchlist WHERE code = ? ORDER BY list", (code,))
+        return [r[0] for r in rows]
+
+    # ----- 修改 -----
+    def add(self, code: str, name: str = "", list_name: str = DEFAULT_LIST) -> bool:
+        """新增一只，已存在返回 False"""
+        return self.add_many([(code, name)], list_name) == 1
+
+    def add_many(self, items, list_name: str = DEFAULT_LIST) -> int:
+        """items: [(code, name), ...]，一个事务写入，返回实际新增条数"""
+        with self._tx() as conn:
+            return self._insert(conn, list_name, items)
+
+    def add_new(self, items, list_name: str = DEFAULT_LIST) -> list:
+        """同 add_many，但返回实际新增的代码；是否已存在在同一个事务里判定，并发写入不会错报"""
+        now = time.time()
+        added = []
+        with self._tx() as conn:
+            for code, name in items:
+                cur = conn.execute("INSERT OR IGNORE INTO watchlist (list, code, name, added_at) VALUES (?, ?, ?, ?)",
+                                   (list_name, code, name or "", now))
+                if cur.rowcount == 1:
+                    added.append(code)
+        return added
+
+    def remove(self, code: str, list_name: str = DEFAULT_LIST) -> bool:
+        return self.remove_many([code], list_name) == 1
+
+    def remove_many(self, codes, list_name: str = DEFAULT_LIST) -> int:
+        with self._tx() as conn:
+            before = conn.total_changes
+            conn.executemany("DELETE FROM watchlist WHERE list = ? AND code = ?",
+                             [(list_name, c) for c in codes])
+            return conn.total_changes - before
+
+    def replace(self, items, list_name: str = DEFAULT_LIST):
+        """整组替换（兼容旧 save_self 的语义），同样是单个事务"""
+        with self._tx() as conn:
+            conn.execute("DELETE FROM watchlist WHERE list = ?", (list_name,))
+            self._insert(conn, list_name, items)
+
+    def set_name(self, code: str, name: str, list_name: str = DEFAULT_LIST):
+        with self._tx() as conn:
+            conn.execute("UPDATE watchlist SET name = ? WHERE list = ? AND code = ?", (name, list_name, code))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> WatchlistStore:
+    """进程内共享实例；Streamlit 各会话共用，连接按线程区分"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = WatchlistStore()
+    return _store